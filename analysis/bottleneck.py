@@ -2,6 +2,8 @@ import psycopg2
 import traceback
 import pprint
 import matplotlib.pyplot as plt
+from bottleneck_queries import bottleneck_matrix
+from result_cache import ResultCache
 
 try:
     # データベースに接続
@@ -17,30 +19,12 @@ try:
     cur = conn.cursor()
 
     parameter_id = 145
-    bottleneck_list = []
 
-    # 縦列→世代(昇順)・横行→各widthの割合を降順(100,90,80...0)
-    counts = [[0]*11 for _ in range(100)]
-
-    # 各世代のwidthの出現回数を取得
-    for generation in range(0, 100):
-        for bottleneck in range(0, 101, 10):
-            # SQLクエリを実行
-            cur.execute(f"""SELECT Count(ants.routebottleneck)
-                        FROM ants
-                        JOIN generations ON ants.generationid = generations.generationid
-                        JOIN simulations ON generations.simulationid = simulations.simulationid
-                        WHERE simulations.parameterid = {parameter_id} AND generations.generation_count = {generation} AND ants.routebottleneck = {bottleneck};""")
-
-            # 結果を取得
-            rows = cur.fetchall()
-
-            # routenodesidの値をリストとして取得
-            bottleneck_list.append([row[-1] for row in rows])
-
-    for generation, row in enumerate(bottleneck_list):
-        for width in row:
-            counts[generation][10 - width // 10] += 1
+    # 縦列→世代(昇順)・横行→各widthの回数を降順(100,90,80...0)
+    # シミュレーションが登録したBottleneckHistogramsテーブル(同じParameterIDの全シミュレーションの合計)を1回読む
+    # 結果はローカルにキャッシュし、シミュレーションが追加されていなければ問い合わせない
+    counts = ResultCache(cur).get("bottleneck_matrix", parameter_id, lambda: bottleneck_matrix(
+        cur, [parameter_id], "ants", source="histogram", generation_limit=100)[parameter_id], "ants", "histogram", 100).tolist()
 
     # 横行のwidthの出現回数の総和
     totals = [sum(width_count) for width_count in counts]
@@ -77,7 +61,6 @@ try:
     
     
     # # リストを出力
-    print(*bottleneck_list,sep="\n")
     # print(len(bottleneck_list))
     # print(rows)
     pprint.pprint(counts)
@@ -5,6 +5,8 @@ import psycopg2
 import traceback
 import pprint
 import matplotlib.pyplot as plt
+from bottleneck_queries import bottleneck_matrix
+from result_cache import ResultCache
 
 try:
     # データベースに接続
@@ -20,25 +22,10 @@ try:
 
     parameter_id = 482
     # 縦列→世代(昇順)、横行→widthを降順(100,90,80...0)、要素→その世代におけるそのwidthの回数
-    width_counts_matrix = [[0]*11 for _ in range(100)]
-
-    # 各世代のwidthの出現回数を取得
-    for generation in range(0, 100):
-        for bottleneck in range(0, 101, 10):
-            # SQLクエリを実行
-            cur.execute(f"""SELECT Count(interests.routebottleneck)
-                        FROM interests
-                        JOIN generations ON interests.generationid = generations.generationid
-                        JOIN simulations ON generations.simulationid = simulations.simulationid
-                        WHERE simulations.parameterid = {parameter_id} 
-                        AND generations.generation_count = {generation} 
-                        AND interests.routebottleneck = {bottleneck};""")
-
-            # 結果を取得
-            rows = cur.fetchall()
-
-            # 結果を二次元配列に格納
-            width_counts_matrix[generation][10 - bottleneck // 10] = rows[0][0]
+    # シミュレーションが登録したBottleneckHistogramsテーブル(同じParameterIDの全シミュレーションの合計)を1回読む
+    # 結果はローカルにキャッシュし、シミュレーションが追加されていなければ問い合わせない
+    width_counts_matrix = ResultCache(cur).get("bottleneck_matrix", parameter_id, lambda: bottleneck_matrix(
+        cur, [parameter_id], "interests", source="histogram", generation_limit=100)[parameter_id], "interests", "histogram", 100).tolist()
 
     pprint.pprint(width_counts_matrix)
 
@@ -0,0 +1,150 @@
+# ボトルネックの分布を集合演算で取得する分析用モジュール
+# (世代, ボトルネック)ごとに1回ずつCOUNTするのではなく、GROUP BY generation_count, routebottleneckの
+# 1回の問い合わせで全世代・全widthの回数を取得する
+# 集計結果はParameterIDごとのマテリアライズドビュー(ant_bottleneck_distribution, interest_bottleneck_distribution)
+# に保存しておき、シミュレーションを追加したらrefresh_viewsで更新する
+#
+# 使い方
+#   python bottleneck_queries.py create   # ビューを作成
+#   python bottleneck_queries.py refresh  # ビューを更新
+#
+#   cur = connect().cursor()
+#   matrices = bottleneck_matrix(cur, [145, 482], "ants")
+#   matrices[145]  # 縦列→世代(昇順)、横行→widthを降順(100,90,80...0)、要素→その世代におけるそのwidthの回数
+#   route_counts(cur, 145, "interests")  # 多く通った経路とその回数
+import sys
+import traceback
+import psycopg2
+
+# 分布を取得できるパケットのテーブル
+PACKET_TABLES = ["ants", "interests", "rands"]
+
+# 横行のwidth(降順)
+WIDTHS = list(range(100, -1, -10))
+
+
+def view_name(table: str) -> str:
+    return f"{table[:-1]}_bottleneck_distribution"
+
+
+# ParameterIDごと・世代ごと・ボトルネックごとの回数を集計するSELECT文
+# パケットのテーブルはParameterID列で分割されている(sql/migrations/0003_partition_by_parameter.sql)ので
+# simulationsとは結合せず、ParameterIDで絞り込めば対象のパーティションだけを読む
+def distribution_query(table: str) -> str:
+    return f"""SELECT {table}.parameterid, generations.generation_count, {table}.routebottleneck, COUNT(*) AS count
+            FROM {table}
+            JOIN generations ON {table}.generationid = generations.generationid
+            GROUP BY {table}.parameterid, generations.generation_count, {table}.routebottleneck"""
+
+
+def connect():
+    return psycopg2.connect(
+        dbname="simulation",
+        user="asaken_n40",
+        password="asaken_N40",
+        host="localhost",
+        port="5432"
+    )
+
+
+def create_views(cur, tables: list[str] = PACKET_TABLES) -> None:
+    # REFRESH ... CONCURRENTLYにはユニークインデックスが必要
+    for table in tables:
+        cur.execute(
+            f"CREATE MATERIALIZED VIEW IF NOT EXISTS {view_name(table)} AS {distribution_query(table)};")
+        cur.execute(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {view_name(table)}_key ON {view_name(table)} (parameterid, generation_count, routebottleneck);")
+
+
+def refresh_views(cur, tables: list[str] = PACKET_TABLES, concurrently: bool = True) -> None:
+    # concurrently=Trueなら更新中もビューを読める
+    for table in tables:
+        cur.execute(
+            f"REFRESH MATERIALIZED VIEW {'CONCURRENTLY ' if concurrently else ''}{view_name(table)};")
+
+
+# parameter_idsの各ParameterIDの(世代 × width)の回数の二次元配列を1回の問い合わせで返す
+# 戻り値は{ParameterID: 縦列→世代(昇順)、横行→widthを降順(100,90,80...0)、要素→回数}
+# sourceは集計元
+#   "view"      : マテリアライズドビュー(refresh_views時点の集計)
+#   "raw"       : ants/interestsテーブルを直接GROUP BY(ビューを作っていない場合)
+#   "histogram" : シミュレーションが登録したBottleneckHistogramsテーブル
+# generation_limitを省略した場合は結果の最大の世代数にそろえる
+# 移動できなかったパケット(ボトルネック2**8)は数えない
+def bottleneck_matrix(cur, parameter_ids: list[int], table: str = "ants", source: str = "view", generation_limit: int | None = None) -> dict[int, list[list[int]]]:
+    if table not in PACKET_TABLES:
+        raise ValueError(f"unknown packet table: {table}")
+    if source == "view":
+        query = f"""SELECT parameterid, generation_count, routebottleneck, count
+                FROM {view_name(table)}
+                WHERE parameterid = ANY(%s) AND routebottleneck <= 100;"""
+        args = (list(parameter_ids),)
+    elif source == "raw":
+        query = f"""SELECT {table}.parameterid, generations.generation_count, {table}.routebottleneck, COUNT(*)
+                FROM {table}
+                JOIN generations ON {table}.generationid = generations.generationid
+                WHERE {table}.parameterid = ANY(%s) AND {table}.routebottleneck <= 100
+                GROUP BY {table}.parameterid, generations.generation_count, {table}.routebottleneck;"""
+        args = (list(parameter_ids),)
+    elif source == "histogram":
+        query = """SELECT parameterid, generation_count, routebottleneck, count
+                FROM bottleneckhistograms
+                WHERE parameterid = ANY(%s) AND packettype = %s AND routebottleneck <= 100;"""
+        args = (list(parameter_ids), table.capitalize())
+    else:
+        raise ValueError(f"unknown source: {source}")
+
+    cur.execute(query, args)
+    rows = cur.fetchall()
+
+    if generation_limit is None:
+        generation_limit = max((row[1] for row in rows), default=-1) + 1
+    matrices = {parameter_id: [[0] * len(WIDTHS) for _ in range(generation_limit)]
+                for parameter_id in parameter_ids}
+    for parameter_id, generation, bottleneck, count in rows:
+        if generation < generation_limit:
+            matrices[parameter_id][generation][10 - bottleneck // 10] += count
+    return matrices
+
+
+# 回数の二次元配列を世代ごとの割合(%)にする(回数が0の世代は全て0)
+def proportions(matrix: list[list[int]]) -> list[list[float]]:
+    result = []
+    for row in matrix:
+        total = sum(row)
+        result.append([count * 100 / total if total else 0.0 for count in row])
+    return result
+
+
+# parameter_idのtableで多く通った経路の上位limit件の(RouteNodesID, RouteWidths, 回数)
+# パケットの行はRouteIDで経路を参照する(sql/migrations/0005_add_routes.sql)ので、整数のGROUP BYで数えてからRoutesと結合する
+def route_counts(cur, parameter_id: int, table: str = "ants", limit: int = 10) -> list[tuple[list[int], list[int], int]]:
+    if table not in PACKET_TABLES:
+        raise ValueError(f"unknown packet table: {table}")
+    cur.execute(f"""SELECT routes.routenodesid, routes.routewidths, counts.count
+                FROM (SELECT routeid, COUNT(*) AS count FROM {table}
+                      WHERE parameterid = %s GROUP BY routeid
+                      ORDER BY count DESC LIMIT %s) counts
+                JOIN routes ON counts.routeid = routes.routeid
+                ORDER BY counts.count DESC;""", (parameter_id, limit))
+    return cur.fetchall()
+
+
+if __name__ == "__main__":
+    try:
+        conn = connect()
+        cur = conn.cursor()
+        if sys.argv[1] == "create":
+            create_views(cur)
+        elif sys.argv[1] == "refresh":
+            refresh_views(cur)
+        conn.commit()
+
+    except Exception as e:
+        print(e)
+        conn.rollback()
+        print(traceback.format_exc())
+
+    finally:
+        cur.close()
+        conn.close()
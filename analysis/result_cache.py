@@ -0,0 +1,94 @@
+# 分析用のクエリ結果をParameterIDごとにローカルディスク(npz)に保存するキャッシュ
+# 保存時のそのParameterIDの結果のバージョン(終了したシミュレーション数など)を一緒に保存しておき、
+# 読み込み時に同じであれば保存した結果を返す(シミュレーションが終了・進行していれば再計算する)
+# 合計サイズがmax_bytesを超えたら最後に使ってから時間が経ったファイルから削除する(LRU)
+#
+# 使い方
+#   cache = ResultCache(cur)
+#   matrix = cache.get("bottleneck_matrix", 482, lambda: bottleneck_matrix(cur, [482], "interests")[482], "interests")
+import hashlib
+import os
+import tempfile
+from typing import Any, Callable
+import numpy as np
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(__file__), ".cache")
+
+
+class ResultCache:
+    def __init__(self, cur, directory: str = DEFAULT_DIRECTORY, max_bytes: int = 2**29) -> None:
+        self.cur = cur
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    # parameter_idの(終了したシミュレーション数, 実行中のシミュレーションのcommit済みの世代数の合計, BottleneckHistogramsの回数の合計)
+    # GenerationIDは開始時にまとめて登録するので、シミュレーション数や最大のGenerationIDは終了時に変わらない
+    # 終了したシミュレーションはチェックポイントがなく(checkpoint.PeriodicCommit.finish)、ヒストグラムは終了時に加算される
+    # 実行中のシミュレーションはcommitのたびにチェックポイントの世代が進むので、これが同じならクエリの結果も同じ
+    def version(self, parameter_id: int) -> tuple[int, int, int]:
+        self.cur.execute("""SELECT COUNT(*) FILTER (WHERE checkpoints.simulationid IS NULL),
+                            COALESCE(SUM(checkpoints.generation_count), 0),
+                            (SELECT COALESCE(SUM(count), 0) FROM bottleneckhistograms WHERE parameterid = %s)
+                        FROM simulations
+                        LEFT JOIN checkpoints ON checkpoints.simulationid = simulations.simulationid
+                        WHERE simulations.parameterid = %s;""", (parameter_id, parameter_id))
+        completed, committed_generations, histogram_total = self.cur.fetchone()
+        return int(completed), int(committed_generations), int(histogram_total)
+
+    def path(self, name: str, parameter_id: int, key: tuple) -> str:
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+        return os.path.join(self.directory, f"{name}_p{parameter_id}_{digest}.npz")
+
+    # nameのクエリのparameter_idの結果を返す(keyはクエリの引数など、結果を区別する値)
+    # キャッシュがないか古ければcompute()を呼んで保存する
+    def get(self, name: str, parameter_id: int, compute: Callable[[], Any], *key: Any) -> np.ndarray:
+        path = self.path(name, parameter_id, key)
+        version = self.version(parameter_id)
+        if os.path.exists(path):
+            with np.load(path) as cached:
+                if tuple(cached["version"]) == version:
+                    result = cached["result"]
+                    # 最後に使った時刻を更新(LRU用)
+                    os.utime(path)
+                    return result
+
+        result = np.asarray(compute())
+        # 書き込み途中のファイルを読まないように一時ファイルに書いてから置き換える
+        # 一時ファイルは書き込むプロセスごとに別の名前にする(同じキーを同時に計算したプロセスの書き込みが混ざらない)
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix=".tmp", delete=False) as f:
+            try:
+                np.savez(f, result=result, version=np.array(version))
+            except BaseException:
+                f.close()
+                os.remove(f.name)
+                raise
+        os.replace(f.name, path)
+        self.evict()
+        return result
+
+    # 合計サイズがmax_bytes以下になるまで最後に使った時刻が古いファイルから削除する
+    def evict(self) -> None:
+        # 他のプロセスが同時に削除したファイルは飛ばす
+        entries = []
+        for file_name in os.listdir(self.directory):
+            if file_name.endswith(".npz"):
+                try:
+                    stat = os.stat(os.path.join(self.directory, file_name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, file_name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, file_name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, file_name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self) -> None:
+        for file_name in os.listdir(self.directory):
+            if file_name.endswith(".npz"):
+                os.remove(os.path.join(self.directory, file_name))
@@ -1,5 +1,6 @@
 import psycopg2
 import traceback
+from bottleneck_queries import bottleneck_matrix
 
 try:
     # データベースに接続
@@ -13,13 +14,9 @@ try:
     # カーソルを作成
     cur = conn.cursor()
 
-    # cur.execute(f"""SELECT Count(interests.routebottleneck)
-    #                 FROM interests
-    #                 JOIN generations ON interests.generationid = generations.generationid
-    #                 JOIN simulations ON generations.simulationid = simulations.simulationid
-    #                 WHERE simulations.parameterid = 482
-    #                 AND generations.generation_count = 5
-    #                 AND interests.routebottleneck = 100;""")
+    # 世代5でボトルネックが100のinterestの回数は1回ずつCOUNTせずにまとめて取得する
+    # matrix = bottleneck_matrix(cur, [482], "interests")[482]
+    # print(matrix[5][0])
     cur.execute(f"""SELECT *
                     FROM interests
                     JOIN generations ON interests.generationid = generations.generationid
@@ -0,0 +1,35 @@
+# シミュレーションが書き出したフェロモン推移のバイナリファイル(simulation/pheromone_trace.py)を読む
+# np.memmapで必要な世代・辺だけを読み出すので、Connectionsテーブルへの問い合わせは不要
+import os
+import sys
+import traceback
+import numpy as np
+import matplotlib.pyplot as plt
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "simulation"))
+from pheromone_trace import PheromoneTrace
+
+try:
+    path = sys.argv[1]
+    trace = PheromoneTrace(path)
+    print(f"simulation_id: {trace.simulation_id}, generations: {trace.written}/{trace.generation_limit}, edges: {trace.num_edges}")
+
+    # 最終世代でフェロモンが多い上位10本の辺の推移を描画
+    last = trace.generation(trace.written - 1)
+    top = np.argsort(last)[::-1][:10]
+    for i in top:
+        edge = trace.edges[i]
+        plt.plot(trace.matrix[:trace.written, i],
+                 label=f"{edge['start_id']}→{edge['end_id']} (width {edge['width']})")
+
+    # グラフの設定
+    plt.xlabel('Generation')
+    plt.ylabel('Pheromone')
+    plt.yscale('log')
+    plt.legend(fontsize='small')
+    plt.savefig("trace.SVG")
+    plt.show()
+
+except Exception as e:
+    print(e)
+    print(traceback.format_exc())
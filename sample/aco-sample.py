@@ -1,9 +1,10 @@
 # オブジェクト指向で書き直したACOのベースプログラム
-# 出力はjson形式
-from typing import Dict, Tuple, ClassVar, Self, TYPE_CHECKING, cast
+# 出力はJSON Lines形式(1世代1行)
+from typing import Dict, Tuple, ClassVar, Self, TYPE_CHECKING, cast, IO, Iterator
 import random
 import pprint
 import json
+import gzip
 import math
 
 class Params:
@@ -269,32 +270,103 @@ class Network:
         return {"network" : tmp}
     
 class SimulationLogger:
-    def __init__(self, file_path:str, file_name:str) -> None:
+    # 1世代1行のJSON Lines形式で逐次書き出すロガー
+    # 1行目はparams、以降は{"simulation", "generation", "network", "ant", "interest"}の1世代分のレコード
+    # networkはシミュレーションの最初の世代だけ全てのLink(と最適ルート)、以降は前の世代から変化したLinkだけを書く
+    # Linkは[始点ノードID, 終点ノードID, width, feromone]のリスト
+    # compressionに"gzip"か"zstd"を指定すると圧縮して書き出す(zstdはzstandardが必要)
+    # 書き出し前の行はbuffer_sizeバイトまで溜め、超えたらファイルに書く
+    def __init__(self, file_path:str, file_name:str, compression:str|None=None, buffer_size:int=2**20) -> None:
         self.file_path = file_path
         self.file_name = file_name
-        self.log:dict = {}
+        self.buffer_size = buffer_size
+        self.buffer:list[str] = []
+        self.buffered_bytes:int = 0
+        self.record:dict|None = None # 書き出し前の世代のレコード
+        self.previous_links:dict[tuple[int, int], tuple[int, float]] = {} # 前の世代のLinkの(width, feromone)
+        self.file = open_log(file_path + file_name, "wt", compression)
+
+    def write_line(self, obj:dict) -> None:
+        line = json.dumps(obj, separators=(",", ":"), ensure_ascii=False) + "\n"
+        self.buffer.append(line)
+        self.buffered_bytes += len(line)
+        if self.buffered_bytes >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        self.file.write("".join(self.buffer))
+        self.buffer = []
+        self.buffered_bytes = 0
+
+    def flush_record(self) -> None:
+        # 書き出し前の世代のレコードがあればバッファに移す
+        if self.record is not None:
+            self.write_line(self.record)
+            self.record = None
 
     def save_params(self, params:Params) -> None:
-        self.log["params"] = params.get_attr_json()
+        self.write_line({"params" : params.get_attr_json()})
 
     def prepare_dict_for_simulation(self, simulation_count:int) -> None:
-        self.log["simulation" + str(simulation_count)] = {}
+        self.flush_record()
+        self.previous_links = {}
 
     def prepare_dict_for_generation(self, simulation_count:int, generation_count:int) -> None:
-        self.log["simulation" + str(simulation_count)]["generation" + str(generation_count)] = {}
+        self.flush_record()
+        self.record = {"simulation" : simulation_count, "generation" : generation_count}
 
     def save_network(self, simulation_count:int, generation_count:int, network:Network) -> None:
-        self.log["simulation" + str(simulation_count)]["generation" + str(generation_count)].update(network.get_attr_json())
+        links = []
+        first = len(self.previous_links) == 0
+        for node in network.nodes:
+            for neighbor, link in node.neighbors.items():
+                key = (node.id, neighbor.id)
+                value = (link.width, link.feromone)
+                if self.previous_links.get(key) != value:
+                    links.append([node.id, neighbor.id, link.width, link.feromone])
+                    self.previous_links[key] = value
+        network_json:dict = {"links" : links}
+        if first:
+            network_json["optimal"] = [node.id for node in network.optimal_route] if network.optimal_route is not None else None
+        cast(dict, self.record)["network"] = network_json
 
     def save_ant(self, simulation_count:int, generation_count:int, ant:Ant) -> None:
-        self.log["simulation" + str(simulation_count)]["generation" + str(generation_count)].update(ant.get_attr_json())
+        cast(dict, self.record).update(ant.get_attr_json())
 
     def save_interest(self, simulation_count:int, generation_count:int, interest:Interest) -> None:
-        self.log["simulation" + str(simulation_count)]["generation" + str(generation_count)].update(interest.get_attr_json())
+        cast(dict, self.record).update(interest.get_attr_json())
 
     def output_log(self) -> None:
-        with open(self.file_path + self.file_name, "w") as f:
-            json.dump(self.log, f, indent=6, ensure_ascii=False)
+        # 残りのレコードを書き出してファイルを閉じる
+        self.flush_record()
+        self.flush()
+        self.file.close()
+
+def open_log(path:str, mode:str, compression:str|None) -> IO:
+    # compressionに応じてログファイルをテキストモードで開く
+    if compression is None:
+        return open(path, mode, encoding="utf-8")
+    if compression == "gzip":
+        return gzip.open(path, mode, encoding="utf-8")
+    if compression == "zstd":
+        import zstandard
+        return zstandard.open(path, mode, encoding="utf-8")
+    raise ValueError(f"unknown compression: {compression}")
+
+def read_log(path:str, compression:str|None=None) -> Iterator[dict]:
+    # SimulationLoggerのログを1行ずつ読み、networkを差分から復元したレコードを返す
+    # 復元したnetwork["links"]は{(始点ノードID, 終点ノードID): [width, feromone]}
+    links:dict[tuple[int, int], list] = {}
+    with open_log(path, "rt", compression) as f:
+        for line in f:
+            record = json.loads(line)
+            if "network" in record:
+                if record["generation"] == 0:
+                    links = {}
+                for start, end, width, feromone in record["network"]["links"]:
+                    links[(start, end)] = [width, feromone]
+                record["network"]["links"] = dict(links)
+            yield record
 
 class Simulation:
     SIMULATION_COUNT:ClassVar[int] = -1
@@ -369,7 +441,7 @@ if __name__ == "__main__":
                     simulation_count=2)
     
     # SimulationLoggerインスタンス作成
-    logger = SimulationLogger("./", "result.json")
+    logger = SimulationLogger("./", "result.jsonl.gz", compression="gzip")
     logger.save_params(params)
     
     # シミュレーションをparams.simulation_count回実行
@@ -379,5 +451,5 @@ if __name__ == "__main__":
         # シミュレーション実行
         simulation.run(params)
 
-    # pprint.pprint(logger.log, width=40)
+    # 残りのログを書き出してファイルを閉じる
     logger.output_log()
\ No newline at end of file
@@ -1,11 +1,25 @@
 # 通常ACO
 # 出力はDBに格納
-from typing import Dict, Tuple, ClassVar, Self, TYPE_CHECKING, cast, Any
+from typing import Dict, Tuple, ClassVar, Self, TYPE_CHECKING, cast, Any, Callable
+import os
 import random
 import traceback
 import math
+import bisect
+import itertools
+import io
+import numpy as np
 import psycopg2
-from multiprocessing import Pool
+import psycopg2.extras
+from sweep import run_sweep
+from parameter_registry import ParameterRegistry
+from snapshot import ConnectionDeltaEncoder
+from storage import StorageBackend, AsyncStorage, async_storage, RouteInterner, packet_row, parameter_values
+from histogram import BottleneckHistogram
+from shared_topology import TopologyHandle
+from topology_library import TopologyLibrary
+from pheromone_trace import PheromoneTrace
+from checkpoint import PeriodicCommit, load_checkpoint
 # ! interestがdestinationに到達していないのに終了してしまっている
 # ! interestがpheromoneが最も高い経路を選択してる？
 
@@ -23,41 +37,68 @@ class Params:
         self.generation_limit = generation_limit  # 1回のシミュレーションの世代数
         self.simulation_count = simulation_count  # シミュレーション回数
 
-    def generate_insert_query(self) -> str:
-        return f"INSERT INTO parameters (numberofnodes, optimalpathlength, volatility, minpheromone, maxpheromone, ttl, bata, generationlimit) VALUES ({self.num_nodes}, {self.optimal_route_length}, {self.volatility}, {self.pheromone_min}, {self.pheromone_max}, {self.ttl}, {self.bata}, {self.generation_limit},);"
-
-    def generate_insert_or_return_id_query(self) -> str:
-        # 既存の行と競合する場合にidを返すクエリ
-        return f"INSERT INTO parameters (numberofnodes, optimalpathlength, volatility, minpheromone, maxpheromone, ttl, bata, generationlimit) VALUES ({self.num_nodes}, {self.optimal_route_length}, {self.volatility}, {self.pheromone_min}, {self.pheromone_max}, {self.ttl}, {self.bata}, {self.generation_limit}) ON CONFLICT (numberofnodes, optimalpathlength, volatility, minpheromone, maxpheromone, ttl, bata, generationlimit) DO NOTHING RETURNING parameterid;"
-
-    def generate_select_query(self) -> str:
-        return f"SELECT parameterid FROM parameters WHERE numberofnodes = {self.num_nodes} AND optimalpathlength = {self.optimal_route_length} AND volatility = {self.volatility} AND minpheromone = {self.pheromone_min} AND maxpheromone = {self.pheromone_max} AND ttl = {self.ttl} AND bata = {self.bata} AND generationlimit = {self.generation_limit};"
-
 
 class Link:
-    def __init__(self, width: int, feromone: float) -> None:
-        self.width = width
-        self.pheromone = feromone
+    def __init__(self, width: int, feromone: float, owner: "Node | None" = None) -> None:
+        self.owner = owner  # このLinkを持つ(始点の)ノード
+        self._width = width
+        self._pheromone = feromone
+
+    # width, pheromoneが変わったら始点ノードのサンプラーを無効化する
+    @property
+    def width(self) -> int:
+        return self._width
+
+    @width.setter
+    def width(self, value: int) -> None:
+        if value != self._width and self.owner is not None:
+            self.owner.sampler = None
+        self._width = value
+
+    @property
+    def pheromone(self) -> float:
+        return self._pheromone
+
+    @pheromone.setter
+    def pheromone(self, value: float) -> None:
+        if value != self._pheromone and self.owner is not None:
+            self.owner.sampler = None
+        self._pheromone = value
+
+
+class NextHopSampler:
+    # 隣接ノードを重み(width ** bata * pheromone)に比例して選ぶための累積重み
+    # random.choicesと同じ方法で選ぶが、累積重みを使い回せる
+    def __init__(self, nodes: list, weights: list[float], bata: int) -> None:
+        self.nodes = nodes
+        self.cum_weights = list(itertools.accumulate(weights))
+        self.total = self.cum_weights[-1] if self.cum_weights else 0
+        self.bata = bata
+
+    def sample(self) -> Any:
+        return self.nodes[bisect.bisect(self.cum_weights, random.random() * self.total, 0, len(self.nodes) - 1)]
 
 
 class Node:
     def __init__(self) -> None:
         self.id: int = None
         self.neighbors: dict[Node, Link] = {}
+        self.sampler: NextHopSampler | None = None  # Ant.hopで使うサンプラーのキャッシュ
 
     def connect(self, target_node: Self, width: int, pheromone: int) -> None:
-        self.neighbors[target_node] = Link(width, pheromone)
-        target_node.neighbors[self] = Link(width, pheromone)
+        self.neighbors[target_node] = Link(width, pheromone, self)
+        target_node.neighbors[self] = Link(width, pheromone, target_node)
+        self.sampler = None
+        target_node.sampler = None
 
-    def generate_insert_query(self, simulation_id) -> str:
-        return f'INSERT INTO Nodes (simulationid, Num_of_connections) VALUES ({simulation_id},{len(self.neighbors)});'
-
-    def show_info(self) -> None:
-        print(f"NodeID: {self.id}")
-        for node, link in self.neighbors.items():
-            print(
-                f"└ NodeID: {node.id}, Width: {link.width}, Pheromone: {link.pheromone}")
-        print("")
+    # 隣接ノードのサンプラーを返す(Linkが変わっていなければ前回作ったものを使い回す)
+    def next_hop_sampler(self, bata: int) -> NextHopSampler:
+        if self.sampler is None or self.sampler.bata != bata:
+            self.sampler = NextHopSampler(
+                list(self.neighbors.keys()),
+                [(link.width ** bata) * link.pheromone for link in self.neighbors.values()],
+                bata)
+        return self.sampler
 
 
 class Packet:
@@ -66,6 +107,8 @@ class Packet:
         self.destination = destination
         self.current_node = source
         self.route: list[Node] = [source]
+        # routeに含まれるノードの集合(未訪問判定をO(1)で行うため)
+        self.visited: set[Node] = {source}
         self.route_width: list[int] = []
         self.route_bottoleneck: int = 2**8
         self.movable: bool = True
@@ -75,6 +118,7 @@ class Packet:
 
     def update_attr(self, next_node: Node) -> None:
         self.route.append(next_node)
+        self.visited.add(next_node)
         self.route_width.append(self.current_node.neighbors[next_node].width)
         self.route_bottoleneck = min(
             self.route_bottoleneck, self.current_node.neighbors[next_node].width)
@@ -85,38 +129,14 @@ class Packet:
 
 
 class Ant(Packet):
-    def hop(self, params: Params) -> None:
-        unvisited_nodes = [
-            node for node in self.current_node.neighbors.keys() if node not in self.route]
-
-        # debug
-        # print(f"CurrentNodeID: {self.current_node.id}")
-        # print(f"Current_Node_Neighbors")
-        # for node, link in self.current_node.neighbors.items():
-        #     print(
-        #         f"└ NodeID: {node.id}, Width: {link.width}, Pheromone: {link.pheromone}")
-
-        # print(f"Visited_nodes")
-        # for visited_node in self.route:
-        #     print(
-        #         f"└ NodeID: {visited_node.id}")
-
-        # print(f"Unvisited_nodes")
-        # for unvisited_node in unvisited_nodes:
-        #     print(f"└ NodeID: {unvisited_node.id}")
-
-        # current_nodeのneighborsに未訪問ノードがないならば属性を更新し終了
-        if len(unvisited_nodes) == 0:
-            # debug
-            print(f"Can't hop!")
-            print("")
-
-            self.set_unmovable()
-            return
+    # 訪問済みノードを引いた時に引き直す回数の上限
+    max_rejection: ClassVar[int] = 8
 
+    def hop(self, params: Params) -> None:
         # current_nodeのneighborsにdestinationが含まれているか確認
         # current_nodeのneighborsにdestinationが含まれている場合
-        if self.destination in self.current_node.neighbors.keys():
+        # (destinationは未訪問なので未訪問ノードがないケースには当たらない)
+        if self.destination in self.current_node.neighbors:
             # debug
             print(f"Destination NodeID: {self.destination.id} is in current_node_neighbors!")
             print("")
@@ -127,19 +147,37 @@ class Ant(Packet):
             return
 
         # current_nodeのneighborsにdestinationが含まれていない場合
+        # キャッシュした累積重みで全隣接ノードから選び、訪問済みなら引き直す
+        sampler = self.current_node.next_hop_sampler(params.bata)
+        for _ in range(self.max_rejection):
+            next_node = sampler.sample()
+            if next_node not in self.visited:
+                self.update_attr(next_node)
+                return
+
+        # 引き直しが続いた場合は未訪問ノードだけで重みを計算して選ぶ
+        unvisited_nodes = [
+            node for node in self.current_node.neighbors.keys() if node not in self.visited]
+
+        # current_nodeのneighborsに未訪問ノードがないならば属性を更新し終了
+        if len(unvisited_nodes) == 0:
+            # debug
+            print(f"Can't hop!")
+            print("")
+
+            self.set_unmovable()
+            return
+
         unvisited_links = [self.current_node.neighbors[node]
-                           for node in self.current_node.neighbors.keys() if node not in self.route]
-        unvisited_links_width = [link.width for link in unvisited_links]
-        unvisited_links_pheromone = [
-            link.pheromone for link in unvisited_links]
-        weights = [(width ** params.bata) * pheromone for width,
-                   pheromone in zip(unvisited_links_width, unvisited_links_pheromone)]
+                           for node in unvisited_nodes]
+        weights = [(link.width ** params.bata) * link.pheromone
+                   for link in unvisited_links]
         # debug
         # print(f"Weights")
-        # for node, width, pheromone, weight in zip(unvisited_nodes ,unvisited_links_width, unvisited_links_pheromone, weights):
+        # for node, link, weight in zip(unvisited_nodes, unvisited_links, weights):
         #     print(
-        #         f"└ NodeID: {node.id} -> Width: {width}, Pheromone: {pheromone} -> Weight: {weight}")
-            
+        #         f"└ NodeID: {node.id} -> Width: {link.width}, Pheromone: {link.pheromone} -> Weight: {weight}")
+
         next_node = random.choices(unvisited_nodes, weights=weights)[0]
 
         # debug
@@ -153,26 +191,11 @@ class Ant(Packet):
         while self.movable:
             self.hop(params)
 
-    def get_insert_query(self, generation_id: int) -> str:
-        route_node_id = [node.id for node in self.route]
-        # debug
-        # Antの全ての情報を表示
-        print(f"Ant")
-        print(f"├ GenerationID: {generation_id}")
-        print(f"├ SourceNodeID: {self.source.id}")
-        print(f"├ DestinationNodeID: {self.destination.id}")
-        print(f"├ RouteNodesID: {route_node_id}")
-        print(f"├ RouteWidths: {self.route_width}")
-        print(f"└ RouteBottleneck: {self.route_bottoleneck}")
-        print("")
-
-        return f'INSERT INTO Ants (GenerationId, SourceNodeID, DestinationNodeID, RouteNodesID, RouteWidths, RouteBottleneck) VALUES ({generation_id}, {self.source.id}, {self.destination.id}, ARRAY{route_node_id}, ARRAY{self.route_width}, {self.route_bottoleneck});'
-
 
 class Rand(Packet):
     def hop(self):
         unvisited_nodes = [
-            node for node in self.current_node.neighbors.keys() if node not in self.route]
+            node for node in self.current_node.neighbors.keys() if node not in self.visited]
         # current_nodeのneighborsに未訪問ノードがないならば属性を更新し終了
         if len(unvisited_nodes) == 0:
             self.set_unmovable()
@@ -197,15 +220,11 @@ class Rand(Packet):
         else:
             return
 
-    def get_insert_query(self, generation_id: int) -> str:
-        route_node_id = [node.id for node in self.route]
-        return f'INSERT INTO Rands (GenerationId, SourceNodeID, DestinationNodeID, RouteNodesID, RouteWidths, RouteBottleneck) VALUES ({generation_id}, {self.source.id}, {self.destination.id}, ARRAY{route_node_id}, ARRAY{self.route_width}, {self.route_bottoleneck});'
-
 
 class Interest(Packet):
     def hop(self) -> None:
         unvisited_nodes = [
-            node for node in self.current_node.neighbors.keys() if node not in self.route]
+            node for node in self.current_node.neighbors.keys() if node not in self.visited]
         # current_nodeのneighborsに未訪問ノードがないならば属性を更新し終了
         if len(unvisited_nodes) == 0:
             self.set_unmovable()
@@ -230,20 +249,37 @@ class Interest(Packet):
         while self.movable:
             self.hop()
 
-    def get_insert_query(self, generation_id: int) -> str:
-        route_node_id = [node.id for node in self.route]
-        # debug
-        # Interestの全ての情報を表示
-        print(f"Interest")
-        print(f"├ GenerationID: {generation_id}")
-        print(f"├ SourceNodeID: {self.source.id}")
-        print(f"├ DestinationNodeID: {self.destination.id}")
-        print(f"├ RouteNodesID: {route_node_id}")
-        print(f"├ RouteWidths: {self.route_width}")
-        print(f"└ RouteBottleneck: {self.route_bottoleneck}")
-        print("")
 
-        return f'INSERT INTO Interests (GenerationId, SourceNodeID, DestinationNodeID, RouteNodesID, RouteWidths, RouteBottleneck) VALUES ({generation_id}, {self.source.id}, {self.destination.id}, ARRAY{route_node_id}, ARRAY{self.route_width}, {self.route_bottoleneck});'
+# BAモデルの無向辺(sources[k] - targets[k])とそのwidthを生成する
+# 辺の端点を次数の回数だけ並べた配列endpointsから一様に選ぶと次数に比例した選択になるので
+# 新しいノード1つあたりO(edge_num)で接続先を決められる(全体でO(num_nodes * edge_num))
+def generate_ba_edges(num_nodes: int, edge_num: int, seed: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    rng = random.Random(seed)
+    rand = rng.random
+
+    # 3つのノードから初期ネットワーク作成
+    sources = [0, 1, 2]
+    targets = [1, 2, 0]
+    endpoints = [0, 1, 1, 2, 2, 0]
+
+    for i in range(3, num_nodes):
+        # 重複なしで接続先を選ぶ(既に選んだノードが出たら引き直す)
+        target_nodes_id: list[int] = []
+        while len(target_nodes_id) < min(edge_num, i):
+            chosen_id = endpoints[int(rand() * len(endpoints))]
+            if chosen_id not in target_nodes_id:
+                target_nodes_id.append(chosen_id)
+
+        # 接続先の次数も新しいノードの次数も増える
+        for j in target_nodes_id:
+            sources.append(i)
+            targets.append(j)
+            endpoints.append(i)
+            endpoints.append(j)
+
+    widths = np.random.default_rng(seed).integers(
+        1, 10, size=len(sources), endpoint=True) * 10
+    return np.array(sources, dtype=np.int64), np.array(targets, dtype=np.int64), widths
 
 
 class Network:
@@ -256,41 +292,15 @@ class Network:
     def yield_nodes(self, params: Params) -> None:
         self.nodes = [Node() for _ in range(params.num_nodes)]
 
-    def make_ba_model(self, params: Params, edge_num: int) -> None:
-        # 3つのノードから初期ネットワーク作成
-        self.nodes[0].connect(self.nodes[1], random.randint(
-            1, 10) * 10, params.pheromone_min)
-        self.nodes[1].connect(self.nodes[2], random.randint(
-            1, 10) * 10, params.pheromone_min)
-        self.nodes[2].connect(self.nodes[0], random.randint(
-            1, 10) * 10, params.pheromone_min)
-
-        # BAモデルの次数分布を格納するリスト
-        nodes_degree = [0 for _ in range(params.num_nodes)]
-        nodes_degree[0] = 2
-        nodes_degree[1] = 2
-        nodes_degree[2] = 2
-
-        # 次数分布を基に接続先ノードを重複なし重み付き乱択しBAモデル作成
-        for i in range(3, params.num_nodes):
-            candidate_nodes_id = [j for j in range(i)]  # 接続先候補ノードのid
-            candidate_nodes_weight = nodes_degree[:i]  # 接続先候補ノードの重み
-            target_nodes_id = []
-
-            for _ in range(edge_num):
-                chosen_id = random.choices(candidate_nodes_id, weights=candidate_nodes_weight)[
-                    0]  # 重み付き乱択で接続先候補ノードを選択
-                target_nodes_id.append(chosen_id)
-                del candidate_nodes_weight[candidate_nodes_id.index(
-                    chosen_id)]  # 選択したノードの重みを削除
-                del candidate_nodes_id[candidate_nodes_id.index(
-                    chosen_id)]  # 選択したノードのidを削除
-
-            for j in target_nodes_id:
-                self.nodes[i].connect(self.nodes[j], random.randint(
-                    1, 10) * 10, params.pheromone_min)
-
-            nodes_degree[i] = edge_num
+    def make_ba_model(self, params: Params, edge_num: int, seed: int | None = None) -> None:
+        # 優先的選択でBAモデルの辺を生成し、ノードを接続
+        # seedを省略した場合はrandomモジュールから生成する(random.seedで再現可能)
+        if seed is None:
+            seed = random.getrandbits(64)
+        sources, targets, widths = generate_ba_edges(
+            params.num_nodes, edge_num, seed)
+        for i, j, width in zip(sources.tolist(), targets.tolist(), widths.tolist()):
+            self.nodes[i].connect(self.nodes[j], width, params.pheromone_min)
 
     def make_optimal_route(self, params: Params) -> None:
         # 最適ルートを作成
@@ -316,6 +326,51 @@ class Network:
         #     print(f"- {node.id} -", end="")
         # print("\n")
 
+    def use_topology(self, topology: dict[str, Any], params: Params) -> None:
+        # 作成済みのトポロジー(topology_library.TOPOLOGY_FIELDSの辞書)からノードを作成して接続する
+        # 無向辺は始点のインデックスが小さい方の有向辺で1回だけ接続し、
+        # 最適ルートは片方向だけwidthが100なので、その後に有向辺ごとのwidthを設定する
+        self.nodes = [Node() for _ in range(int(topology["num_nodes"]))]
+        offsets = np.asarray(topology["offsets"])
+        edges = list(zip(np.repeat(np.arange(len(self.nodes)), np.diff(offsets)).tolist(),
+                         np.asarray(topology["neighbor_ids"]).tolist(), np.asarray(topology["width"]).tolist()))
+        for i, j, width in edges:
+            if i < j:
+                self.nodes[i].connect(self.nodes[j], width, params.pheromone_min)
+        for i, j, width in edges:
+            self.nodes[i].neighbors[self.nodes[j]].width = width
+        self.start_node = self.nodes[int(topology["start"])]
+        self.end_node = self.nodes[int(topology["end"])]
+        self.optimal_route = [self.nodes[int(i)] for i in topology["optimal_route"]]
+
+    def assign_node_ids(self, node_ids: list[int]) -> None:
+        for node, node_id in zip(self.nodes, node_ids):
+            node.id = node_id
+
+    def degrees(self) -> list[int]:
+        return [len(node.neighbors) for node in self.nodes]
+
+    def connections(self) -> tuple[list[int], list[int], list[int], list[int]]:
+        # 全てのLinkの(始点NodeID, 終点NodeID, フェロモン, width)を列ごとのリストで返す
+        # 並び順はself.nodesの順、各ノード内はneighborsの順
+        start_ids, end_ids, pheromone, width = [], [], [], []
+        for startnode in self.nodes:
+            for endnode, link in startnode.neighbors.items():
+                start_ids.append(startnode.id)
+                end_ids.append(endnode.id)
+                pheromone.append(link.pheromone)
+                width.append(link.width)
+        return start_ids, end_ids, pheromone, width
+
+    # フェロモンの状態(チェックポイント用)
+    def pheromone_state(self) -> np.ndarray:
+        return np.asarray(self.connections()[2])
+
+    # pheromone_state()の値に戻す(チェックポイントからの再開用)
+    def set_pheromone_state(self, state: np.ndarray) -> None:
+        links = [link for node in self.nodes for link in node.neighbors.values()]
+        for link, value in zip(links, state.tolist()):
+            link.pheromone = value
 
     def add_pheromone_to_ant_route(self, ant: Ant) -> None:
         # antの辿った経路のフェロモン値にant.route_bottoleneck分を加算する
@@ -336,7 +391,51 @@ class Network:
                     link.pheromone = tmp
 
 
-class DBLogger:
+# DBLoggerが使う文(名前 → (引数の型, 文))
+# 接続ごとに1回だけPREPAREし、以降はEXECUTEで値だけを渡す(サーバーは構文解析と実行計画を使い回す)
+PARAMETERS_KEY = "numberofnodes, optimalpathlength, volatility, minpheromone, maxpheromone, ttl, bata, generationlimit"
+PACKET_COLUMNS = "ParameterID, GenerationID, SourceNodeID, DestinationNodeID, RouteID, RouteBottleneck"
+PREPARED_STATEMENTS: dict[str, tuple[list[str], str]] = {
+    # 既存の行と競合する場合は何も返さない
+    "insert_params": (["int", "int", "float", "float", "float", "int", "float", "int"],
+                      f"INSERT INTO parameters ({PARAMETERS_KEY}) VALUES ($1, $2, $3, $4, $5, $6, $7, $8) "
+                      f"ON CONFLICT ({PARAMETERS_KEY}) DO NOTHING RETURNING parameterid"),
+    "select_params": (["int", "int", "float", "float", "float", "int", "float", "int"],
+                      "SELECT parameterid FROM parameters WHERE numberofnodes = $1 AND optimalpathlength = $2 AND volatility = $3 "
+                      "AND minpheromone = $4 AND maxpheromone = $5 AND ttl = $6 AND bata = $7 AND generationlimit = $8"),
+    "insert_simulation": (["int"], "INSERT INTO simulations (ParameterID) VALUES ($1) RETURNING SimulationID"),
+    "reserve_ids": (["regclass", "int"], "SELECT nextval($1) FROM generate_series(1, $2)"),
+    "partition_exists": (["text"], "SELECT to_regclass($1) IS NOT NULL"),
+    "insert_keyframe": (["bigint"], "INSERT INTO ConnectionKeyframes (GenerationID) VALUES ($1)"),
+    # 他のシミュレーションが同じ経路を登録済みなら何もしない
+    "insert_route": (["bigint", "bigint[]", "int[]"],
+                     "INSERT INTO Routes (RouteID, RouteNodesID, RouteWidths) VALUES ($1, $2, $3) ON CONFLICT (RouteID) DO NOTHING"),
+    **{f"insert_{table.lower()}": (["int", "bigint", "bigint", "bigint", "bigint", "int"],
+                                   f"INSERT INTO {table} ({PACKET_COLUMNS}) VALUES ($1, $2, $3, $4, $5, $6)")
+       for table in ["Ants", "Interests", "Rands"]},
+    "save_checkpoint": (["int", "int", "bytea"],
+                        "INSERT INTO Checkpoints (SimulationID, generation_count, State) VALUES ($1, $2, $3) "
+                        "ON CONFLICT (SimulationID) DO UPDATE SET generation_count = EXCLUDED.generation_count, State = EXCLUDED.State"),
+    "load_checkpoint": (["int"], "SELECT State FROM Checkpoints WHERE SimulationID = $1"),
+    "delete_checkpoint": (["int"], "DELETE FROM Checkpoints WHERE SimulationID = $1"),
+}
+
+
+# 整数の2次元配列rowsをCOPYのテキスト形式(タブ区切り、1行1レコード)にする
+# np.savetxtは1行ずつ書式化するので、全ての値を1回の%でまとめて書式化する
+def copy_text(rows: np.ndarray) -> str:
+    rows = np.asarray(rows, dtype=np.int64)
+    if rows.size == 0:
+        return ""
+    line = "\t".join(["%d"] * rows.shape[1]) + "\n"
+    return (line * rows.shape[0]) % tuple(rows.ravel().tolist())
+
+
+class DBLogger(StorageBackend):
+    # PostgreSQLのストレージバックエンド
+    # connectionsテーブルの行をこの行数溜めたらCOPYで登録する
+    copy_buffer_rows: ClassVar[int] = 100_000
+
     def __init__(self, user: str, password: str, host: str, db_name: str, port: str) -> None:
         self.dbname = db_name
         self.user = user
@@ -344,6 +443,13 @@ class DBLogger:
         self.host = host
         self.connector = None
         self.cursor = None
+        # register_paramsで登録したParameterID(パーティションのキー)
+        self.params_id: int | None = None
+        # COPY待ちのconnectionsテーブルの行
+        self.connection_buffer = io.StringIO()
+        self.connection_buffer_rows = 0
+        # 登録済みの経路
+        self.routes = RouteInterner()
 
     def connect(self):
         self.connector = psycopg2.connect(
@@ -353,6 +459,17 @@ class DBLogger:
             host=self.host
         )
         self.cursor = self.connector.cursor()
+        self.prepare_statements()
+
+    # PREPARED_STATEMENTSを全てPREPAREする(PREPAREはトランザクションに関係なく接続を閉じるまで残る)
+    def prepare_statements(self) -> None:
+        for name, (types, query) in PREPARED_STATEMENTS.items():
+            self.cursor.execute(f"PREPARE {name} ({', '.join(types)}) AS {query};")
+
+    # PREPAREした文nameを値valuesで実行する
+    def execute_prepared(self, name: str, values: tuple) -> None:
+        self.cursor.execute(
+            f"EXECUTE {name} ({', '.join(['%s'] * len(values))});", values)
 
     # 任意のクエリを実行し、結果を返さない
     def execute_query(self, query: int, params=None) -> None:
@@ -363,22 +480,162 @@ class DBLogger:
         self.cursor.execute(query, params)
         return self.cursor.fetchall()
 
-    # INSERTクエリを実行し、生成されたIDを返す
-    def insert_and_get_id(self, query: int, params=None) -> int:
-        self.cursor.execute(query, params)
-        self.cursor.execute("SELECT LASTVAL();")
+    # パラメータを登録&パラメータIDを取得
+    # Connections, Ants, Interests, RandsはParameterIDで分割しているので、そのパーティションも作成する
+    def register_params(self, params: Params) -> int:
+        values = parameter_values(params)
+        self.execute_prepared("insert_params", values)
+        row = self.cursor.fetchone()
+        if row is None:
+            # 登録済みのパラメータ
+            self.execute_prepared("select_params", values)
+            row = self.cursor.fetchone()
+        self.params_id = row[0]
+        self.ensure_partitions(self.params_id)
+        return self.params_id
+
+    # パラメータのリストを1回の問い合わせでまとめて登録&パラメータIDを取得し、それぞれのパーティションも作成する
+    # 登録済みの行はINSERTされないので、同じ問い合わせで既存の行のIDも読む
+    def register_params_bulk(self, params_list: list[Params]) -> list[int]:
+        values = [parameter_values(params) for params in params_list]
+        rows = psycopg2.extras.execute_values(self.cursor,
+            f"""WITH input ({PARAMETERS_KEY}) AS (VALUES %s),
+            inserted AS (INSERT INTO parameters ({PARAMETERS_KEY}) SELECT * FROM input
+                         ON CONFLICT ({PARAMETERS_KEY}) DO NOTHING RETURNING parameterid, {PARAMETERS_KEY})
+            SELECT * FROM inserted
+            UNION ALL
+            SELECT parameterid, {PARAMETERS_KEY} FROM parameters JOIN input USING ({PARAMETERS_KEY});""",
+            list(dict.fromkeys(values)), template="(%s::int, %s::int, %s::float, %s::float, %s::float, %s::int, %s::float, %s::int)", fetch=True)
+        ids = {tuple(row[1:]): row[0] for row in rows}
+        params_ids = []
+        for params, value in zip(params_list, values):
+            if value not in ids:
+                # 問い合わせの途中で他の接続が登録した行は見えないので1件ずつ登録し直す
+                ids[value] = self.register_params(params)
+            params_ids.append(ids[value])
+        for params_id in set(params_ids):
+            self.ensure_partitions(params_id)
+        return params_ids
+
+    # ParameterRegistryで登録済み(パーティションも作成済み)のパラメータを使う
+    def use_params(self, params: Params) -> None:
+        self.params_id = params.id
+
+    # params_idのパーティションがなければ作成する(sql/migrations/0003_partition_by_parameter.sql)
+    # 作成は別の接続ですぐに確定し、同じパラメータの他のワーカーもすぐに使えるようにする
+    def ensure_partitions(self, params_id: int) -> None:
+        self.execute_prepared("partition_exists", (f"connections_p{params_id}",))
+        if self.cursor.fetchone()[0]:
+            return
+        connector = psycopg2.connect(
+            dbname=self.dbname, user=self.user, password=self.password, host=self.host)
+        connector.autocommit = True
+        cursor = connector.cursor()
+        cursor.execute(
+            "SELECT create_parameter_partitions(%s);", (params_id,))
+        cursor.close()
+        connector.close()
+
+    # シミュレーションを登録&シミュレーションIDを取得
+    def register_simulation(self, params_id: int) -> int:
+        self.execute_prepared("insert_simulation", (params_id,))
         return self.cursor.fetchone()[0]
 
-    def insert_conflict(self, query: int, params=None) -> int:
-        id = self.cursor.execute(query, params)
-        return id
+    def insert_keyframe(self, generation_id: int) -> None:
+        self.execute_prepared("insert_keyframe", (generation_id,))
+
+    # 経路は初めて見たものだけRoutesに登録し、packetの行はRouteIDで参照する
+    def insert_packet(self, table: str, generation_id: int, packet: Packet) -> None:
+        source_id, destination_id, route_node_id, route_width, route_bottoleneck = packet_row(
+            packet)
+        route_id, is_new = self.routes.intern(route_node_id)
+        if is_new:
+            self.execute_prepared(
+                "insert_route", (route_id, route_node_id, route_width))
+        self.execute_prepared(f"insert_{table.lower()}", (self.params_id, generation_id,
+                              source_id, destination_id, route_id, route_bottoleneck))
+
+    # 同じParameterIDの他のシミュレーションの回数に加算する
+    def add_bottleneck_histogram(self, params_id: int, histogram: Any) -> None:
+        psycopg2.extras.execute_values(self.cursor,
+            """INSERT INTO BottleneckHistograms (ParameterID, PacketType, generation_count, RouteBottleneck, Count) VALUES %s
+            ON CONFLICT (ParameterID, PacketType, generation_count, RouteBottleneck)
+            DO UPDATE SET Count = BottleneckHistograms.Count + EXCLUDED.Count;""",
+            histogram.rows(params_id))
+
+    # チェックポイントを保存(同じシミュレーションの前のチェックポイントは置き換える)
+    def save_checkpoint(self, simulation_id: int, generation_count: int, state: bytes) -> None:
+        self.execute_prepared("save_checkpoint",
+                              (simulation_id, generation_count, psycopg2.Binary(state)))
+
+    def load_checkpoint(self, simulation_id: int) -> bytes:
+        self.execute_prepared("load_checkpoint", (simulation_id,))
+        row = self.cursor.fetchone()
+        if row is None:
+            raise ValueError(f"no checkpoint for simulation {simulation_id}")
+        return bytes(row[0])
+
+    def delete_checkpoint(self, simulation_id: int) -> None:
+        self.execute_prepared("delete_checkpoint", (simulation_id,))
+
+    # シーケンスの値をcount個まとめて予約する(1回の問い合わせで済む)
+    def reserve_ids(self, sequence: str, count: int) -> list[int]:
+        self.execute_prepared("reserve_ids", (sequence, count))
+        return [row[0] for row in self.cursor.fetchall()]
+
+    # 整数の2次元配列rowsをCOPY FROM STDINでtableにまとめて登録する
+    def copy_rows(self, table: str, columns: list[str], rows: np.ndarray) -> None:
+        buffer = io.StringIO(copy_text(rows))
+        self.cursor.copy_expert(
+            f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+
+    # networkの全ノードにNodeIDを割り当て、nodesテーブルにまとめて登録する
+    def insert_nodes(self, simulation_id: int, network: Any) -> None:
+        node_ids = self.reserve_ids("nodes_nodeid_seq", len(network.nodes))
+        network.assign_node_ids(node_ids)
+        degrees = network.degrees()
+        self.copy_rows("nodes", ["NodeID", "SimulationID", "Num_of_connections"], np.column_stack(
+            [node_ids, np.full(len(node_ids), simulation_id), degrees]))
+
+    # generation_limit世代分のGenerationIDを割り当て、generationsテーブルにまとめて登録する
+    def insert_generations(self, simulation_id: int, generation_limit: int) -> list[int]:
+        generation_ids = self.reserve_ids(
+            "generations_generationid_seq", generation_limit)
+        self.copy_rows("generations", ["GenerationID", "SimulationID", "generation_count"], np.column_stack(
+            [generation_ids, np.full(generation_limit, simulation_id), np.arange(generation_limit)]))
+        return generation_ids
+
+    # 1世代分のconnectionsテーブルの行(Network.connections()の戻り値)をバッファに追加する
+    # バッファがcopy_buffer_rows行を超えたらCOPYで登録する
+    def add_connections(self, generation_id: int, connections: tuple) -> None:
+        start_ids, end_ids, pheromone, width = connections
+        rows = np.column_stack([np.full(len(start_ids), self.params_id), np.full(len(start_ids), generation_id),
+                                start_ids, end_ids, pheromone, width]).astype(np.int64)
+        self.connection_buffer.write(copy_text(rows))
+        self.connection_buffer_rows += len(rows)
+        if self.connection_buffer_rows >= self.copy_buffer_rows:
+            self.flush_connections()
+
+    # バッファに溜まったconnectionsテーブルの行をCOPYで登録する
+    def flush_connections(self) -> None:
+        if self.connection_buffer_rows == 0:
+            return
+        self.connection_buffer.seek(0)
+        self.cursor.copy_expert(
+            "COPY connections (ParameterID, GenerationID, StartNodeID, EndNodeID, Pheromone, Width) FROM STDIN", self.connection_buffer)
+        self.connection_buffer = io.StringIO()
+        self.connection_buffer_rows = 0
 
     # 変更を確定
     def commit(self):
+        self.flush_connections()
         self.connector.commit()
 
     # 変更を破棄
     def rollback(self):
+        self.connection_buffer = io.StringIO()
+        self.connection_buffer_rows = 0
+        self.routes.clear()
         self.connector.rollback()
 
     # データベース接続を閉じる
@@ -387,122 +644,270 @@ class DBLogger:
         self.connector.close()
 
 
+# PooledDBLoggerが使っていない接続((プロセスID, 接続先) → 接続のリスト)
+# Poolのワーカーは後のタスクでも同じ接続を使う
+# forkしたワーカーは親プロセスの接続も引き継ぐが、ソケットを共有しているので使わない(キーのプロセスIDが違う)
+pooled_connections: dict[tuple[int, str, str, str], list[Any]] = {}
+
+
+class PooledDBLogger(DBLogger):
+    # 接続をプロセス内で使い回すDBLogger
+    # connectで使っていない接続があればそれを使い(PREPAREした文もそのまま使える)、
+    # closeでは接続を閉じずに未確定の変更を捨ててpooled_connectionsに戻す
+    def pool_key(self) -> tuple[int, str, str, str]:
+        return (os.getpid(), self.dbname, self.user, self.host)
+
+    def connect(self):
+        idle = pooled_connections.get(self.pool_key(), [])
+        while idle:
+            connector = idle.pop()
+            if not connector.closed:
+                self.connector = connector
+                self.cursor = connector.cursor()
+                return
+        super().connect()
+
+    def close(self) -> None:
+        self.cursor.close()
+        if self.connector.closed:
+            return
+        try:
+            self.connector.rollback()
+        except psycopg2.Error:
+            # 切断された接続は使い回さない
+            self.connector.close()
+            return
+        pooled_connections.setdefault(self.pool_key(), []).append(self.connector)
+
+
 class Simulation:
-    def __init__(self, logger: DBLogger, params: Params) -> None:
+    def __init__(self, logger: DBLogger, params: Params, network_class: type = Network) -> None:
         self.id = None
         self.params: Params = params
         self.logger = logger
 
-        self.network = Network()
+        # network_classにはNetworkと同じメソッドを持つクラス(csr.CSRNetworkなど)を指定できる
+        self.network = network_class()
         self.ant: Ant | None = None
         self.rand: Rand | None = None
         self.interest: Interest | None = None
 
         self.generation_count: int = 0
 
-    def generate_insert_query(self) -> str:
-        return f'INSERT INTO simulations (ParameterID) VALUES ({self.params.id});'
+
+# 既定のストレージバックエンド(接続はプロセス内で使い回す)
+def default_storage() -> DBLogger:
+    return PooledDBLogger("asaken_n40", "asaken_N40", "localhost", "simulation", "5432")
+
+
+# DBLoggerへの書き込みをバックグラウンドのスレッドで行うストレージバックエンド
+# シミュレーションはDBへの書き込みを待たずに進む(DBが遅い場合はmax_pending件溜まったところで待つ)
+def async_default_storage(max_pending: int = 64) -> AsyncStorage:
+    return async_storage(default_storage, max_pending)
+
+
+# 1世代分のantの移動・フェロモン付加・登録(run_simulationのmove_antsの既定)
+def move_ant(simulation: Simulation, generation_id: int, generation_count: int, histogram: BottleneckHistogram) -> None:
+    # antの生成と移動
+    simulation.ant = Ant(
+        simulation.network.start_node, simulation.network.end_node)
+    simulation.ant.hop_if_movable(simulation.params)
+
+    # 目的地に到達していたらフェロモン付加
+    if simulation.ant.is_at_destination():
+        simulation.network.add_pheromone_to_ant_route(simulation.ant)
+
+    # antの結果を登録
+    simulation.logger.insert_packet(
+        "Ants", generation_id, simulation.ant)
+    histogram.add("Ants", generation_count, simulation.ant)
+
+    # antをNoneにして消去
+    simulation.ant = None
 
 
-def main(params: Params):
+# シミュレーションを1回実行し、シミュレーションIDを返す(失敗した場合はNone)
+# 各方式のmainはこの関数に方式ごとの関数を渡す
+#   volitile_pheromone : 世代の最後にフェロモンを揮発させる関数(network, params)(省略した場合はnetwork.volitile_pheromone)
+#   prepare_network    : トポロジーと最適ルートの作成後に呼ぶ関数(network, params)(フェロモンの初期値など)
+#   move_ants          : 1世代分のantを移動させて登録する関数(省略した場合はmove_ant)
+# connections_intervalを指定した場合はその世代数ごと(generation_countが割り切れる世代)にだけConnectionsを登録する
+# (Noneなら毎世代。LazyCSRNetworkは登録しない世代に全ての辺の揮発を計算せずに済む)
+def run_simulation(params: Params, network_class: type = Network, keyframe_interval: int | None = None, storage: Callable[[], StorageBackend] = default_storage, trace_dir: str | None = None, topology: TopologyHandle | None = None, topology_library: TopologyLibrary | None = None, commit_interval: int | None = None, commit_rows: int | None = None, resume_simulation_id: int | None = None,
+                   volitile_pheromone: Callable[[Any, Params], None] | None = None, prepare_network: Callable[[Any, Params], None] | None = None, move_ants: Callable[[Simulation, int, int, BottleneckHistogram], None] = move_ant,
+                   connections_interval: int | None = None):
+    if connections_interval is not None and connections_interval < 1:
+        raise ValueError(f"connections_interval must be at least 1: {connections_interval}")
     try:
-        # DBLoggerインスタンス作成
-        dblogger = DBLogger("asaken_n40", "asaken_N40",
-                            "localhost", "simulation", "5432")
+        # ストレージバックエンドのインスタンス作成(既定はPostgreSQLのDBLogger)
+        dblogger = storage()
 
         dblogger.connect()
 
-        # パラメータを登録&パラメータIDを取得
-        params.id = dblogger.insert_conflict(
-            params.generate_insert_or_return_id_query())
+        # パラメータを登録&パラメータIDを取得(ParameterRegistryで登録済みならそのIDを使う)
         if params.id is None:
-            params.id: int = dblogger.fetch_result(
-                params.generate_select_query())[0][0]
+            params.id = dblogger.register_params(params)
+        else:
+            dblogger.use_params(params)
         print(f"params.id: {params.id}", end="\n\n")
 
         # Simulationインスタンス作成
-        simulation = Simulation(dblogger, params)
-
-        # シミュレーションを登録&シミュレーションIDを取得
-        simulation.id = dblogger.insert_and_get_id(
-            simulation.generate_insert_query())
+        simulation = Simulation(dblogger, params, network_class)
 
-        # 任意の個数ノードインスタンスを作成
-        simulation.network.yield_nodes(params)
+        if resume_simulation_id is not None:
+            # 中断したシミュレーションのチェックポイントを読み込み、開始時のrandomの状態に戻す
+            checkpoint = load_checkpoint(dblogger, resume_simulation_id)
+            simulation.id = resume_simulation_id
+            random.setstate(checkpoint.initial_random_state)
+        else:
+            # シミュレーションを登録&シミュレーションIDを取得
+            simulation.id = dblogger.register_simulation(params.id)
+
+        # シミュレーション開始時のrandomの状態(再開時にトポロジーを作り直すために保存する)
+        initial_random_state = random.getstate()
+
+        if topology is not None:
+            # 親プロセスが共有メモリに置いたトポロジー(最適ルート作成済み)を使う(CSRNetworkのみ)
+            simulation.network.attach_topology(topology, params)
+        elif topology_library is not None:
+            # ライブラリのトポロジー(最適ルート作成済み)を使う(なければ作成して保存)
+            simulation.network.use_topology(topology_library.get(
+                params.num_nodes, 3, params.optimal_route_length, random.getrandbits(64)), params)
+        else:
+            # 任意の個数ノードインスタンスを作成
+            simulation.network.yield_nodes(params)
 
-        # BAモデルになるようにノードを接続
-        simulation.network.make_ba_model(params, 3)
+            # BAモデルになるようにノードを接続
+            simulation.network.make_ba_model(params, 3)
 
-        # Nodeを登録&NodeIDを取得
-        for node in simulation.network.nodes:
-            node.id = dblogger.insert_and_get_id(
-                node.generate_insert_query(simulation.id))
+        # Nodeを登録&NodeIDを取得(IDはまとめて予約し、行はCOPYで登録する)
+        # 再開時は登録済みのNodeIDを使う
+        if resume_simulation_id is not None:
+            simulation.network.assign_node_ids(checkpoint.node_ids)
+        else:
+            dblogger.insert_nodes(simulation.id, simulation.network)
             
         # 最適ルートを作成
-        simulation.network.make_optimal_route(params)
+        if topology is None and topology_library is None:
+            simulation.network.make_optimal_route(params)
+
+        # 方式ごとのネットワークの準備(フェロモンの初期値・揮発率など)
+        if prepare_network is not None:
+            prepare_network(simulation.network, params)
+
+        if resume_simulation_id is not None:
+            # チェックポイントの世代から再開
+            generation_ids = checkpoint.generation_ids
+            histogram = checkpoint.histogram
+            encoder = checkpoint.encoder
+            simulation.network.set_pheromone_state(checkpoint.pheromone)
+            random.setstate(checkpoint.random_state)
+            start_generation = checkpoint.generation_count
+        else:
+            # 全てのGenerationを先に登録&GenerationIDを取得
+            generation_ids = dblogger.insert_generations(
+                simulation.id, params.generation_limit)
+
+            # 世代ごとのボトルネックの回数を数える
+            histogram = BottleneckHistogram()
+
+            # keyframe_intervalを指定した場合はConnectionsを差分で登録する
+            encoder = ConnectionDeltaEncoder(
+                keyframe_interval) if keyframe_interval is not None else None
+
+            start_generation = 0
+
+        # commit_interval世代ごと(またはcommit_rows行ごと)にcommitしてチェックポイントを保存する
+        periodic = PeriodicCommit(dblogger, simulation.id, initial_random_state, generation_ids,
+                                  commit_interval, commit_rows, resume_simulation_id is not None)
+        if periodic.enabled and resume_simulation_id is None:
+            periodic.save(0, simulation.network, histogram, encoder)
+
+        # trace_dirを指定した場合は世代ごとのフェロモンをバイナリファイルにも書き出す(再開時は続きから書く)
+        trace_path = f"{trace_dir}/simulation_{simulation.id}.trace"
+        if trace_dir is None:
+            trace = None
+        elif resume_simulation_id is not None:
+            trace = PheromoneTrace(trace_path, mode="r+")
+        else:
+            trace = PheromoneTrace.create(
+                trace_path, simulation.network.connections(), params.generation_limit, simulation.id)
 
         # 任意の回数Generationを繰り返す
-        for generation_count in range(params.generation_limit):
+        for generation_count in range(start_generation, params.generation_limit):
             print(f"-------- Generation: {generation_count} --------")
 
-            # Genaerationを登録&GenerationIDを取得
-            generation_id = dblogger.insert_and_get_id(
-                f'INSERT INTO generations (simulationid, generation_count) VALUES ({simulation.id},{generation_count});')
-
-            # Connectionsを登録
-            for startnode in simulation.network.nodes:
-                for endnode, link in startnode.neighbors.items():
-                    dblogger.insert_and_get_id(
-                        f'INSERT INTO connections (GenerationID, StartNodeID, EndNodeID, Pheromone, Width) VALUES ({generation_id},{startnode.id},{endnode.id},{link.pheromone},{link.width});')
-
-            # antとinterestの生成
-            simulation.ant = Ant(
-                simulation.network.start_node, simulation.network.end_node)
+            generation_id = generation_ids[generation_count]
+
+            # Connectionsを登録(まとめてCOPYする)
+            # 差分で登録する場合は前に登録した世代との差分になる
+            log_connections = connections_interval is None or generation_count % connections_interval == 0
+            connection_rows = 0
+            if log_connections or trace is not None:
+                connections = simulation.network.connections()
+                if trace is not None:
+                    trace.write(generation_count, connections[2])
+            if log_connections:
+                if encoder is not None:
+                    connections, is_keyframe = encoder.encode(connections)
+                    if is_keyframe:
+                        dblogger.insert_keyframe(generation_id)
+                dblogger.add_connections(generation_id, connections)
+                connection_rows = len(connections[0])
+
+            # antの移動・フェロモン付加・登録
+            move_ants(simulation, generation_id, generation_count, histogram)
+
+            # interestの生成と移動
             simulation.interest = Interest(
                 simulation.network.start_node, simulation.network.end_node)
-
-            # antの移動
-            simulation.ant.hop_if_movable(params)
-
-            # 目的地に到達していたらフェロモン付加
-            if simulation.ant.is_at_destination():
-                simulation.network.add_pheromone_to_ant_route(simulation.ant)
-
-            # antの結果を登録
-            dblogger.execute_query(
-                simulation.ant.get_insert_query(generation_id))
-
-            # antをNoneにして消去
-            simulation.ant = None
-
-            # interestの移動
             simulation.interest.hop_if_movable(params)
 
             # interestの結果を登録
-            dblogger.execute_query(
-                simulation.interest.get_insert_query(generation_id))
+            dblogger.insert_packet(
+                "Interests", generation_id, simulation.interest)
+            histogram.add("Interests", generation_count, simulation.interest)
 
             # interestをNoneにして消去
             simulation.interest = None
 
             # フェロモン揮発
-            simulation.network.volitile_pheromone(params)
+            if volitile_pheromone is None:
+                simulation.network.volitile_pheromone(params)
+            else:
+                volitile_pheromone(simulation.network, params)
 
+            # この世代の行数(Connections, Ants, Interests)を数え、必要ならcommit
+            periodic.end_generation(generation_count, connection_rows + 2,
+                                    simulation.network, histogram, encoder)
+
+        # ボトルネックの回数をParameterIDごとの合計に加算
+        dblogger.add_bottleneck_histogram(params.id, histogram)
+
+        periodic.finish()
         dblogger.commit()
 
+        if trace is not None:
+            trace.flush()
+
+        # シミュレーションIDを返す(失敗した場合はNone)
+        return simulation.id
+
     except Exception as e:
         print(e)
         dblogger.rollback()
         print(traceback.format_exc())
 
     finally:
-        # debug
-        # for node in simulation.network.nodes:
-        #     node.show_info()
-
         dblogger.close()
 
 
+# 通常ACO(一定の揮発率)
+# 引数はrun_simulationと同じ
+def main(params: Params, network_class: type = Network, **kwargs: Any):
+    return run_simulation(params, network_class, **kwargs)
+
+
 if __name__ == "__main__":
     # パラメータを設定
     params = Params(num_nodes=100,
@@ -515,8 +920,8 @@ if __name__ == "__main__":
                     generation_limit=100,
                     simulation_count=1)
 
-    with Pool() as p:
-        p.map(main, [params] * params.simulation_count)
+    # params.simulation_count回の複製を並列に実行(シードはbase_seedから決まるので再現できる)
+    run_sweep(main, [params], params.simulation_count, storage=async_default_storage, registry=ParameterRegistry(default_storage))
 
     # for _ in range(params.simulation_count):
     #     main(params)
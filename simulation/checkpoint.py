@@ -0,0 +1,75 @@
+# 定期的なcommitとチェックポイント(中断したシミュレーションの再開)
+# commit_interval世代ごと、またはcommit_rows行ごとにcommitし、同じトランザクションでチェックポイントを
+# Checkpointsテーブルに保存する(commitした行とチェックポイントは常に同じ世代まで)
+# 例外やプロセスの強制終了で中断した場合は、mainのresume_simulation_idにシミュレーションIDを渡すと
+# 最後にcommitした世代から再開する(それ以降の行はrollbackされているので重複しない)
+#
+# 再開時はシミュレーション開始時のrandomの状態に戻してトポロジーを同じ手順で作り直し、
+# NodeID, GenerationIDは保存したものを使い、フェロモン・randomの状態などをチェックポイントの値に戻す
+# (トポロジーの引数(topology, topology_libraryなど)は中断前と同じものを渡すこと)
+import pickle
+import random
+from typing import Any, NamedTuple
+import numpy as np
+
+
+class Checkpoint(NamedTuple):
+    generation_count: int  # 次に実行する世代
+    initial_random_state: tuple  # シミュレーション開始時のrandomの状態(トポロジーの作り直し用)
+    random_state: tuple  # generation_count世代目の開始時のrandomの状態
+    node_ids: list[int]
+    generation_ids: list[int]
+    pheromone: np.ndarray  # network.pheromone_state()
+    histogram: Any  # BottleneckHistogram
+    encoder: Any  # ConnectionDeltaEncoder(Connectionsを差分で登録しない場合はNone)
+
+
+class PeriodicCommit:
+    # commit_interval, commit_rowsがどちらもNoneなら何もしない(最後に1回だけcommitする)
+    # resumed=Trueはチェックポイントから再開したシミュレーション
+    def __init__(self, dblogger: Any, simulation_id: int, initial_random_state: tuple, generation_ids: list[int],
+                 commit_interval: int | None = None, commit_rows: int | None = None, resumed: bool = False) -> None:
+        self.dblogger = dblogger
+        self.simulation_id = simulation_id
+        self.initial_random_state = initial_random_state
+        self.generation_ids = generation_ids
+        self.commit_interval = commit_interval
+        self.commit_rows = commit_rows
+        self.resumed = resumed
+        # 前回のcommitからの世代数・行数
+        self.generations = 0
+        self.rows = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.commit_interval is not None or self.commit_rows is not None
+
+    # generation_count世代目の開始時点のチェックポイントを保存してcommitする
+    def save(self, generation_count: int, network: Any, histogram: Any, encoder: Any) -> None:
+        checkpoint = Checkpoint(generation_count, self.initial_random_state, random.getstate(),
+                                [node.id for node in network.nodes], self.generation_ids,
+                                network.pheromone_state(), histogram, encoder)
+        self.dblogger.save_checkpoint(self.simulation_id, generation_count,
+                                      pickle.dumps(checkpoint, pickle.HIGHEST_PROTOCOL))
+        self.dblogger.commit()
+        self.generations = 0
+        self.rows = 0
+
+    # generation_count世代目の終わりに呼ぶ(rowsはその世代に登録した行数)
+    def end_generation(self, generation_count: int, rows: int, network: Any, histogram: Any, encoder: Any) -> None:
+        if not self.enabled:
+            return
+        self.generations += 1
+        self.rows += rows
+        if (self.commit_interval is not None and self.generations >= self.commit_interval) or \
+                (self.commit_rows is not None and self.rows >= self.commit_rows):
+            self.save(generation_count + 1, network, histogram, encoder)
+
+    # 最後まで実行したシミュレーションのチェックポイントを削除する(この後のcommitで確定)
+    def finish(self) -> None:
+        if self.enabled or self.resumed:
+            self.dblogger.delete_checkpoint(self.simulation_id)
+
+
+def load_checkpoint(dblogger: Any, simulation_id: int) -> Checkpoint:
+    return pickle.loads(dblogger.load_checkpoint(simulation_id))
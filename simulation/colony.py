@@ -0,0 +1,178 @@
+# コロニー方式
+# 1世代あたりcolony_size匹のantを同時に出し、配列上で全antを1ホップずつ進める
+# 状態はant数分の配列(現在ノード, 訪問済みノード, ボトルネック, 生存フラグ)で持ち、
+# 全antが止まった後に目的地に到達したantの経路へまとめてフェロモンを加算する
+# ネットワークはCSRNetworkを使う
+import random
+from functools import partial
+import numpy as np
+from sweep import run_sweep
+from parameter_registry import ParameterRegistry
+from typing import Any
+from base import Params, Ant, Simulation, default_storage, async_default_storage, run_simulation
+from histogram import BottleneckHistogram
+from csr import CSRNetwork, CSRNode
+
+
+class Colony:
+    def __init__(self, network: CSRNetwork, size: int, max_hops: int, seed: int | None = None) -> None:
+        # route_edgesは1ホップ以上の経路を持つ前提なので、ホップ数の上限(params.ttl)は1以上
+        if max_hops < 1:
+            raise ValueError(f"max_hops must be at least 1: {max_hops}")
+        # seedを省略した場合はrandomモジュールから生成する(random.seedで再現可能)
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.network = network
+        self.size = size
+        self.max_hops = max_hops
+        self.rng = np.random.default_rng(seed)
+        self.source: int = network.start_node.index
+        self.destination: int = network.end_node.index
+
+        self.current = np.full(size, self.source, dtype=np.int64)  # 現在ノード
+        self.alive = np.ones(size, dtype=bool)  # まだ移動できるか
+        self.arrived = np.zeros(size, dtype=bool)  # 目的地に到達したか
+        self.bottleneck = np.full(size, 2**8, dtype=np.int64)  # 経路のボトルネック
+        self.hops = np.zeros(size, dtype=np.int64)  # ホップ数
+        self.route = np.full((size, max_hops + 1), -1, dtype=np.int64)  # 経路のノード
+        self.route[:, 0] = self.source
+        self.route_edges = np.full((size, max_hops), -1, dtype=np.int64)  # 経路の有向辺
+        # 訪問済みノードのビット列(antごとにnum_nodesビット)
+        self.visited = np.zeros((size, (network.num_nodes + 7) // 8), dtype=np.uint8)
+        self.visit(np.arange(size), self.current)
+
+    def visit(self, ants: np.ndarray, nodes: np.ndarray) -> None:
+        self.visited[ants, nodes >> 3] |= (1 << (nodes & 7)).astype(np.uint8)
+
+    def is_visited(self, ants: np.ndarray, nodes: np.ndarray) -> np.ndarray:
+        return ((self.visited[ants, nodes >> 3] >> (nodes & 7)) & 1).astype(bool)
+
+    def step(self, bata: int) -> None:
+        # 生存している全antを1ホップ進める(Ant.hopと同じ規則)
+        ants = np.flatnonzero(self.alive)
+        if len(ants) == 0:
+            return
+        network = self.network
+        current = self.current[ants]
+        begin = network.offsets[current]
+        degree = network.offsets[current + 1] - begin
+
+        # (ant, 隣接ノード)の組を1次元に並べる
+        seg_end = np.cumsum(degree)
+        seg_begin = seg_end - degree
+        pair_ant = np.repeat(np.arange(len(ants)), degree)
+        pair_edge = np.arange(seg_end[-1]) - np.repeat(seg_begin - begin, degree)
+        candidate = network.neighbor_ids[pair_edge].astype(np.int64)
+        unvisited = ~self.is_visited(ants[pair_ant], candidate)
+
+        # 重みは未訪問ノードだけwidth ** bata * pheromone、訪問済みは0
+        weights = (network.width[pair_edge].astype(np.float64) ** bata) * \
+            network.read_pheromone(pair_edge) * unvisited
+        cum_weights = np.cumsum(weights)
+        seg_offset = np.where(seg_begin > 0, cum_weights[seg_begin - 1], 0.0)
+        seg_total = cum_weights[seg_end - 1] - seg_offset
+
+        # 各antの区間内で重み付き乱択(重み0の組は選ばれない)
+        target = seg_offset + self.rng.random(len(ants)) * seg_total
+        chosen = np.minimum(np.searchsorted(cum_weights, target, side="right"), seg_end - 1)
+        last_positive = np.maximum.accumulate(np.where(weights > 0, np.arange(len(weights)), -1))
+        chosen = last_positive[chosen]
+        movable = chosen >= seg_begin
+
+        # 隣接ノードにdestinationがあればそこへ移動
+        is_destination = np.flatnonzero(candidate == self.destination)
+        chosen[pair_ant[is_destination]] = is_destination
+        movable[pair_ant[is_destination]] = True
+
+        # 移動できないantを止める
+        self.alive[ants[~movable]] = False
+        ants = ants[movable]
+        chosen = chosen[movable]
+
+        edge = pair_edge[chosen]
+        next_node = candidate[chosen]
+        self.route_edges[ants, self.hops[ants]] = edge
+        self.hops[ants] += 1
+        self.route[ants, self.hops[ants]] = next_node
+        self.bottleneck[ants] = np.minimum(self.bottleneck[ants], network.width[edge])
+        self.current[ants] = next_node
+        self.visit(ants, next_node)
+
+        # 目的地に到達したantとホップ数の上限に達したantを止める
+        arrived = next_node == self.destination
+        self.arrived[ants[arrived]] = True
+        self.alive[ants[arrived | (self.hops[ants] >= self.max_hops)]] = False
+
+    def run(self, bata: int) -> None:
+        while self.alive.any():
+            self.step(bata)
+
+    def add_pheromone(self) -> None:
+        # 目的地に到達したantの経路にボトルネック分のフェロモンをまとめて加算する
+        mask = (self.route_edges >= 0) & self.arrived[:, None]
+        edges = self.route_edges[mask]
+        amounts = np.broadcast_to(self.bottleneck[:, None], mask.shape)[mask]
+        edges, inverse = np.unique(edges, return_inverse=True)
+        added = np.bincount(inverse, weights=amounts, minlength=len(edges)).astype(np.int64)
+        self.network.write_pheromone(
+            edges, self.network.read_pheromone(edges) + added)
+
+    def best(self) -> int:
+        # 目的地に到達したantの中でボトルネックが最大のant(いなければ0番目)
+        if not self.arrived.any():
+            return 0
+        return int(np.argmax(np.where(self.arrived, self.bottleneck, -1)))
+
+    def to_ant(self, i: int) -> Ant:
+        # i番目のantをAntとして取り出す(DBへの登録用)
+        ant = Ant(self.network.start_node, self.network.end_node)
+        route = self.route[i, :self.hops[i] + 1].tolist()
+        ant.route = [CSRNode(self.network, j) for j in route]
+        ant.visited = set(ant.route)
+        ant.route_width = self.network.width[self.route_edges[i, :self.hops[i]]].tolist()
+        ant.route_bottoleneck = int(self.bottleneck[i])
+        ant.current_node = ant.route[-1]
+        ant.movable = False
+        return ant
+
+
+# colony_size匹のantを同時に移動させて登録する(base.run_simulationのmove_ants)
+def move_colony(colony_size: int, simulation: Simulation, generation_id: int, generation_count: int, histogram: BottleneckHistogram) -> None:
+    # ホップ数の上限はparams.ttl
+    colony = Colony(simulation.network, colony_size, simulation.params.ttl)
+    colony.run(simulation.params.bata)
+
+    # 目的地に到達したantの経路にまとめてフェロモン付加
+    colony.add_pheromone()
+
+    # Antsテーブルは1世代1行なので、ボトルネックが最大のantの結果を登録
+    simulation.ant = colony.to_ant(colony.best())
+    simulation.logger.insert_packet(
+        "Ants", generation_id, simulation.ant)
+    # ヒストグラムには全antのボトルネックを数える
+    # base.move_antと同じく目的地に到達しなかったantも数える(移動できなかったantは2**8)
+    histogram.add_bottlenecks("Ants", generation_count, colony.bottleneck)
+
+    # antをNoneにして消去
+    simulation.ant = None
+
+
+# antの移動以外はbase.mainと同じ(引数はbase.run_simulationと同じ、ネットワークはCSRNetwork)
+def main(params: Params, colony_size: int, **kwargs: Any):
+    return run_simulation(params, CSRNetwork, move_ants=partial(move_colony, colony_size), **kwargs)
+
+
+if __name__ == "__main__":
+    # パラメータを設定
+    params = Params(num_nodes=100,
+                    optimal_route_length=6,
+                    volatility=0.99,
+                    pheromone_min=100,
+                    pheromone_max=2**20,
+                    ttl=100,
+                    bata=1,
+                    generation_limit=100,
+                    simulation_count=1)
+
+    # params.simulation_count回の複製を並列に実行(シードはbase_seedから決まるので再現できる)
+    run_sweep(main, [params], params.simulation_count, storage=async_default_storage, registry=ParameterRegistry(default_storage), colony_size=100)
@@ -0,0 +1,449 @@
+# CSR(Compressed Sparse Row)形式の配列でグラフを保持するNetwork
+# Node/Linkオブジェクトを辺ごとに作らず、隣接情報を以下の配列で持つ
+#   offsets[i]:offsets[i + 1] -> ノードiの隣接ノードが格納されている範囲
+#   neighbor_ids              -> 隣接ノードのインデックス(各ノード内で昇順)
+#   width, pheromone          -> 有向辺ごとのwidthとフェロモン
+# Ant, Interest, Randからは従来のNode/Linkと同じように見えるようにビューを返す
+from typing import Iterator, Mapping, Sequence, Any
+import random
+import numpy as np
+from sweep import run_sweep
+from parameter_registry import ParameterRegistry
+from base import Params, Ant, NextHopSampler, main, generate_ba_edges, default_storage, async_default_storage
+from evaporation import evaporate_constant, evaporate_elapsed, evaporation_changes
+from shared_topology import TopologyHandle, attach
+
+
+class CSRLink:
+    # 有向辺1本分のビュー(値は配列側に保持される)
+    __slots__ = ("network", "edge")
+
+    def __init__(self, network: "CSRNetwork", edge: int) -> None:
+        self.network = network
+        self.edge = edge
+
+    @property
+    def width(self) -> int:
+        return int(self.network.width[self.edge])
+
+    @width.setter
+    def width(self, value: int) -> None:
+        self.network.width[self.edge] = value
+        self.network.touch_edges(np.array([self.edge]))
+
+    @property
+    def pheromone(self) -> int:
+        return int(self.network.read_pheromone(np.array([self.edge]))[0])
+
+    @pheromone.setter
+    def pheromone(self, value: int) -> None:
+        self.network.write_pheromone(np.array([self.edge]), np.array([value]))
+
+
+class CSRNeighbors(Mapping):
+    # Node.neighbors(dict[Node, Link])の代わりになる読み取り専用ビュー
+    __slots__ = ("network", "index")
+
+    def __init__(self, network: "CSRNetwork", index: int) -> None:
+        self.network = network
+        self.index = index
+
+    def __getitem__(self, node: "CSRNode") -> CSRLink:
+        edge = self.network.edge_index(self.index, node.index)
+        if edge < 0:
+            raise KeyError(node)
+        return CSRLink(self.network, edge)
+
+    def __contains__(self, node: object) -> bool:
+        if not isinstance(node, CSRNode) or node.network is not self.network:
+            return False
+        return self.network.edge_index(self.index, node.index) >= 0
+
+    def __iter__(self) -> Iterator["CSRNode"]:
+        start, end = self.network.edge_range(self.index)
+        for j in self.network.neighbor_ids[start:end].tolist():
+            yield CSRNode(self.network, j)
+
+    def __len__(self) -> int:
+        return self.network.degree(self.index)
+
+    def items(self) -> Iterator[tuple["CSRNode", CSRLink]]:
+        start, end = self.network.edge_range(self.index)
+        for edge, j in enumerate(self.network.neighbor_ids[start:end].tolist(), start):
+            yield CSRNode(self.network, j), CSRLink(self.network, edge)
+
+    def values(self) -> Iterator[CSRLink]:
+        start, end = self.network.edge_range(self.index)
+        for edge in range(start, end):
+            yield CSRLink(self.network, edge)
+
+
+class CSRNode:
+    # ノード1つ分のビュー(インデックスで同一性を判定する)
+    __slots__ = ("network", "index")
+
+    def __init__(self, network: "CSRNetwork", index: int) -> None:
+        self.network = network
+        self.index = index
+
+    # DBに登録したNodeID(未登録ならNone)
+    @property
+    def id(self) -> int | None:
+        node_id = int(self.network.node_ids[self.index])
+        return None if node_id < 0 else node_id
+
+    @id.setter
+    def id(self, value: int | None) -> None:
+        self.network.node_ids[self.index] = -1 if value is None else value
+
+    @property
+    def neighbors(self) -> CSRNeighbors:
+        return CSRNeighbors(self.network, self.index)
+
+    def next_hop_sampler(self, bata: int) -> NextHopSampler:
+        return self.network.next_hop_sampler(self.index, bata)
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, CSRNode) and other.network is self.network and other.index == self.index
+
+    def __hash__(self) -> int:
+        return self.index
+
+
+class CSRNodeList(Sequence):
+    # Network.nodesの代わりになるビュー(ノードオブジェクトは必要な時だけ作る)
+    __slots__ = ("network",)
+
+    def __init__(self, network: "CSRNetwork") -> None:
+        self.network = network
+
+    def __getitem__(self, index: Any) -> Any:
+        if isinstance(index, slice):
+            return [CSRNode(self.network, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return CSRNode(self.network, index)
+
+    def __len__(self) -> int:
+        return self.network.num_nodes
+
+
+class CSRNetwork:
+    def __init__(self) -> None:
+        self.num_nodes: int = 0
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.neighbor_ids = np.zeros(0, dtype=np.int32)
+        self.width = np.zeros(0, dtype=np.int32)
+        self.pheromone = np.zeros(0, dtype=np.int64)
+        self.node_ids = np.zeros(0, dtype=np.int64)
+        # ノードごとのLinkの更新回数と、Ant.hopで使うサンプラーのキャッシュ
+        # キャッシュは(作成時のnode_version, サンプラー)で、バージョンが変わっていたら作り直す
+        self.node_version = np.zeros(0, dtype=np.int64)
+        self.samplers: dict[int, tuple[int, NextHopSampler]] = {}
+        self.nodes = CSRNodeList(self)
+        self.start_node: CSRNode | None = None
+        self.end_node: CSRNode | None = None
+        self.optimal_route: list[CSRNode] | None = None
+
+    @property
+    def num_edges(self) -> int:
+        # 有向辺の本数(無向辺の2倍)
+        return len(self.neighbor_ids)
+
+    def edge_range(self, index: int) -> tuple[int, int]:
+        return int(self.offsets[index]), int(self.offsets[index + 1])
+
+    def degree(self, index: int) -> int:
+        return int(self.offsets[index + 1] - self.offsets[index])
+
+    def edge_degree(self) -> np.ndarray:
+        # 各有向辺の始点ノードの次数
+        degree = np.diff(self.offsets)
+        return np.repeat(degree, degree)
+
+    def edge_index(self, source: int, target: int) -> int:
+        # source -> targetの有向辺のインデックス(存在しなければ-1)
+        start, end = self.edge_range(source)
+        pos = start + int(np.searchsorted(self.neighbor_ids[start:end], target))
+        if pos < end and self.neighbor_ids[pos] == target:
+            return pos
+        return -1
+
+    def touch_edges(self, edges: np.ndarray) -> None:
+        # 指定した有向辺の始点ノードのバージョンを進め、キャッシュしたサンプラーを無効にする
+        sources = np.searchsorted(self.offsets, edges, side="right") - 1
+        self.node_version[np.unique(sources)] += 1
+
+    def touch_changed(self, before: np.ndarray) -> None:
+        # beforeから値が変わった有向辺だけtouch_edgesする
+        self.touch_edges(np.flatnonzero(before != self.pheromone))
+
+    # 有向辺edgesの現在のフェロモン
+    def read_pheromone(self, edges: np.ndarray) -> np.ndarray:
+        return self.pheromone[edges]
+
+    # 有向辺edgesのフェロモンをvaluesにする
+    def write_pheromone(self, edges: np.ndarray, values: np.ndarray) -> None:
+        self.pheromone[edges] = values
+        self.touch_edges(edges)
+
+    # 全ての有向辺の現在のフェロモン(ログ出力用のコピー)
+    def pheromone_snapshot(self) -> np.ndarray:
+        return self.pheromone.copy()
+
+    def next_hop_sampler(self, index: int, bata: int) -> NextHopSampler:
+        version = int(self.node_version[index])
+        cached = self.samplers.get(index)
+        if cached is not None and cached[0] == version and cached[1].bata == bata:
+            return cached[1]
+        start, end = self.edge_range(index)
+        weights = (self.width[start:end].astype(np.float64) ** bata) * \
+            self.read_pheromone(np.arange(start, end))
+        sampler = NextHopSampler(
+            [CSRNode(self, j) for j in self.neighbor_ids[start:end].tolist()], weights.tolist(), bata)
+        self.samplers[index] = (version, sampler)
+        return sampler
+
+    def yield_nodes(self, params: Params) -> None:
+        self.num_nodes = params.num_nodes
+        self.offsets = np.zeros(params.num_nodes + 1, dtype=np.int64)
+        self.node_ids = np.full(params.num_nodes, -1, dtype=np.int64)
+
+    def build_from_edges(self, sources: np.ndarray, targets: np.ndarray, widths: np.ndarray, pheromone: int) -> None:
+        # 無向辺のリストから両方向の有向辺を作りCSR配列を構築
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        widths = np.asarray(widths, dtype=np.int32)
+        src = np.concatenate([sources, targets])
+        dst = np.concatenate([targets, sources])
+        order = np.lexsort((dst, src))
+        self.neighbor_ids = dst[order].astype(np.int32)
+        self.width = np.concatenate([widths, widths])[order]
+        self.pheromone = np.full(len(order), pheromone, dtype=np.int64)
+        counts = np.bincount(src, minlength=self.num_nodes)
+        self.offsets = np.zeros(self.num_nodes + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.offsets[1:])
+        self.node_version = np.zeros(self.num_nodes, dtype=np.int64)
+        self.samplers = {}
+
+    def use_topology(self, topology: dict[str, Any], params: Params) -> None:
+        # 作成済みのトポロジー(topology_library.TOPOLOGY_FIELDSの辞書)を使う
+        # offsets, neighbor_ids, widthは渡された配列をそのまま使い、フェロモンなどはこのネットワークで持つ
+        self.num_nodes = int(topology["num_nodes"])
+        self.offsets = topology["offsets"]
+        self.neighbor_ids = topology["neighbor_ids"]
+        self.width = topology["width"]
+        self.pheromone = np.full(
+            self.num_edges, params.pheromone_min, dtype=np.int64)
+        self.node_ids = np.full(self.num_nodes, -1, dtype=np.int64)
+        self.node_version = np.zeros(self.num_nodes, dtype=np.int64)
+        self.samplers = {}
+        self.start_node = CSRNode(self, int(topology["start"]))
+        self.end_node = CSRNode(self, int(topology["end"]))
+        self.optimal_route = [CSRNode(self, int(i)) for i in topology["optimal_route"]]
+
+    def attach_topology(self, handle: TopologyHandle, params: Params) -> None:
+        # 親プロセスが共有メモリに置いたトポロジー(最適ルート作成済み)を使う
+        # offsets, neighbor_ids, widthは共有メモリ上の読み取り専用の配列
+        self.use_topology({"num_nodes": handle.num_nodes, **attach(handle), "start": handle.start,
+                           "end": handle.end, "optimal_route": handle.optimal_route}, params)
+
+    # トポロジー(topology_library.TOPOLOGY_FIELDSの辞書)を返す
+    def export_topology(self) -> dict[str, Any]:
+        return {"num_nodes": self.num_nodes, "offsets": self.offsets, "neighbor_ids": self.neighbor_ids, "width": self.width,
+                "start": self.start_node.index, "end": self.end_node.index,
+                "optimal_route": np.array([node.index for node in self.optimal_route], dtype=np.int64)}
+
+    def make_ba_model(self, params: Params, edge_num: int, seed: int | None = None) -> None:
+        # Network.make_ba_modelと同じ辺を生成し、そのままCSR配列にする
+        if seed is None:
+            seed = random.getrandbits(64)
+        sources, targets, widths = generate_ba_edges(
+            params.num_nodes, edge_num, seed)
+        self.build_from_edges(sources, targets, widths, params.pheromone_min)
+
+    def make_optimal_route(self, params: Params) -> None:
+        # 最適ルートを作成(Network.make_optimal_routeと同じ手順)
+        self.start_node = random.choice(self.nodes)
+        self.end_node = self.start_node
+        optimal_route = [self.start_node]
+        for _ in range(params.optimal_route_length):
+            unvisited_nodes = [
+                node for node in self.end_node.neighbors.keys() if node not in optimal_route]
+            self.end_node = random.choice(unvisited_nodes)
+            optimal_route.append(self.end_node)
+        # 最適経路のnode間のLinkのwidthを100にする
+        edges = self.route_edges(optimal_route)
+        self.width[edges] = 100
+        self.touch_edges(edges)
+        self.optimal_route = optimal_route
+
+    def route_edges(self, route: list[CSRNode]) -> np.ndarray:
+        # 経路上の有向辺のインデックス配列
+        return np.array([self.edge_index(route[i].index, route[i + 1].index)
+                         for i in range(len(route) - 1)], dtype=np.int64)
+
+    def assign_node_ids(self, node_ids: list[int]) -> None:
+        self.node_ids[:] = node_ids
+
+    def degrees(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def connections(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        # 全ての有向辺の(始点NodeID, 終点NodeID, フェロモン, width)を列ごとの配列で返す
+        # 並び順は有向辺のインデックス順(始点ノード順、各ノード内は終点ノード順)
+        start_ids = np.repeat(self.node_ids, np.diff(self.offsets))
+        end_ids = self.node_ids[self.neighbor_ids]
+        return start_ids, end_ids, self.pheromone_snapshot(), self.width.copy()
+
+    # フェロモンの状態(チェックポイント用)
+    def pheromone_state(self) -> np.ndarray:
+        return self.pheromone.copy()
+
+    # pheromone_state()の値に戻す(チェックポイントからの再開用)
+    def set_pheromone_state(self, state: np.ndarray) -> None:
+        self.pheromone[:] = state
+        self.touch_edges(np.arange(self.num_edges))
+
+    def add_pheromone_to_ant_route(self, ant: Ant) -> None:
+        # antの辿った経路のフェロモン値にant.route_bottoleneck分を加算する
+        # 経路は同じノードを通らないので同じ有向辺も含まない
+        edges = self.route_edges(ant.route)
+        self.write_pheromone(edges, self.read_pheromone(
+            edges) + ant.route_bottoleneck)
+
+    def volitile_pheromone(self, params: Params) -> None:
+        # 全ての有向辺のフェロモンを一括で揮発(×params.volatility)させる
+        before = self.pheromone.copy()
+        evaporate_constant(self.pheromone, params.volatility,
+                           params.pheromone_min, params.pheromone_max)
+        self.touch_changed(before)
+
+
+class LazyCSRNetwork(CSRNetwork):
+    # フェロモンの揮発を読み出し時にまとめて計算するCSRNetwork
+    # 有向辺ごとに最後に値を書き込んだ世代pheromone_stampを持ち、
+    # 読み出し時に経過世代数分の揮発をevaporate_elapsedで一度に適用する
+    # volitile_pheromoneは世代を進めるだけなので、1世代のコストは経路長に比例する
+    # (Connectionsを毎世代登録すると全ての辺を読み出すので、run_simulationのconnections_intervalで間引く)
+    # 揮発の方式はset_decay(rate, floor, ceiling)で指定する(rate, floorは辺ごとの配列でもよい)
+    # 既定はCSRNetwork.volitile_pheromoneと同じ一定の揮発率で、他の方式はmainのprepare_networkでset_decayする
+    def __init__(self) -> None:
+        super().__init__()
+        self.generation: int = 0  # volitile_pheromoneを呼んだ回数
+        self.pheromone_stamp = np.zeros(0, dtype=np.int64)
+        self.decay_rate = np.zeros(0, dtype=np.float64)
+        self.decay_floor = np.zeros(0, dtype=np.float64)
+        self.decay_ceiling: int = 0
+        # この世代のあいだだけ使えるサンプラーのノード(揮発で隣接辺のフェロモンが変わるもの)
+        self.unsettled: set[int] = set()
+
+    def build_from_edges(self, sources: np.ndarray, targets: np.ndarray, widths: np.ndarray, pheromone: int) -> None:
+        super().build_from_edges(sources, targets, widths, pheromone)
+        self.pheromone_stamp = np.zeros(self.num_edges, dtype=np.int64)
+
+    def set_decay(self, rate, floor, ceiling: int) -> None:
+        # 揮発方式を変える前に現在の値を確定させる
+        self.materialize_pheromone()
+        self.decay_rate = np.broadcast_to(np.asarray(rate, dtype=np.float64), (self.num_edges,)).copy()
+        self.decay_floor = np.broadcast_to(np.asarray(floor, dtype=np.float64), (self.num_edges,)).copy()
+        self.decay_ceiling = ceiling
+        self.samplers = {}
+        self.unsettled = set()
+
+    def make_optimal_route(self, params: Params) -> None:
+        super().make_optimal_route(params)
+        self.set_decay(params.volatility,
+                       params.pheromone_min, params.pheromone_max)
+
+    def use_topology(self, topology: dict[str, Any], params: Params) -> None:
+        super().use_topology(topology, params)
+        self.pheromone_stamp = np.zeros(self.num_edges, dtype=np.int64)
+        self.set_decay(params.volatility,
+                       params.pheromone_min, params.pheromone_max)
+
+    # 読み出した値は書き戻しておき、次の読み出しではそれ以降の世代の分だけ計算する
+    # (値は毎世代揮発させた場合と同じなので、書き戻してもノードのバージョンは進めない)
+    def read_pheromone(self, edges: np.ndarray) -> np.ndarray:
+        values = evaporate_elapsed(self.pheromone[edges], self.generation - self.pheromone_stamp[edges],
+                                   self.decay_rate[edges], self.decay_floor[edges], self.decay_ceiling).astype(np.int64)
+        self.pheromone[edges] = values
+        self.pheromone_stamp[edges] = self.generation
+        return values
+
+    def write_pheromone(self, edges: np.ndarray, values: np.ndarray) -> None:
+        self.pheromone_stamp[edges] = self.generation
+        super().write_pheromone(edges, values)
+
+    # 毎世代ログに書き出す場合は次の読み出しで1世代分だけ計算すれば済むように書き戻しておく
+    def pheromone_snapshot(self) -> np.ndarray:
+        return self.materialize_pheromone()
+
+    def materialize_pheromone(self) -> np.ndarray:
+        # 全ての有向辺に揮発を適用して書き戻し、その値を返す
+        # (読み出す値は毎世代揮発させた場合と同じなので、いつ書き戻しても結果は変わらない)
+        if len(self.decay_rate) > 0:
+            self.read_pheromone(np.arange(self.num_edges))
+        return self.pheromone.copy()
+
+    def pheromone_state(self) -> np.ndarray:
+        return self.materialize_pheromone()
+
+    def set_pheromone_state(self, state: np.ndarray) -> None:
+        super().set_pheromone_state(state)
+        self.pheromone_stamp[:] = self.generation
+        self.samplers = {}
+        self.unsettled = set()
+
+    def next_hop_sampler(self, index: int, bata: int) -> NextHopSampler:
+        cached = self.samplers.get(index)
+        sampler = super().next_hop_sampler(index, bata)
+        if (cached is None or cached[1] is not sampler) and len(self.decay_rate) > 0:
+            # 作り直した場合、隣接辺のどれかが次の世代で揮発するならこの世代のあいだだけ使う
+            # (全て下限・上限に達していればCSRNetworkと同じくLinkが変わるまで使い回す)
+            start, end = self.edge_range(index)
+            if evaporation_changes(self.pheromone[start:end], self.decay_rate[start:end],
+                                   self.decay_floor[start:end], self.decay_ceiling):
+                self.unsettled.add(index)
+        return sampler
+
+    def volitile_pheromone(self, params: Params) -> None:
+        # 世代を進めるだけ(揮発は読み出し時に計算する)
+        # 揮発で古くなるサンプラーだけを破棄する
+        self.generation += 1
+        for index in self.unsettled:
+            self.samplers.pop(index, None)
+        self.unsettled = set()
+
+
+# topology_library.TopologyLibraryのbuild関数
+# 同じ引数なら同じトポロジーになるように、最適ルートもseedで初期化したrandomで選ぶ
+def build_topology(num_nodes: int, edge_num: int, optimal_route_length: int, seed: int) -> dict[str, Any]:
+    params = Params(num_nodes=num_nodes, optimal_route_length=optimal_route_length, volatility=1.0, pheromone_min=0,
+                    pheromone_max=0, ttl=0, bata=1, generation_limit=0, simulation_count=0)
+    network = CSRNetwork()
+    network.yield_nodes(params)
+    network.make_ba_model(params, edge_num, seed)
+    state = random.getstate()
+    random.seed(seed)
+    network.make_optimal_route(params)
+    random.setstate(state)
+    return network.export_topology()
+
+
+if __name__ == "__main__":
+    # パラメータを設定
+    params = Params(num_nodes=100,
+                    optimal_route_length=6,
+                    volatility=0.99,
+                    pheromone_min=100,
+                    pheromone_max=2**20,
+                    ttl=100,
+                    bata=1,
+                    generation_limit=100,
+                    simulation_count=1)
+
+    # params.simulation_count回の複製を並列に実行(シードはbase_seedから決まるので再現できる)
+    run_sweep(main, [params], params.simulation_count, storage=async_default_storage, registry=ParameterRegistry(default_storage), network_class=CSRNetwork)
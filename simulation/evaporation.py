@@ -0,0 +1,118 @@
+# フェロモン揮発のカーネル
+# 全ての有向辺のフェロモン配列を一括で揮発させ、下限・上限でクリップする
+# 各方式の揮発率(rate)と下限(floor)は以下の通り
+#   通常               : rate = params.volatility,       floor = params.pheromone_min
+#   可変フェロモン最小値 : rate = params.volatility,       floor = params.pheromone_min * 3 * 次数
+#   可変揮発量         : rate = 0.89 + width / 1000,     floor = params.pheromone_min
+#   両方               : rate = 0.89 + width / 1000,     floor = params.pheromone_min * 3 * 次数
+# evaporate_referenceは従来のforループと同じ計算をするPython実装で、カーネルとの比較用に残している
+import math
+import numpy as np
+
+
+# widthに応じた揮発率(widthが小さいほど揮発量が大きい)
+def width_rate(width: np.ndarray) -> np.ndarray:
+    return 0.89 + (width / 1000)
+
+
+# 次数に応じたフェロモン最小値
+def degree_floor(degree: np.ndarray, pheromone_min: int) -> np.ndarray:
+    return pheromone_min * 3 * degree
+
+
+# pheromoneをrate倍して切り捨て、floor未満ならfloor、ceiling超過ならceilingにする
+# rate, floorはスカラーでも辺ごとの配列でもよい
+# 従来の実装と同じくfloorの判定をceilingより優先する
+def evaporate(pheromone: np.ndarray, rate, floor, ceiling: int) -> None:
+    tmp = np.floor(pheromone * rate)
+    pheromone[:] = np.where(tmp < floor, floor, np.minimum(tmp, ceiling))
+
+
+def evaporate_constant(pheromone: np.ndarray, volatility: float, pheromone_min: int, pheromone_max: int) -> None:
+    evaporate(pheromone, volatility, pheromone_min, pheromone_max)
+
+
+def evaporate_degree_floor(pheromone: np.ndarray, degree: np.ndarray, volatility: float, pheromone_min: int, pheromone_max: int) -> None:
+    evaporate(pheromone, volatility, degree_floor(
+        degree, pheromone_min), pheromone_max)
+
+
+def evaporate_width_rate(pheromone: np.ndarray, width: np.ndarray, pheromone_min: int, pheromone_max: int) -> None:
+    evaporate(pheromone, width_rate(width), pheromone_min, pheromone_max)
+
+
+def evaporate_degree_floor_width_rate(pheromone: np.ndarray, degree: np.ndarray, width: np.ndarray, pheromone_min: int, pheromone_max: int) -> None:
+    evaporate(pheromone, width_rate(width), degree_floor(
+        degree, pheromone_min), pheromone_max)
+
+
+# evaporateをelapsed回繰り返した結果を求める(遅延揮発用)
+# 毎世代の切り捨てを省略すると値がずれるので、要素ごとに1世代ずつ適用して毎世代揮発させた場合と同じ値にする
+# 値が変わらなくなった要素(下限に達したなど)はそれ以降も変わらないので、残りの世代は計算しない
+# 要素数がSMALL_SIZE以下(ノード1つの隣接辺など)ならnumpyの呼び出しのコストの方が大きいのでPythonのループで計算する
+def evaporate_elapsed(pheromone: np.ndarray, elapsed: np.ndarray, rate, floor, ceiling: int) -> np.ndarray:
+    if pheromone.size <= SMALL_SIZE:
+        return np.array(evaporate_elapsed_small(pheromone.tolist(), as_list(elapsed, pheromone.size),
+                                                as_list(rate, pheromone.size), as_list(floor, pheromone.size), ceiling), dtype=np.float64)
+    result = pheromone.astype(np.float64)
+    rate = np.broadcast_to(np.asarray(rate, dtype=np.float64), result.shape)
+    floor = np.broadcast_to(np.asarray(floor, dtype=np.float64), result.shape)
+    remaining = np.broadcast_to(np.asarray(elapsed), result.shape).copy()
+    active = np.flatnonzero(remaining > 0)
+    while len(active) > 0:
+        before = result[active]
+        tmp = np.floor(before * rate[active])
+        tmp = np.where(tmp < floor[active], floor[active], np.minimum(tmp, ceiling))
+        result[active] = tmp
+        remaining[active] -= 1
+        active = active[(remaining[active] > 0) & (tmp != before)]
+    return result
+
+
+SMALL_SIZE = 32
+
+
+# スカラーならsize個並べたリスト、配列ならそのリストにする
+def as_list(value, size: int) -> list:
+    if isinstance(value, np.ndarray):
+        return value.tolist() if value.ndim > 0 else [value.item()] * size
+    return [value] * size if np.ndim(value) == 0 else np.asarray(value).tolist()
+
+
+# evaporate_elapsedと同じ計算を1要素ずつ行う
+def evaporate_elapsed_small(pheromone: list[int], elapsed: list[int], rate: list[float], floor: list[float], ceiling: int) -> list[float]:
+    result = []
+    for value, remaining, r, f in zip(pheromone, elapsed, rate, floor):
+        while remaining > 0:
+            tmp = math.floor(value * r)
+            tmp = f if tmp < f else min(tmp, ceiling)
+            if tmp == value:
+                break
+            value = tmp
+            remaining -= 1
+        result.append(value)
+    return result
+
+
+# 1世代揮発させると値が変わる要素があるか(全て下限・上限などに達していればFalse)
+def evaporation_changes(pheromone: np.ndarray, rate: np.ndarray, floor: np.ndarray, ceiling: int) -> bool:
+    if pheromone.size <= SMALL_SIZE:
+        values = pheromone.tolist()
+        return evaporate_elapsed_small(values, [1] * len(values), rate.tolist(), floor.tolist(), ceiling) != values
+    evaporated = pheromone.astype(np.float64)
+    evaporate(evaporated, rate, floor, ceiling)
+    return not np.array_equal(evaporated, pheromone)
+
+
+# evaporateと同じ計算を1要素ずつ行うPython実装(比較用)
+def evaporate_reference(pheromone: list[int], rate: list[float], floor: list[int], ceiling: int) -> list[int]:
+    result = []
+    for value, r, f in zip(pheromone, rate, floor):
+        tmp = math.floor(value * r)
+        if tmp < f:
+            result.append(f)
+        elif tmp > ceiling:
+            result.append(ceiling)
+        else:
+            result.append(tmp)
+    return result
@@ -0,0 +1,28 @@
+# 世代ごとのroute_bottoleneckのヒストグラム
+# シミュレーション中にAnts, Interestsの結果を数えておき、終了時にBottleneckHistogramsテーブルへ
+# (ParameterID, PacketType, generation_count, RouteBottleneck)ごとの回数として加算する
+# 同じParameterIDのシミュレーションの回数は同じ行に足し込まれるので、
+# 分析側はAnts, Interestsの行を数えずにこのテーブルを1回読むだけでよい
+from collections import Counter
+from typing import Any
+
+
+class BottleneckHistogram:
+    def __init__(self) -> None:
+        # (PacketType, generation_count, RouteBottleneck) → 回数
+        self.counts: Counter[tuple[str, int, int]] = Counter()
+
+    # table(Ants, Interests, Rands)に登録したpacketの結果を数える
+    def add(self, table: str, generation_count: int, packet: Any) -> None:
+        self.counts[(table, generation_count, int(packet.route_bottoleneck))] += 1
+
+    # 複数のpacketのroute_bottoleneckをまとめて数える(colony.Colonyのantなど)
+    def add_bottlenecks(self, table: str, generation_count: int, bottlenecks: Any) -> None:
+        for bottleneck in bottlenecks:
+            self.counts[(table, generation_count, int(bottleneck))] += 1
+
+    # BottleneckHistogramsテーブルの行(ParameterID, PacketType, generation_count, RouteBottleneck, Count)
+    # 複数のシミュレーションが同時に加算してもデッドロックしないように行はキー順に並べる
+    def rows(self, parameter_id: int) -> list[tuple[int, str, int, int, int]]:
+        return [(parameter_id, table, generation_count, bottleneck, count)
+                for (table, generation_count, bottleneck), count in sorted(self.counts.items())]
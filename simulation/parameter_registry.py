@@ -0,0 +1,38 @@
+# スイープのパラメータを親プロセスでまとめて登録するレジストリ
+# グリッドの全パラメータを1回の一括upsert(StorageBackend.register_params_bulk)で登録してparams.idを設定し、
+# その後でワーカーに渡すので、ワーカーはparametersテーブルを読み書きしない(mainはparams.idがあれば登録しない)
+# IDはパラメータの値(storage.parameter_values)ごとにキャッシュし、同じ値は2回目から問い合わせない
+#
+# 使い方
+#   registry = ParameterRegistry(default_storage)
+#   run_sweep(main, [params1, params2], 100, registry=registry)
+from typing import Any, Callable
+from storage import StorageBackend, parameter_values
+
+
+class ParameterRegistry:
+    def __init__(self, storage: Callable[[], StorageBackend]) -> None:
+        self.storage = storage
+        # パラメータの値 → ParameterID
+        self.ids: dict[tuple, int] = {}
+
+    # params_gridの全てのパラメータのparams.idを設定し、IDのリストを返す
+    def register(self, params_grid: list[Any]) -> list[int]:
+        missing = [params for params in params_grid if parameter_values(params) not in self.ids]
+        if missing:
+            dblogger = self.storage()
+            dblogger.connect()
+            try:
+                params_ids = dblogger.register_params_bulk(missing)
+                dblogger.commit()
+            except Exception:
+                dblogger.rollback()
+                raise
+            finally:
+                dblogger.close()
+            for params, params_id in zip(missing, params_ids):
+                self.ids[parameter_values(params)] = params_id
+
+        for params in params_grid:
+            params.id = self.ids[parameter_values(params)]
+        return [params.id for params in params_grid]
@@ -0,0 +1,86 @@
+# フェロモン推移のバイナリファイル(np.memmapで読み書きする固定レイアウト)
+# ファイルの構成は先頭から
+#   ヘッダ         : HEADER_DTYPEの1レコード(HEADER_SIZEバイトに0埋め)
+#   辺の索引       : EDGE_DTYPEの辺数分のレコード(始点NodeID, 終点NodeID, width)
+#   フェロモン行列 : int64の[世代数 × 辺数]行列(行優先)
+# 辺の並び順はnetwork.connections()の順(毎世代同じ)
+# 書き込み済みの世代数をヘッダのwrittenに毎世代記録するので、途中で止まったファイルも読める
+import numpy as np
+
+MAGIC = b"ACOTRACE"
+VERSION = 1
+HEADER_SIZE = 64
+HEADER_DTYPE = np.dtype([("magic", "S8"), ("version", "<u4"), ("generation_limit", "<u4"),
+                         ("written", "<u4"), ("num_edges", "<u8"), ("simulation_id", "<i8")])
+EDGE_DTYPE = np.dtype([("start_id", "<i8"), ("end_id", "<i8"), ("width", "<i4")])
+PHEROMONE_DTYPE = np.dtype("<i8")
+
+
+class PheromoneTrace:
+    def __init__(self, path: str, mode: str = "r") -> None:
+        # mode="r"で読み込み、"r+"で追記(世代の書き込み)
+        self.path = path
+        self.header = np.memmap(path, dtype=HEADER_DTYPE, mode=mode, shape=(1,))
+        if self.header["magic"][0] != MAGIC or self.header["version"][0] != VERSION:
+            raise ValueError(f"{path} is not a pheromone trace (version {VERSION})")
+        self.generation_limit = int(self.header["generation_limit"][0])
+        self.num_edges = int(self.header["num_edges"][0])
+        self.simulation_id = int(self.header["simulation_id"][0])
+        self.edges = np.memmap(path, dtype=EDGE_DTYPE, mode=mode,
+                               offset=HEADER_SIZE, shape=(self.num_edges,))
+        self.matrix = np.memmap(path, dtype=PHEROMONE_DTYPE, mode=mode,
+                                offset=HEADER_SIZE + EDGE_DTYPE.itemsize * self.num_edges,
+                                shape=(self.generation_limit, self.num_edges))
+
+    @classmethod
+    def create(cls, path: str, connections: tuple, generation_limit: int, simulation_id: int) -> "PheromoneTrace":
+        # connections(network.connections()の戻り値)の辺の並びでファイルを作成する
+        # フェロモン行列の領域は確保だけ行い、中身はwriteで世代ごとに書き込む
+        start_ids, end_ids, _, width = (np.asarray(column) for column in connections)
+        num_edges = len(start_ids)
+
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header["magic"] = MAGIC
+        header["version"] = VERSION
+        header["generation_limit"] = generation_limit
+        header["num_edges"] = num_edges
+        header["simulation_id"] = simulation_id
+
+        edges = np.empty(num_edges, dtype=EDGE_DTYPE)
+        edges["start_id"] = start_ids
+        edges["end_id"] = end_ids
+        edges["width"] = width
+
+        size = HEADER_SIZE + edges.nbytes + PHEROMONE_DTYPE.itemsize * generation_limit * num_edges
+        with open(path, "wb") as f:
+            f.write(header.tobytes().ljust(HEADER_SIZE, b"\0"))
+            f.write(edges.tobytes())
+            f.truncate(size)
+        return cls(path, mode="r+")
+
+    @property
+    def written(self) -> int:
+        return int(self.header["written"][0])
+
+    def write(self, generation_count: int, pheromone) -> None:
+        # generation_count世代目のフェロモン(connections()と同じ並び)を書き込む
+        self.matrix[generation_count] = pheromone
+        self.header["written"] = max(self.written, generation_count + 1)
+
+    def flush(self) -> None:
+        self.matrix.flush()
+        self.header.flush()
+
+    def generation(self, generation_count: int) -> np.ndarray:
+        # generation_count世代目の全ての辺のフェロモン
+        return self.matrix[generation_count]
+
+    def edge_index(self, start_id: int, end_id: int) -> int:
+        found = np.flatnonzero((self.edges["start_id"] == start_id) & (self.edges["end_id"] == end_id))
+        if len(found) == 0:
+            raise KeyError((start_id, end_id))
+        return int(found[0])
+
+    def history(self, start_id: int, end_id: int) -> np.ndarray:
+        # 有向辺(start_id → end_id)の書き込み済み全世代のフェロモン
+        return self.matrix[:self.written, self.edge_index(start_id, end_id)]
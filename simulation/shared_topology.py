@@ -0,0 +1,71 @@
+# 親プロセスで作ったトポロジー(CSRNetworkの配列)をmultiprocessing.shared_memoryで共有する
+# 共有するのはシミュレーション中に変わらないoffsets, neighbor_ids, width(最適ルート作成後)で、
+# ワーカーはコピーせずにアタッチし、フェロモンなどの配列だけを自分で持つ
+# 全てのワーカーが同じグラフ・同じ最適ルートを使うので、方式の比較にも使える
+#
+# 使い方
+#   network = CSRNetwork()
+#   network.yield_nodes(params)
+#   network.make_ba_model(params, 3)
+#   network.make_optimal_route(params)
+#   with SharedTopology(network) as topology:
+#       run_sweep(main, [params], 100, network_class=CSRNetwork, topology=topology.handle)
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, NamedTuple
+import numpy as np
+
+# 共有する配列
+SHARED_ARRAYS = ("offsets", "neighbor_ids", "width")
+
+
+class TopologyHandle(NamedTuple):
+    # ワーカーに渡す(pickleできる)トポロジーの情報
+    num_nodes: int
+    arrays: dict[str, tuple[str, str, int]]  # 配列名 → (共有メモリ名, dtype, 要素数)
+    start: int  # 始点ノードのインデックス
+    end: int  # 終点ノードのインデックス
+    optimal_route: list[int]  # 最適ルートのノードのインデックス
+
+
+class SharedTopology:
+    # with文を抜けるかcloseで共有メモリを解放する(ワーカーが終わってから閉じること)
+    def __init__(self, network: Any) -> None:
+        self.blocks: list[SharedMemory] = []
+        arrays = {}
+        for name in SHARED_ARRAYS:
+            array = getattr(network, name)
+            block = SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+            self.blocks.append(block)
+            arrays[name] = (block.name, array.dtype.str, len(array))
+        self.handle = TopologyHandle(network.num_nodes, arrays, network.start_node.index,
+                                     network.end_node.index, [node.index for node in network.optimal_route])
+
+    def close(self) -> None:
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self) -> "SharedTopology":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+# ワーカーでアタッチした共有メモリ(同じワーカーの後のタスクでも使い回す)
+attached_blocks: dict[str, SharedMemory] = {}
+
+
+# handleの配列を共有メモリ上の読み取り専用の配列として返す
+def attach(handle: TopologyHandle) -> dict[str, np.ndarray]:
+    arrays = {}
+    for name, (block_name, dtype, length) in handle.arrays.items():
+        if block_name not in attached_blocks:
+            attached_blocks[block_name] = SharedMemory(name=block_name)
+        array = np.ndarray(length, dtype=dtype,
+                           buffer=attached_blocks[block_name].buf)
+        array.flags.writeable = False
+        arrays[name] = array
+    return arrays
@@ -0,0 +1,90 @@
+# Connectionsテーブルの差分登録
+# keyframe_interval世代ごとに全ての行(キーフレーム)を登録し、それ以外の世代は
+# 前の世代からフェロモンかwidthが変化した行だけを登録する
+# キーフレームの世代はConnectionKeyframesテーブルに記録する
+import os
+from typing import Any
+import numpy as np
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+
+class ConnectionDeltaEncoder:
+    def __init__(self, keyframe_interval: int) -> None:
+        self.keyframe_interval = keyframe_interval
+        self.generation_count = 0
+        self.previous: tuple[np.ndarray, ...] | None = None
+
+    # Network.connections()の戻り値を受け取り、(登録する行, キーフレームかどうか)を返す
+    # 辺の並び順は毎世代同じであること
+    def encode(self, connections: tuple) -> tuple[tuple[np.ndarray, ...], bool]:
+        current = tuple(np.asarray(column) for column in connections)
+        is_keyframe = self.previous is None or self.generation_count % self.keyframe_interval == 0
+        if is_keyframe:
+            rows = current
+        else:
+            _, _, previous_pheromone, previous_width = self.previous
+            _, _, pheromone, width = current
+            changed = (pheromone != previous_pheromone) | (width != previous_width)
+            rows = tuple(column[changed] for column in current)
+        self.previous = current
+        self.generation_count += 1
+        return rows, is_keyframe
+
+
+# simulation_idのシミュレーションのgeneration_count世代目のConnectionsを復元する
+# dbloggerはfetch_resultを持つストレージバックエンド(DBLogger, SQLiteLogger)
+# 戻り値は{(StartNodeID, EndNodeID): (Pheromone, Width)}
+# Connectionsを登録しなかった世代(run_simulationのconnections_interval)はそれ以前に最後に登録した世代の値になる
+def load_connections(dblogger: Any, simulation_id: int, generation_count: int) -> dict[tuple[int, int], tuple[int, int]]:
+    # generation_count以前で最後のキーフレーム(キーフレームがなければ全世代が全行登録)
+    keyframe = dblogger.fetch_result(
+        """SELECT MAX(generations.generation_count)
+        FROM connectionkeyframes
+        JOIN generations ON connectionkeyframes.generationid = generations.generationid
+        WHERE generations.simulationid = %s AND generations.generation_count <= %s;""",
+        (simulation_id, generation_count))[0][0]
+    start = generation_count if keyframe is None else keyframe
+
+    rows = dblogger.fetch_result(
+        """SELECT connections.startnodeid, connections.endnodeid, connections.pheromone, connections.width
+        FROM connections
+        JOIN generations ON connections.generationid = generations.generationid
+        WHERE generations.simulationid = %s AND generations.generation_count BETWEEN %s AND %s
+        ORDER BY generations.generation_count;""",
+        (simulation_id, start, generation_count))
+
+    # キーフレームに差分を古い順に上書きする
+    state: dict[tuple[int, int], tuple[int, int]] = {}
+    for start_id, end_id, pheromone, width in rows:
+        state[(start_id, end_id)] = (pheromone, width)
+    return state
+
+
+# load_connectionsのParquetLogger版(rootはParquetLoggerのroot)
+def load_connections_parquet(root: str, simulation_id: int, generation_count: int) -> dict[tuple[int, int], tuple[int, int]]:
+    if pq is None:
+        raise ImportError("load_connections_parquet requires pyarrow")
+    generations = pq.read_table(os.path.join(root, "generations"), filters=[
+        ("SimulationID", "=", simulation_id), ("generation_count", "<=", generation_count)]).to_pydict()
+    counts = dict(zip(generations["GenerationID"], generations["generation_count"]))
+
+    # generation_count以前で最後のキーフレーム(キーフレームがなければ全世代が全行登録)
+    keyframes = []
+    if os.path.isdir(os.path.join(root, "connectionkeyframes")):
+        keyframes = pq.read_table(os.path.join(root, "connectionkeyframes"), filters=[
+            ("GenerationID", "in", list(counts))]).column("GenerationID").to_pylist()
+    start = max((counts[generation_id] for generation_id in keyframes), default=generation_count)
+
+    rows = pq.read_table(os.path.join(root, "connections"), filters=[
+        ("GenerationID", "in", [generation_id for generation_id, count in counts.items() if count >= start])]).to_pydict()
+
+    # キーフレームに差分を古い順に上書きする
+    state: dict[tuple[int, int], tuple[int, int]] = {}
+    order = sorted(range(len(rows["GenerationID"])), key=lambda i: counts[rows["GenerationID"][i]])
+    for i in order:
+        state[(rows["StartNodeID"][i], rows["EndNodeID"][i])] = (rows["Pheromone"][i], rows["Width"][i])
+    return state
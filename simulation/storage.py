@@ -0,0 +1,639 @@
+# シミュレーション結果の保存先(ストレージバックエンド)
+# StorageBackendがmainから使うメソッドを定めたクラスで、以下の実装がある
+#   base.DBLogger  : PostgreSQL(psycopg2)
+#   SQLiteLogger   : SQLiteファイル(sql/create-table.sqlと同じテーブル構成)
+#   ParquetLogger  : テーブルごとのディレクトリにシミュレーション1回(定期的にcommitする場合はcommit1回)につき1ファイルのParquet
+#   AsyncStorage   : 他のバックエンドへの書き込みをバックグラウンドのスレッドで行う
+# mainのstorage引数には、これらのインスタンスを作る引数なしの関数(functools.partialなど)を渡す
+from typing import Any, Callable
+from concurrent.futures import Future
+import hashlib
+import json
+import glob
+import os
+import pickle
+import queue
+import sqlite3
+import tempfile
+import threading
+import uuid
+import zlib
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+class StorageBackend:
+    def connect(self) -> None:
+        raise NotImplementedError
+
+    # パラメータを登録してパラメータIDを返す(登録済みなら既存のIDを返す)
+    def register_params(self, params: Any) -> int:
+        raise NotImplementedError
+
+    # パラメータのリストをまとめて登録し、それぞれのパラメータIDを返す(parameter_registry.ParameterRegistry用)
+    def register_params_bulk(self, params_list: list[Any]) -> list[int]:
+        return [self.register_params(params) for params in params_list]
+
+    # 登録済みのパラメータ(params.idを設定済み)をregister_paramsの代わりに指定する
+    def use_params(self, params: Any) -> None:
+        pass
+
+    # シミュレーションを登録してシミュレーションIDを返す
+    def register_simulation(self, params_id: int) -> int:
+        raise NotImplementedError
+
+    # networkの全ノードにNodeIDを割り当てて登録する
+    def insert_nodes(self, simulation_id: int, network: Any) -> None:
+        raise NotImplementedError
+
+    # generation_limit世代分のGenerationを登録してGenerationIDのリストを返す
+    def insert_generations(self, simulation_id: int, generation_limit: int) -> list[int]:
+        raise NotImplementedError
+
+    # 1世代分のConnections(Network.connections()の戻り値)を登録する
+    def add_connections(self, generation_id: int, connections: tuple) -> None:
+        raise NotImplementedError
+
+    # Connectionsを差分で登録する場合のキーフレームの世代を記録する
+    def insert_keyframe(self, generation_id: int) -> None:
+        raise NotImplementedError
+
+    # Ant, Interest, Randの結果をtable(Ants, Interests, Rands)に登録する
+    def insert_packet(self, table: str, generation_id: int, packet: Any) -> None:
+        raise NotImplementedError
+
+    # シミュレーション全体のBottleneckHistogramをBottleneckHistogramsに加算する
+    def add_bottleneck_histogram(self, params_id: int, histogram: Any) -> None:
+        raise NotImplementedError
+
+    # simulation_idのチェックポイント(checkpoint.Checkpointをpickleしたもの)を保存する(前のものは置き換える)
+    def save_checkpoint(self, simulation_id: int, generation_count: int, state: bytes) -> None:
+        raise NotImplementedError
+
+    # simulation_idのチェックポイントを返す
+    def load_checkpoint(self, simulation_id: int) -> bytes:
+        raise NotImplementedError
+
+    def delete_checkpoint(self, simulation_id: int) -> None:
+        raise NotImplementedError
+
+    def commit(self) -> None:
+        raise NotImplementedError
+
+    def rollback(self) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        raise NotImplementedError
+
+
+class AsyncStorage(StorageBackend):
+    # backendへの書き込みをバックグラウンドのスレッドで行うストレージバックエンド
+    # Connections, Ants, Interestsなどの登録は最大max_pending件まで溜められるキューに入れてすぐに戻り、
+    # シミュレーションはその間も進む(キューがいっぱいなら空くまで待つので、DBが遅れてもメモリは増え続けない)
+    # 戻り値が必要な登録(ID)とcommit, rollback, closeはそれまでにキューに入れた書き込みが終わるまで待つ
+    # backendの接続もスレッド内で作るので、backendは常に同じスレッドから使われる
+    def __init__(self, backend: StorageBackend, max_pending: int = 64) -> None:
+        self.backend = backend
+        self.queue: queue.Queue = queue.Queue(max_pending)
+        self.error: BaseException | None = None
+        self.thread: threading.Thread | None = None
+
+    def run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            method, args, future, always = item
+            # 書き込みに失敗した後はrollback, close以外を実行しない
+            if self.error is not None and not always:
+                if future is not None:
+                    future.set_exception(self.error)
+                continue
+            try:
+                result = method(*args)
+            except BaseException as e:
+                if not always:
+                    self.error = e
+                if future is not None:
+                    future.set_exception(e)
+            else:
+                if future is not None:
+                    future.set_result(result)
+
+    # 書き込みをキューに入れてすぐに戻る(前の書き込みが失敗していればその例外を送出する)
+    def submit(self, method: Callable[..., Any], *args: Any) -> None:
+        if self.error is not None:
+            raise self.error
+        self.queue.put((method, args, None, False))
+
+    # キューに入れて実行が終わるまで待ち、戻り値を返す
+    def call(self, method: Callable[..., Any], *args: Any, always: bool = False) -> Any:
+        future: Future = Future()
+        self.queue.put((method, args, future, always))
+        return future.result()
+
+    def connect(self) -> None:
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        self.call(self.backend.connect)
+
+    def register_params(self, params: Any) -> int:
+        return self.call(self.backend.register_params, params)
+
+    def register_params_bulk(self, params_list: list[Any]) -> list[int]:
+        return self.call(self.backend.register_params_bulk, params_list)
+
+    def use_params(self, params: Any) -> None:
+        self.call(self.backend.use_params, params)
+
+    def register_simulation(self, params_id: int) -> int:
+        return self.call(self.backend.register_simulation, params_id)
+
+    def insert_nodes(self, simulation_id: int, network: Any) -> None:
+        # networkにNodeIDを割り当てるので終わるまで待つ
+        self.call(self.backend.insert_nodes, simulation_id, network)
+
+    def insert_generations(self, simulation_id: int, generation_limit: int) -> list[int]:
+        return self.call(self.backend.insert_generations, simulation_id, generation_limit)
+
+    def add_connections(self, generation_id: int, connections: tuple) -> None:
+        self.submit(self.backend.add_connections, generation_id, connections)
+
+    def insert_keyframe(self, generation_id: int) -> None:
+        self.submit(self.backend.insert_keyframe, generation_id)
+
+    def insert_packet(self, table: str, generation_id: int, packet: Any) -> None:
+        self.submit(self.backend.insert_packet, table, generation_id, packet)
+
+    def add_bottleneck_histogram(self, params_id: int, histogram: Any) -> None:
+        self.submit(self.backend.add_bottleneck_histogram, params_id, histogram)
+
+    def save_checkpoint(self, simulation_id: int, generation_count: int, state: bytes) -> None:
+        self.submit(self.backend.save_checkpoint, simulation_id, generation_count, state)
+
+    def load_checkpoint(self, simulation_id: int) -> bytes:
+        return self.call(self.backend.load_checkpoint, simulation_id)
+
+    def delete_checkpoint(self, simulation_id: int) -> None:
+        self.submit(self.backend.delete_checkpoint, simulation_id)
+
+    def commit(self) -> None:
+        self.call(self.backend.commit)
+
+    def rollback(self) -> None:
+        self.call(self.backend.rollback, always=True)
+
+    def close(self) -> None:
+        if self.thread is None:
+            return
+        try:
+            self.call(self.backend.close, always=True)
+        finally:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+
+# storage()で作ったストレージバックエンドをAsyncStorageで包む(mainのstorage引数用にfunctools.partialで使う)
+def async_storage(storage: Callable[[], StorageBackend], max_pending: int = 64) -> AsyncStorage:
+    return AsyncStorage(storage(), max_pending)
+
+
+# Packetを(SourceNodeID, DestinationNodeID, RouteNodesID, RouteWidths, RouteBottleneck)にする
+def packet_row(packet: Any) -> tuple[int, int, list[int], list[int], int]:
+    return (packet.source.id, packet.destination.id, [node.id for node in packet.route],
+            [int(width) for width in packet.route_width], int(packet.route_bottoleneck))
+
+
+# 経路のRouteID(ノードの並びをカンマ区切りにした文字列のmd5の先頭64bitを符号付き整数にしたもの)
+# sql/migrations/0005_add_routes.sqlのroute_id関数と同じ値になる
+def route_id(route_node_id: list[int]) -> int:
+    digest = hashlib.md5(",".join(map(str, route_node_id)).encode()).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+
+class RouteInterner:
+    # 登録済みの経路(ノードの並び → RouteID)
+    # 同じ経路はRoutesテーブルに1回だけ登録し、Ants, Interests, RandsはRouteIDで参照する
+    def __init__(self) -> None:
+        self.ids: dict[tuple[int, ...], int] = {}
+
+    # 経路のRouteIDと、初めて見た経路(Routesに登録が必要)かどうかを返す
+    def intern(self, route_node_id: list[int]) -> tuple[int, bool]:
+        key = tuple(route_node_id)
+        if key in self.ids:
+            return self.ids[key], False
+        self.ids[key] = route_id(route_node_id)
+        return self.ids[key], True
+
+    # rollbackで登録が取り消された経路も忘れる(登録済みの経路を再登録しても無視される)
+    def clear(self) -> None:
+        self.ids = {}
+
+
+PARAMETER_COLUMNS = ["NumberOfNodes", "optimalPathLength", "Volatility", "MinPheromone",
+                     "MaxPheromone", "TTL", "bata", "GenerationLimit"]
+
+
+def parameter_values(params: Any) -> tuple:
+    return (params.num_nodes, params.optimal_route_length, params.volatility, params.pheromone_min,
+            params.pheromone_max, params.ttl, params.bata, params.generation_limit)
+
+
+# sql/create-table.sqlのSQLite版
+# Generations.generation_countとNodes.Num_of_connectionsはシミュレーションが登録している列
+# 経路はRoutesに1回だけ登録し、Ants, Interests, RandsはRouteIDで参照する(RouteNodesID, RouteWidthsはJSONの配列)
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS Parameters (
+    ParameterID INTEGER PRIMARY KEY,
+    NumberOfNodes int,
+    Volatility float,
+    MinPheromone float,
+    MaxPheromone float,
+    TTL int,
+    GenerationLimit int,
+    SimulationLimit int,
+    optimalPathLength int,
+    bata float,
+    UNIQUE (NumberOfNodes, optimalPathLength, Volatility, MinPheromone, MaxPheromone, TTL, bata, GenerationLimit)
+);
+
+CREATE TABLE IF NOT EXISTS Simulations (
+    SimulationID INTEGER PRIMARY KEY,
+    ParameterID int REFERENCES Parameters(ParameterID)
+);
+
+CREATE TABLE IF NOT EXISTS Generations (
+    GenerationID INTEGER PRIMARY KEY,
+    SimulationID int REFERENCES Simulations(SimulationID),
+    generation_count int
+);
+
+CREATE TABLE IF NOT EXISTS Nodes (
+    NodeID INTEGER PRIMARY KEY,
+    SimulationID int REFERENCES Simulations(SimulationID),
+    Num_of_connections int
+);
+
+CREATE TABLE IF NOT EXISTS Connections (
+    GenerationID Bigint REFERENCES Generations(GenerationID),
+    StartNodeID Bigint REFERENCES Nodes(NodeID),
+    EndNodeID Bigint REFERENCES Nodes(NodeID),
+    Width int,
+    Pheromone int,
+    PRIMARY KEY (GenerationID, StartNodeID, EndNodeID)
+);
+
+CREATE TABLE IF NOT EXISTS ConnectionKeyframes (
+    GenerationID Bigint PRIMARY KEY REFERENCES Generations(GenerationID)
+);
+
+CREATE TABLE IF NOT EXISTS BottleneckHistograms (
+    ParameterID int REFERENCES Parameters(ParameterID),
+    PacketType text,
+    generation_count int,
+    RouteBottleneck int,
+    Count int,
+    PRIMARY KEY (ParameterID, PacketType, generation_count, RouteBottleneck)
+);
+
+CREATE TABLE IF NOT EXISTS Routes (
+    RouteID INTEGER PRIMARY KEY,
+    RouteNodesID text,
+    RouteWidths text
+);
+
+CREATE TABLE IF NOT EXISTS Checkpoints (
+    SimulationID INTEGER PRIMARY KEY REFERENCES Simulations(SimulationID),
+    generation_count int,
+    State blob
+);
+""" + "".join(f"""
+CREATE TABLE IF NOT EXISTS {table} (
+    GenerationID Bigint PRIMARY KEY REFERENCES Generations(GenerationID),
+    SourceNodeID Bigint REFERENCES Nodes(NodeID),
+    DestinationNodeID Bigint REFERENCES Nodes(NodeID),
+    RouteID Bigint REFERENCES Routes(RouteID),
+    RouteBottleneck int
+);
+""" for table in ["Ants", "Interests", "Rands"])
+
+
+class SQLiteLogger(StorageBackend):
+    # SQLiteは書き込みのトランザクションの間ファイル全体をロックし、シミュレーションは既定では最後に1回だけcommitするので、
+    # 複数のPoolワーカー(run_sweep)から同じファイルに書き込むと他のワーカーはtimeout秒待った後に"database is locked"で失敗する
+    # 並列に実行する場合はpathに{pid}を含めてワーカーごとのファイルにする(例: "results/simulation_{pid}.db")
+    # (SimulationIDなどのIDはファイルごとの連番になるので、ファイルをまたいで集計する場合はファイル名と組にする)
+    def __init__(self, path: str, timeout: float = 60.0) -> None:
+        self.path = path.format(pid=os.getpid())
+        # 他のプロセスが書き込み中の場合はロックが空くまでtimeout秒待つ
+        self.timeout = timeout
+        self.connector: sqlite3.Connection | None = None
+        self.cursor: sqlite3.Cursor | None = None
+        self.routes = RouteInterner()
+
+    def connect(self) -> None:
+        self.connector = sqlite3.connect(self.path, timeout=self.timeout)
+        self.connector.executescript(SQLITE_SCHEMA)
+        self.cursor = self.connector.cursor()
+
+    # 任意のクエリを実行し、結果を返す(DBLogger.fetch_resultと同じく%sのプレースホルダーを使える)
+    def fetch_result(self, query: str, params=None) -> list[tuple[Any]]:
+        self.cursor.execute(query.replace("%s", "?"), params or ())
+        return self.cursor.fetchall()
+
+    def register_params(self, params: Any) -> int:
+        columns = ", ".join(PARAMETER_COLUMNS)
+        values = parameter_values(params)
+        self.cursor.execute(
+            f"INSERT OR IGNORE INTO Parameters ({columns}) VALUES ({', '.join('?' * len(values))});", values)
+        self.cursor.execute(
+            f"SELECT ParameterID FROM Parameters WHERE {' AND '.join(f'{column} = ?' for column in PARAMETER_COLUMNS)};", values)
+        return self.cursor.fetchone()[0]
+
+    def register_simulation(self, params_id: int) -> int:
+        self.cursor.execute(
+            "INSERT INTO Simulations (ParameterID) VALUES (?);", (params_id,))
+        return self.cursor.lastrowid
+
+    def insert_nodes(self, simulation_id: int, network: Any) -> None:
+        node_ids = []
+        for degree in network.degrees():
+            self.cursor.execute(
+                "INSERT INTO Nodes (SimulationID, Num_of_connections) VALUES (?, ?);", (simulation_id, int(degree)))
+            node_ids.append(self.cursor.lastrowid)
+        network.assign_node_ids(node_ids)
+
+    def insert_generations(self, simulation_id: int, generation_limit: int) -> list[int]:
+        generation_ids = []
+        for generation_count in range(generation_limit):
+            self.cursor.execute(
+                "INSERT INTO Generations (SimulationID, generation_count) VALUES (?, ?);", (simulation_id, generation_count))
+            generation_ids.append(self.cursor.lastrowid)
+        return generation_ids
+
+    def add_connections(self, generation_id: int, connections: tuple) -> None:
+        start_ids, end_ids, pheromone, width = (
+            np.asarray(column).tolist() for column in connections)
+        self.cursor.executemany(
+            "INSERT INTO Connections (GenerationID, StartNodeID, EndNodeID, Pheromone, Width) VALUES (?, ?, ?, ?, ?);",
+            zip([generation_id] * len(start_ids), start_ids, end_ids, pheromone, width))
+
+    def insert_keyframe(self, generation_id: int) -> None:
+        self.cursor.execute(
+            "INSERT INTO ConnectionKeyframes (GenerationID) VALUES (?);", (generation_id,))
+
+    def insert_packet(self, table: str, generation_id: int, packet: Any) -> None:
+        source_id, destination_id, route_node_id, route_width, route_bottoleneck = packet_row(
+            packet)
+        route_id, is_new = self.routes.intern(route_node_id)
+        if is_new:
+            self.cursor.execute(
+                "INSERT OR IGNORE INTO Routes (RouteID, RouteNodesID, RouteWidths) VALUES (?, ?, ?);",
+                (route_id, json.dumps(route_node_id), json.dumps(route_width)))
+        self.cursor.execute(
+            f"INSERT INTO {table} (GenerationID, SourceNodeID, DestinationNodeID, RouteID, RouteBottleneck) VALUES (?, ?, ?, ?, ?);",
+            (generation_id, source_id, destination_id, route_id, route_bottoleneck))
+
+    def add_bottleneck_histogram(self, params_id: int, histogram: Any) -> None:
+        self.cursor.executemany(
+            """INSERT INTO BottleneckHistograms (ParameterID, PacketType, generation_count, RouteBottleneck, Count) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (ParameterID, PacketType, generation_count, RouteBottleneck) DO UPDATE SET Count = Count + excluded.Count;""",
+            histogram.rows(params_id))
+
+    def save_checkpoint(self, simulation_id: int, generation_count: int, state: bytes) -> None:
+        self.cursor.execute(
+            "INSERT OR REPLACE INTO Checkpoints (SimulationID, generation_count, State) VALUES (?, ?, ?);",
+            (simulation_id, generation_count, state))
+
+    def load_checkpoint(self, simulation_id: int) -> bytes:
+        self.cursor.execute(
+            "SELECT State FROM Checkpoints WHERE SimulationID = ?;", (simulation_id,))
+        row = self.cursor.fetchone()
+        if row is None:
+            raise ValueError(f"no checkpoint for simulation {simulation_id}")
+        return row[0]
+
+    def delete_checkpoint(self, simulation_id: int) -> None:
+        self.cursor.execute(
+            "DELETE FROM Checkpoints WHERE SimulationID = ?;", (simulation_id,))
+
+    def commit(self) -> None:
+        self.connector.commit()
+
+    def rollback(self) -> None:
+        self.routes.clear()
+        self.connector.rollback()
+
+    def close(self) -> None:
+        self.cursor.close()
+        self.connector.close()
+
+
+# ParquetLoggerが書き出すテーブルの列
+PARQUET_SCHEMAS = {
+    "parameters": [("ParameterID", "int64")] + [(column, "float64" if column in ("Volatility", "MinPheromone", "MaxPheromone", "bata") else "int64") for column in PARAMETER_COLUMNS],
+    "simulations": [("SimulationID", "int64"), ("ParameterID", "int64")],
+    "generations": [("GenerationID", "int64"), ("SimulationID", "int64"), ("generation_count", "int64")],
+    "nodes": [("NodeID", "int64"), ("SimulationID", "int64"), ("Num_of_connections", "int64")],
+    "connections": [("GenerationID", "int64"), ("StartNodeID", "int64"), ("EndNodeID", "int64"), ("Pheromone", "int64"), ("Width", "int64")],
+    "connectionkeyframes": [("GenerationID", "int64")],
+    "bottleneckhistograms": [("ParameterID", "int64"), ("PacketType", "string"), ("generation_count", "int64"), ("RouteBottleneck", "int64"), ("Count", "int64")],
+    **{table: [("GenerationID", "int64"), ("SourceNodeID", "int64"), ("DestinationNodeID", "int64"),
+               ("RouteNodesID", "list<int64>"), ("RouteWidths", "list<int64>"), ("RouteBottleneck", "int64")]
+       for table in ["ants", "interests", "rands"]},
+}
+
+
+class ParquetLogger(StorageBackend):
+    # root/<テーブル名>/simulation_<SimulationID>_<番号>.parquetに書き出す(番号はcommitごとに増える)
+    # テーブルごとのディレクトリはpyarrow.datasetでまとめて読める
+    # DBを使わないので、IDは以下のように決める
+    #   ParameterID  : パラメータの値から計算したハッシュ(同じパラメータなら同じID)
+    #   SimulationID : uuid4の63bit(並列に実行した他のシミュレーションのファイルを上書きしない)
+    #   NodeID, GenerationID : uuid4の62bitから始まる連番
+    # row_group_rows行溜まったテーブルはファイルに書き出すのでメモリ使用量は一定
+    # チェックポイントはroot/checkpoints/simulation_<SimulationID>.pickleに、その時点のファイルの番号と一緒に
+    # commitでファイルを閉じた後に書き出す(再開時はそれより後の番号のファイルを削除する)
+    row_group_rows: int = 100_000
+
+    def __init__(self, root: str) -> None:
+        if pa is None:
+            raise ImportError("ParquetLogger requires pyarrow")
+        self.root = root
+        self.simulation_id: int | None = None
+        self.part = 0  # 書き出し中のファイルの番号
+        self.next_local_id: dict[str, int] = {}
+        self.buffers: dict[str, dict[str, list]] = {}
+        self.buffer_rows: dict[str, int] = {}
+        self.writers: dict[str, Any] = {}
+        # 次のcommitで書き出すチェックポイントと、次のcommitで削除するか
+        self.pending_checkpoint: bytes | None = None
+        self.pending_delete = False
+
+    def connect(self) -> None:
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, table: str) -> str:
+        return os.path.join(self.root, table, f"simulation_{self.simulation_id}_{self.part}.parquet")
+
+    def checkpoint_path(self, simulation_id: int) -> str:
+        return os.path.join(self.root, "checkpoints", f"simulation_{simulation_id}.pickle")
+
+    def schema(self, table: str) -> Any:
+        types = {"int64": pa.int64(), "float64": pa.float64(), "string": pa.string(),
+                 "list<int64>": pa.list_(pa.int64())}
+        return pa.schema([(name, types[type_name]) for name, type_name in PARQUET_SCHEMAS[table]])
+
+    def append(self, table: str, columns: dict[str, Any]) -> None:
+        buffer = self.buffers.setdefault(
+            table, {name: [] for name, _ in PARQUET_SCHEMAS[table]})
+        rows = 0
+        for name, values in columns.items():
+            buffer[name].extend(values)
+            rows = len(values)
+        self.buffer_rows[table] = self.buffer_rows.get(table, 0) + rows
+        if self.buffer_rows[table] >= self.row_group_rows:
+            self.flush(table)
+
+    def flush(self, table: str) -> None:
+        if self.buffer_rows.get(table, 0) == 0:
+            return
+        if table not in self.writers:
+            os.makedirs(os.path.join(self.root, table), exist_ok=True)
+            self.writers[table] = pq.ParquetWriter(
+                self.path(table), self.schema(table))
+        self.writers[table].write_table(pa.Table.from_pydict(
+            self.buffers[table], schema=self.schema(table)))
+        self.buffers[table] = {name: [] for name, _ in PARQUET_SCHEMAS[table]}
+        self.buffer_rows[table] = 0
+
+    def local_ids(self, table: str, count: int) -> list[int]:
+        start = self.next_local_id.get(table, uuid.uuid4().int >> 66)
+        self.next_local_id[table] = start + count
+        return list(range(start, start + count))
+
+    def parameter_id(self, params: Any) -> int:
+        return zlib.crc32(repr(parameter_values(params)).encode()) & 0x7FFFFFFF
+
+    def register_params(self, params: Any) -> int:
+        # パラメータの行は各シミュレーションのファイルに書く
+        params_id = self.parameter_id(params)
+        self.append("parameters", {"ParameterID": [params_id], **{
+                    column: [value] for column, value in zip(PARAMETER_COLUMNS, parameter_values(params))}})
+        return params_id
+
+    # IDはパラメータの値から決まるので、まとめて登録する場合はファイルに何も書かない
+    def register_params_bulk(self, params_list: list[Any]) -> list[int]:
+        return [self.parameter_id(params) for params in params_list]
+
+    def use_params(self, params: Any) -> None:
+        self.register_params(params)
+
+    def register_simulation(self, params_id: int) -> int:
+        self.simulation_id = uuid.uuid4().int >> 65
+        self.part = 0
+        self.next_local_id = {}
+        self.append("simulations", {"SimulationID": [
+                    self.simulation_id], "ParameterID": [params_id]})
+        return self.simulation_id
+
+    def insert_nodes(self, simulation_id: int, network: Any) -> None:
+        degrees = np.asarray(network.degrees()).tolist()
+        node_ids = self.local_ids("nodes", len(degrees))
+        network.assign_node_ids(node_ids)
+        self.append("nodes", {"NodeID": node_ids, "SimulationID": [
+                    simulation_id] * len(node_ids), "Num_of_connections": degrees})
+
+    def insert_generations(self, simulation_id: int, generation_limit: int) -> list[int]:
+        generation_ids = self.local_ids("generations", generation_limit)
+        self.append("generations", {"GenerationID": generation_ids, "SimulationID": [
+                    simulation_id] * generation_limit, "generation_count": list(range(generation_limit))})
+        return generation_ids
+
+    def add_connections(self, generation_id: int, connections: tuple) -> None:
+        start_ids, end_ids, pheromone, width = (
+            np.asarray(column).tolist() for column in connections)
+        self.append("connections", {"GenerationID": [generation_id] * len(start_ids), "StartNodeID": start_ids,
+                                    "EndNodeID": end_ids, "Pheromone": pheromone, "Width": width})
+
+    def insert_keyframe(self, generation_id: int) -> None:
+        self.append("connectionkeyframes", {"GenerationID": [generation_id]})
+
+    def insert_packet(self, table: str, generation_id: int, packet: Any) -> None:
+        source_id, destination_id, route_node_id, route_width, route_bottoleneck = packet_row(
+            packet)
+        self.append(table.lower(), {"GenerationID": [generation_id], "SourceNodeID": [source_id], "DestinationNodeID": [destination_id],
+                                    "RouteNodesID": [route_node_id], "RouteWidths": [route_width], "RouteBottleneck": [route_bottoleneck]})
+
+    def add_bottleneck_histogram(self, params_id: int, histogram: Any) -> None:
+        # ファイルはシミュレーションごとなので、同じParameterIDの合計は読み込み時にgroup byで求める
+        rows = histogram.rows(params_id)
+        self.append("bottleneckhistograms", {name: [row[i] for row in rows] for i, (name, _) in enumerate(
+            PARQUET_SCHEMAS["bottleneckhistograms"])})
+
+    # チェックポイントはcommitでファイルを閉じた後に書き出す
+    def save_checkpoint(self, simulation_id: int, generation_count: int, state: bytes) -> None:
+        self.pending_checkpoint = state
+        self.pending_delete = False
+
+    # チェックポイントを読み込み、それより後にcommitしたファイルを削除してこのシミュレーションの続きを書く
+    def load_checkpoint(self, simulation_id: int) -> bytes:
+        path = self.checkpoint_path(simulation_id)
+        if not os.path.exists(path):
+            raise ValueError(f"no checkpoint for simulation {simulation_id}")
+        with open(path, "rb") as f:
+            part, state = pickle.load(f)
+        self.simulation_id = simulation_id
+        self.part = part
+        for table in PARQUET_SCHEMAS:
+            for file in glob.glob(os.path.join(self.root, table, f"simulation_{simulation_id}_*.parquet")):
+                if int(os.path.basename(file)[:-len(".parquet")].rsplit("_", 1)[1]) >= part:
+                    os.remove(file)
+        return state
+
+    def delete_checkpoint(self, simulation_id: int) -> None:
+        self.pending_checkpoint = None
+        self.pending_delete = True
+
+    def commit(self) -> None:
+        for table in list(self.buffers):
+            self.flush(table)
+        for writer in self.writers.values():
+            writer.close()
+        if self.writers:
+            self.part += 1
+        self.writers = {}
+
+        path = self.checkpoint_path(self.simulation_id)
+        if self.pending_checkpoint is not None:
+            # 書き込み途中で中断しても前のチェックポイントが残るように、一時ファイルに書いてから置き換える
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as f:
+                pickle.dump((self.part, self.pending_checkpoint), f)
+            os.replace(f.name, path)
+        elif self.pending_delete and os.path.exists(path):
+            os.remove(path)
+        self.pending_checkpoint = None
+        self.pending_delete = False
+
+    def rollback(self) -> None:
+        # 書き出し途中のファイルを削除する
+        for table, writer in self.writers.items():
+            writer.close()
+            os.remove(self.path(table))
+        self.writers = {}
+        self.buffers = {}
+        self.buffer_rows = {}
+        self.pending_checkpoint = None
+        self.pending_delete = False
+
+    def close(self) -> None:
+        self.commit()
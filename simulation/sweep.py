@@ -0,0 +1,85 @@
+# パラメータのグリッド × 複製(replicate)をプロセスプールで実行するスイープ
+# タスクごとにシード(base_seed, グリッドの番号, 複製の番号から決まる値)でrandomを初期化してからmainを呼ぶので、
+# 同じbase_seedなら同じ結果になり、run_replicateで1つの複製だけを再実行することもできる
+# 結果は終わった順にimap_unorderedで受け取り、進捗を表示する
+#
+# 使い方
+#   run_sweep(main, [params1, params2], replicates=100, base_seed=0, chunksize=4)
+#   run_replicate(main, [params1, params2], index=1, replicate=37, base_seed=0)  # 上の2つ目のパラメータの37番目の複製だけを再実行
+import contextlib
+import os
+import random
+import time
+import traceback
+from functools import partial
+from multiprocessing import Pool
+from typing import Any, Callable, NamedTuple
+import numpy as np
+from parameter_registry import ParameterRegistry
+
+
+class SweepTask(NamedTuple):
+    index: int  # params_gridの番号
+    replicate: int  # 複製の番号
+    seed: int
+    params: Any
+
+
+class SweepResult(NamedTuple):
+    index: int
+    replicate: int
+    seed: int
+    simulation_id: int | None  # mainの戻り値(失敗した場合はNone)
+    elapsed: float
+
+
+# (base_seed, index, replicate)からタスクのシードを決める
+def task_seed(base_seed: int, index: int, replicate: int) -> int:
+    return int(np.random.SeedSequence(base_seed, spawn_key=(index, replicate)).generate_state(1, np.uint64)[0])
+
+
+def make_tasks(params_grid: list[Any], replicates: int, base_seed: int) -> list[SweepTask]:
+    return [SweepTask(index, replicate, task_seed(base_seed, index, replicate), params)
+            for index, params in enumerate(params_grid) for replicate in range(replicates)]
+
+
+def run_task(main: Callable[..., Any], main_kwargs: dict[str, Any], quiet: bool, task: SweepTask) -> SweepResult:
+    # randomを初期化してからmainを呼ぶ(ネットワークの生成やantの移動はrandomから乱数を得る)
+    random.seed(task.seed)
+    start = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        if quiet:
+            stack.enter_context(contextlib.redirect_stdout(
+                stack.enter_context(open(os.devnull, "w"))))
+        try:
+            simulation_id = main(task.params, **main_kwargs)
+        except Exception:
+            print(traceback.format_exc())
+            simulation_id = None
+    return SweepResult(task.index, task.replicate, task.seed, simulation_id, time.perf_counter() - start)
+
+
+# params_gridの各パラメータをreplicates回ずつ実行し、終わった順の結果のリストを返す
+# chunksize個ずつのタスクをまとめてワーカーに渡す(タスクが短い場合は大きくするとプロセス間通信が減る)
+# quiet=Trueの場合はmainの出力を捨てて進捗だけを表示する
+# registry(parameter_registry.ParameterRegistry)を指定した場合は、ワーカーに渡す前に全てのパラメータを登録してparams.idを設定する
+def run_sweep(main: Callable[..., Any], params_grid: list[Any], replicates: int, base_seed: int = 0, processes: int | None = None,
+              chunksize: int = 1, quiet: bool = True, registry: ParameterRegistry | None = None, **main_kwargs: Any) -> list[SweepResult]:
+    if registry is not None:
+        registry.register(params_grid)
+    tasks = make_tasks(params_grid, replicates, base_seed)
+    results = []
+    start = time.perf_counter()
+    with Pool(processes) as p:
+        for result in p.imap_unordered(partial(run_task, main, main_kwargs, quiet), tasks, chunksize=chunksize):
+            results.append(result)
+            status = "failed" if result.simulation_id is None else f"simulation_id: {result.simulation_id}"
+            print(f"[{len(results)}/{len(tasks)}] params: {result.index}, replicate: {result.replicate}, seed: {result.seed}, "
+                  f"{status}, {result.elapsed:.1f}s (total {time.perf_counter() - start:.1f}s)")
+    return results
+
+
+# run_sweepの1つのタスクだけを同じシードでこのプロセスで再実行する
+def run_replicate(main: Callable[..., Any], params_grid: list[Any], index: int, replicate: int, base_seed: int = 0, **main_kwargs: Any) -> SweepResult:
+    task = SweepTask(index, replicate, task_seed(base_seed, index, replicate), params_grid[index])
+    return run_task(main, main_kwargs, False, task)
@@ -0,0 +1,73 @@
+# トポロジー(BAモデルのグラフ・width・最適ルート)のファイル保存と、生成条件をキーにしたライブラリ
+# トポロジーはCSR形式の配列の辞書(TOPOLOGY_FIELDS)で、非圧縮のnpzに保存するので数ミリ秒で読める
+# ライブラリは(num_nodes, edge_num, optimal_route_length, seed)のハッシュをファイル名にして保存し、
+# 同じキーなら生成し直さずに保存したトポロジーを返す(コードを変更しても同じグラフで再実行できる)
+#
+# 使い方
+#   library = TopologyLibrary("topologies", build_topology)  # build_topologyはcsr.py
+#   run_sweep(main, [params], 100, topology_library=library)
+import hashlib
+import os
+import tempfile
+from typing import Any, Callable
+import numpy as np
+
+# トポロジーの辞書のキー
+#   num_nodes             : ノード数
+#   offsets, neighbor_ids : CSR形式の隣接ノード(各ノード内で昇順)
+#   width                 : 有向辺ごとのwidth(最適ルートは100)
+#   start, end            : 始点・終点ノードのインデックス
+#   optimal_route         : 最適ルートのノードのインデックス
+TOPOLOGY_FIELDS = ("num_nodes", "offsets", "neighbor_ids",
+                   "width", "start", "end", "optimal_route")
+
+# ファイル形式のバージョン(形式を変えたら上げる)
+FORMAT_VERSION = 1
+
+
+def save_topology(path: str, topology: dict[str, Any], key: tuple = ()) -> None:
+    # 書き込み途中のファイルを読まないように一時ファイルに書いてから置き換える
+    # 一時ファイルは書き込むプロセスごとに別の名前にする(同じキーを同時に作成したワーカーの書き込みが混ざらない)
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path) or ".", suffix=".tmp", delete=False) as f:
+        try:
+            np.savez(f, format_version=FORMAT_VERSION, key=np.array(key, dtype=np.uint64),
+                     **{field: np.asarray(topology[field]) for field in TOPOLOGY_FIELDS})
+        except BaseException:
+            f.close()
+            os.remove(f.name)
+            raise
+    os.replace(f.name, path)
+
+
+def load_topology(path: str) -> dict[str, Any]:
+    with np.load(path) as data:
+        if int(data["format_version"]) != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported topology format {int(data['format_version'])}")
+        topology = {field: data[field] for field in TOPOLOGY_FIELDS}
+        topology["key"] = tuple(int(value) for value in data["key"])
+    return topology
+
+
+class TopologyLibrary:
+    # build(num_nodes, edge_num, optimal_route_length, seed)はトポロジーの辞書を返す関数
+    # (ワーカーに渡せるようにモジュールのトップレベルの関数にする)
+    def __init__(self, root: str, build: Callable[[int, int, int, int], dict[str, Any]]) -> None:
+        self.root = root
+        self.build = build
+
+    def path(self, key: tuple[int, int, int, int]) -> str:
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.root, digest[:2], f"{digest}.npz")
+
+    def get(self, num_nodes: int, edge_num: int, optimal_route_length: int, seed: int) -> dict[str, Any]:
+        key = (num_nodes, edge_num, optimal_route_length, seed)
+        path = self.path(key)
+        if os.path.exists(path):
+            topology = load_topology(path)
+            if topology["key"] == key:
+                return topology
+
+        topology = self.build(*key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        save_topology(path, topology, key)
+        return topology
@@ -7,13 +7,17 @@
 # TODO データベースのテーブルを変更
 
 
-from base import Params, Link, Node, Packet, Ant, Interest, Rand, Network, DBLogger, Simulation
-from typing import Dict, Tuple, ClassVar, Self, TYPE_CHECKING, cast, Any
+from base import Params, Link, Node, Packet, Ant, Interest, Rand, Network, DBLogger, Simulation, default_storage, async_default_storage, run_simulation
+from typing import Dict, Tuple, ClassVar, Self, TYPE_CHECKING, cast, Any, Callable
 import random
 import traceback
 import math
+import numpy as np
 import psycopg2
-from multiprocessing import Pool
+from sweep import run_sweep
+from parameter_registry import ParameterRegistry
+from csr import CSRNetwork, LazyCSRNetwork
+from evaporation import evaporate_degree_floor, degree_floor
 
 # ネットワーク作成後にノードの次元数に基づいたフェロモン最小値を代入
 def set_pheromone_based_on_dimension(self: Network, params: Params) -> None:
@@ -37,110 +41,36 @@ def volitile_pheromone_based_on_dimension(self: Network, params: Params) -> None
             else:
                 link.pheromone = tmp
 
-def main(params: Params):
-    
-    # Networkクラスにset_pheromone_based_on_dimensionメソッド追加
-    Network.set_pheromone_based_on_dimension = set_pheromone_based_on_dimension
-
-    # Networkクラスのvolitile_pheromoneメソッドを差し替え
-    Network.volitile_pheromone = volitile_pheromone_based_on_dimension
-
-    # ネットワーク作成後にset_pheromone_based_on_dimension()を実行する手順を追加
-    try:
-        # DBLoggerインスタンス作成
-        dblogger = DBLogger("asaken_n40", "asaken_N40",
-                            "localhost", "simulation", "5432")
-
-        dblogger.connect()
-
-        # パラメータを登録&パラメータIDを取得
-        params.id = dblogger.insert_conflict(
-            params.generate_insert_or_return_id_query())
-        print(params.id)
-        if params.id is None:
-            params.id: int = dblogger.fetch_result(
-                params.generate_select_query())[0][0]
-            print(params.id)
-
-        # Simulationインスタンス作成
-        simulation = Simulation(dblogger, params)
-
-        # シミュレーションを登録&シミュレーションIDを取得
-        simulation.id = dblogger.insert_and_get_id(
-            simulation.generate_insert_query())
-
-        # 任意の個数ノードインスタンスを作成
-        simulation.network.yield_nodes(params)
-
-        # BAモデルになるようにノードを接続
-        simulation.network.make_ba_model(params, 3)
-
-        # 最適ルートを作成
-        simulation.network.make_optimal_route(params)
-
-        # ノードのフェロモンをノードのエッジ数によって変化させる
-        simulation.network.set_pheromone_based_on_dimension(params)
-
-        # ノードを登録&ノードIDを取得
-        for node in simulation.network.nodes:
-            node.id = dblogger.insert_and_get_id(
-                node.generate_insert_query(simulation.id))
-
-        # 任意の回数Generationを繰り返す
-        for generation_count in range(params.generation_limit):
-
-            # Genaerationを登録&GenerationIDを取得
-            generation_id = dblogger.insert_and_get_id(
-                f'INSERT INTO generations (simulationid, generation_count) VALUES ({simulation.id},{generation_count});')
-
-            # Connectionsを登録
-            for startnode in simulation.network.nodes:
-                for endnode, link in node.neighbors.items():
-                    dblogger.insert_and_get_id(
-                        f'INSERT INTO connections (GenerationID, StartNodeID, EndNodeID, Pheromone, Width) VALUES ({generation_id},{startnode.id},{endnode.id},{link.pheromone},{link.width});')
-
-            # antとinterestの生成
-            simulation.ant = Ant(
-                simulation.network.start_node, simulation.network.end_node)
-            simulation.interest = Interest(
-                simulation.network.start_node, simulation.network.end_node)
-
-            # antの移動
-            simulation.ant.hop_if_movable(params)
-
-            # 目的地に到達していたらフェロモン付加
-            if simulation.ant.is_at_destination():
-                simulation.network.add_pheromone_to_ant_route(simulation.ant)
-
-            # antの結果を登録
-            dblogger.execute_query(
-                simulation.ant.get_insert_query(generation_id))
-
-            # antをNoneにして消去
-            simulation.ant = None
-
-            # interestの移動
-            simulation.interest.hop_if_movable(params)
-
-            # interestの結果を登録
-            dblogger.execute_query(
-                simulation.interest.get_insert_query(generation_id))
-
-            # interestをNoneにして消去
-            simulation.interest = None
-
-            # フェロモン揮発
-            simulation.network.volitile_pheromone(params)
-
-        dblogger.commit()
-
-    except Exception as e:
-        print(e)
-        dblogger.rollback()
-        print(traceback.format_exc())
-
-    finally:
-        dblogger.close()
+# set_pheromone_based_on_dimensionのCSRNetwork版
+def set_pheromone_based_on_dimension_csr(self: CSRNetwork, params: Params) -> None:
+    self.pheromone[:] = params.pheromone_min * 3 // self.edge_degree()
+    self.touch_edges(np.arange(self.num_edges))
+
+# volitile_pheromone_based_on_dimensionのCSRNetwork版
+def volitile_pheromone_based_on_dimension_csr(self: CSRNetwork, params: Params) -> None:
+    before = self.pheromone.copy()
+    evaporate_degree_floor(self.pheromone, self.edge_degree(), params.volatility,
+                           params.pheromone_min, params.pheromone_max)
+    self.touch_changed(before)
+
+# set_pheromone_based_on_dimensionのLazyCSRNetwork版(揮発は読み出し時に計算するので下限も設定しておく)
+def set_pheromone_based_on_dimension_lazy(self: LazyCSRNetwork, params: Params) -> None:
+    set_pheromone_based_on_dimension_csr(self, params)
+    self.set_decay(params.volatility, degree_floor(self.edge_degree(), params.pheromone_min), params.pheromone_max)
+
+# network_classごとの揮発の関数とネットワークの準備(base.run_simulationのvolitile_pheromone, prepare_network)
+# ネットワーク作成後にset_pheromone_based_on_dimension()を実行する
+VOLITILE_PHEROMONE = {Network: volitile_pheromone_based_on_dimension,
+                      CSRNetwork: volitile_pheromone_based_on_dimension_csr,
+                      LazyCSRNetwork: LazyCSRNetwork.volitile_pheromone}
+PREPARE_NETWORK = {Network: set_pheromone_based_on_dimension,
+                   CSRNetwork: set_pheromone_based_on_dimension_csr,
+                   LazyCSRNetwork: set_pheromone_based_on_dimension_lazy}
+
+# 引数はbase.run_simulationと同じ
+def main(params: Params, network_class: type = Network, **kwargs: Any):
+    return run_simulation(params, network_class, volitile_pheromone=VOLITILE_PHEROMONE[network_class],
+                          prepare_network=PREPARE_NETWORK[network_class], **kwargs)
 
 
 if __name__ == "__main__":
@@ -155,5 +85,5 @@ if __name__ == "__main__":
                     generation_limit=2,
                     simulation_count=1)
 
-    with Pool() as p:
-        p.map(main, [params] * params.simulation_count)
\ No newline at end of file
+    # params.simulation_count回の複製を並列に実行(シードはbase_seedから決まるので再現できる)
+    run_sweep(main, [params], params.simulation_count, storage=async_default_storage, registry=ParameterRegistry(default_storage))
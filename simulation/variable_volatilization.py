@@ -1,13 +1,16 @@
 # 可変揮発量方式
 # 帯域の大きさによって揮発量を変化させる
 # TODO 揮発時ににwidthが小さいほど揮発量を大きくするよう変更
-from base import Params, Link, Node, Packet, Ant, Interest, Rand, Network, DBLogger, Simulation
-from typing import Dict, Tuple, ClassVar, Self, TYPE_CHECKING, cast, Any
+from base import Params, Link, Node, Packet, Ant, Interest, Rand, Network, DBLogger, Simulation, default_storage, async_default_storage, run_simulation
+from typing import Dict, Tuple, ClassVar, Self, TYPE_CHECKING, cast, Any, Callable
 import random
 import traceback
 import math
 import psycopg2
-from multiprocessing import Pool
+from sweep import run_sweep
+from parameter_registry import ParameterRegistry
+from csr import CSRNetwork, LazyCSRNetwork
+from evaporation import evaporate_width_rate, width_rate
 
 # 揮発時にwidthが小さいほど揮発量を大きくする
 
@@ -26,104 +29,30 @@ def volitile_pheromone_based_on_width(self: Network, params: Params) -> None:
                 link.pheromone = tmp
 
 
-def main(params: Params):
+# volitile_pheromone_based_on_widthのCSRNetwork版
+def volitile_pheromone_based_on_width_csr(self: CSRNetwork, params: Params) -> None:
+    before = self.pheromone.copy()
+    evaporate_width_rate(self.pheromone, self.width,
+                         params.pheromone_min, params.pheromone_max)
+    self.touch_changed(before)
 
-    # Networkクラスのvolitile_pheromoneメソッドを差し替え
-    Network.volitile_pheromone = volitile_pheromone_based_on_width
 
-    # 接続先DB以外はもとのmain関数と同じ
-    try:
-        # DBLoggerインスタンス作成
-        dblogger = DBLogger("asaken_n40", "asaken_N40",
-                            "localhost", "simulation", "5432")
+# volitile_pheromone_based_on_widthのLazyCSRNetwork版(揮発は読み出し時に計算するので揮発率を設定しておく)
+def set_decay_based_on_width(self: LazyCSRNetwork, params: Params) -> None:
+    self.set_decay(width_rate(self.width), params.pheromone_min, params.pheromone_max)
 
-        dblogger.connect()
 
-        # パラメータを登録&パラメータIDを取得
-        params.id = dblogger.insert_conflict(
-            params.generate_insert_or_return_id_query())
-        print(params.id)
-        if params.id is None:
-            params.id: int = dblogger.fetch_result(
-                params.generate_select_query())[0][0]
-            print(params.id)
+# network_classごとの揮発の関数とネットワークの準備(base.run_simulationのvolitile_pheromone, prepare_network)
+VOLITILE_PHEROMONE = {Network: volitile_pheromone_based_on_width,
+                      CSRNetwork: volitile_pheromone_based_on_width_csr,
+                      LazyCSRNetwork: LazyCSRNetwork.volitile_pheromone}
+PREPARE_NETWORK = {Network: None, CSRNetwork: None, LazyCSRNetwork: set_decay_based_on_width}
 
-        # Simulationインスタンス作成
-        simulation = Simulation(dblogger, params)
 
-        # シミュレーションを登録&シミュレーションIDを取得
-        simulation.id = dblogger.insert_and_get_id(
-            simulation.generate_insert_query())
-
-        # 任意の個数ノードインスタンスを作成
-        simulation.network.yield_nodes(params)
-
-        # BAモデルになるようにノードを接続
-        simulation.network.make_ba_model(params, 3)
-
-        # 最適ルートを作成
-        simulation.network.make_optimal_route(params)
-
-        # ノードを登録&ノードIDを取得
-        for node in simulation.network.nodes:
-            node.id = dblogger.insert_and_get_id(
-                node.generate_insert_query(simulation.id))
-
-        # 任意の回数Generationを繰り返す
-        for generation_count in range(params.generation_limit):
-
-            # Genaerationを登録&GenerationIDを取得
-            generation_id = dblogger.insert_and_get_id(
-                f'INSERT INTO generations (simulationid, generation_count) VALUES ({simulation.id},{generation_count});')
-
-            # Connectionsを登録
-            for startnode in simulation.network.nodes:
-                for endnode, link in node.neighbors.items():
-                    dblogger.insert_and_get_id(
-                        f'INSERT INTO connections (GenerationID, StartNodeID, EndNodeID, Pheromone, Width) VALUES ({generation_id},{startnode.id},{endnode.id},{link.pheromone},{link.width});')
-
-            # antとinterestの生成
-            simulation.ant = Ant(
-                simulation.network.start_node, simulation.network.end_node)
-            simulation.interest = Interest(
-                simulation.network.start_node, simulation.network.end_node)
-
-            # antの移動
-            simulation.ant.hop_if_movable(params)
-
-            # 目的地に到達していたらフェロモン付加
-            if simulation.ant.is_at_destination():
-                simulation.network.add_pheromone_to_ant_route(simulation.ant)
-
-            # antの結果を登録
-            dblogger.execute_query(
-                simulation.ant.get_insert_query(generation_id))
-
-            # antをNoneにして消去
-            simulation.ant = None
-
-            # interestの移動
-            simulation.interest.hop_if_movable(params)
-
-            # interestの結果を登録
-            dblogger.execute_query(
-                simulation.interest.get_insert_query(generation_id))
-
-            # interestをNoneにして消去
-            simulation.interest = None
-
-            # フェロモン揮発
-            simulation.network.volitile_pheromone(params)
-
-        dblogger.commit()
-
-    except Exception as e:
-        print(e)
-        dblogger.rollback()
-        print(traceback.format_exc())
-
-    finally:
-        dblogger.close()
+# 揮発の関数を差し替える以外はもとのmain関数と同じ(引数はbase.run_simulationと同じ)
+def main(params: Params, network_class: type = Network, **kwargs: Any):
+    return run_simulation(params, network_class, volitile_pheromone=VOLITILE_PHEROMONE[network_class],
+                          prepare_network=PREPARE_NETWORK[network_class], **kwargs)
 
 
 if __name__ == "__main__":
@@ -138,5 +67,5 @@ if __name__ == "__main__":
                     generation_limit=2,
                     simulation_count=1)
 
-    with Pool() as p:
-        p.map(main, [params] * params.simulation_count)
+    # params.simulation_count回の複製を並列に実行(シードはbase_seedから決まるので再現できる)
+    run_sweep(main, [params], params.simulation_count, storage=async_default_storage, registry=ParameterRegistry(default_storage))
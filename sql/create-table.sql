@@ -1,3 +1,6 @@
+-- 初期のテーブル構成
+-- 既存のデータベースはsql/migrate.pyでsql/migrations/のマイグレーションを適用して最新の構成にする
+
 CREATE TABLE Parameters (
     ParameterID SERIAL PRIMARY KEY,
     NumberOfNodes int,
@@ -81,3 +84,25 @@ CREATE TABLE Rands (
     FOREIGN KEY (DestinationNodeID) REFERENCES Nodes(NodeID),
     PRIMARY KEY (GenerationID)
 );
+
+-- Connectionsを差分で登録する場合に全行を登録した世代(キーフレーム)
+-- キーフレーム以外の世代のConnectionsには前の世代から変化した行だけが入る
+-- あるシミュレーションの行が1つもなければ全ての世代が全行登録
+CREATE TABLE ConnectionKeyframes (
+    GenerationID Bigint,
+    FOREIGN KEY (GenerationID) REFERENCES Generations(GenerationID),
+    PRIMARY KEY (GenerationID)
+);
+
+-- 世代ごとのRouteBottleneckの回数(同じParameterIDの全シミュレーションの合計)
+-- PacketTypeはAnts, Interests, Rands
+-- シミュレーションの終了時に回数を加算する(simulation/histogram.py)
+CREATE TABLE BottleneckHistograms (
+    ParameterID int,
+    PacketType varchar(16),
+    generation_count int,
+    RouteBottleneck int,
+    Count Bigint,
+    FOREIGN KEY (ParameterID) REFERENCES Parameters(ParameterID),
+    PRIMARY KEY (ParameterID, PacketType, generation_count, RouteBottleneck)
+);
@@ -0,0 +1,127 @@
+# データベースのマイグレーションツール
+# create-table.sqlで作成したデータベースに、migrations/の<バージョン>_<名前>.sqlをバージョン順に適用する
+# 適用済みのバージョンはschema_migrationsテーブルに記録し、1ファイルを1トランザクションで適用する
+#
+# 使い方
+#   python migrate.py                        # 未適用のマイグレーションを全て適用
+#   python migrate.py status                 # 各マイグレーションの適用状況を表示
+#   python migrate.py partition <id> ...     # ParameterIDのパーティションを事前に作成
+#   python migrate.py detach <id>            # ParameterIDのパーティションを切り離す(テーブルは<テーブル名>_p<id>として残るのでpg_dumpでアーカイブできる)
+#   python migrate.py drop <id>              # ParameterIDのパーティションを削除
+import os
+import re
+import sys
+import traceback
+import psycopg2
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "migrations")
+
+# ParameterIDで分割しているテーブル(0003_partition_by_parameter.sql)
+PARTITIONED_TABLES = ["connections", "ants", "interests", "rands"]
+
+
+def connect():
+    return psycopg2.connect(
+        dbname="simulation",
+        user="asaken_n40",
+        password="asaken_N40",
+        host="localhost",
+        port="5432"
+    )
+
+
+# migrations/の(バージョン, 名前, パス)をバージョン順に返す
+def migrations() -> list[tuple[int, str, str]]:
+    result = []
+    for file_name in os.listdir(MIGRATIONS_DIR):
+        match = re.fullmatch(r"(\d+)_(\w+)\.sql", file_name)
+        if match:
+            result.append((int(match.group(1)), match.group(2),
+                          os.path.join(MIGRATIONS_DIR, file_name)))
+    return sorted(result)
+
+
+def applied_versions(cur) -> set[int]:
+    cur.execute("""CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version int PRIMARY KEY,
+                    name text,
+                    applied_at timestamptz DEFAULT now()
+                );""")
+    cur.execute("SELECT version FROM schema_migrations;")
+    return {row[0] for row in cur.fetchall()}
+
+
+def migrate(conn) -> None:
+    cur = conn.cursor()
+    applied = applied_versions(cur)
+    conn.commit()
+    for version, name, path in migrations():
+        if version in applied:
+            continue
+        print(f"applying {version:04d}_{name}")
+        with open(path) as f:
+            cur.execute(f.read())
+        cur.execute(
+            "INSERT INTO schema_migrations (version, name) VALUES (%s, %s);", (version, name))
+        conn.commit()
+    cur.close()
+
+
+def status(conn) -> None:
+    cur = conn.cursor()
+    applied = applied_versions(cur)
+    conn.commit()
+    for version, name, _ in migrations():
+        print(f"{'applied' if version in applied else 'pending'}  {version:04d}_{name}")
+    cur.close()
+
+
+def partition(conn, parameter_ids: list[int]) -> None:
+    cur = conn.cursor()
+    for parameter_id in parameter_ids:
+        cur.execute("SELECT create_parameter_partitions(%s);", (parameter_id,))
+    conn.commit()
+    cur.close()
+
+
+def detach(conn, parameter_id: int) -> None:
+    cur = conn.cursor()
+    for table in PARTITIONED_TABLES:
+        cur.execute(
+            f"ALTER TABLE {table} DETACH PARTITION {table}_p{parameter_id};")
+    conn.commit()
+    cur.close()
+
+
+def drop(conn, parameter_id: int) -> None:
+    cur = conn.cursor()
+    for table in PARTITIONED_TABLES:
+        cur.execute(f"DROP TABLE IF EXISTS {table}_p{parameter_id};")
+    conn.commit()
+    cur.close()
+
+
+if __name__ == "__main__":
+    try:
+        conn = connect()
+        command = sys.argv[1] if len(sys.argv) > 1 else "migrate"
+        if command == "migrate":
+            migrate(conn)
+        elif command == "status":
+            status(conn)
+        elif command == "partition":
+            partition(conn, [int(arg) for arg in sys.argv[2:]])
+        elif command == "detach":
+            detach(conn, int(sys.argv[2]))
+        elif command == "drop":
+            drop(conn, int(sys.argv[2]))
+        else:
+            raise ValueError(f"unknown command: {command}")
+
+    except Exception as e:
+        print(e)
+        conn.rollback()
+        print(traceback.format_exc())
+
+    finally:
+        conn.close()
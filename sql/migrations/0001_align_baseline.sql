@@ -0,0 +1,46 @@
+-- create-table.sqlで作成した既存のデータベースをシミュレーションが使う列・テーブルに合わせる
+-- 既に存在する場合は何もしない
+
+-- シミュレーションが登録している列
+ALTER TABLE Generations ADD COLUMN IF NOT EXISTS generation_count int;
+ALTER TABLE Nodes ADD COLUMN IF NOT EXISTS Num_of_connections int;
+
+-- Params.generate_insert_or_return_id_queryのON CONFLICTに必要な一意性
+CREATE UNIQUE INDEX IF NOT EXISTS parameters_values_key
+    ON Parameters (NumberOfNodes, optimalPathLength, Volatility, MinPheromone, MaxPheromone, TTL, bata, GenerationLimit);
+
+CREATE TABLE IF NOT EXISTS ConnectionKeyframes (
+    GenerationID Bigint,
+    FOREIGN KEY (GenerationID) REFERENCES Generations(GenerationID),
+    PRIMARY KEY (GenerationID)
+);
+
+CREATE TABLE IF NOT EXISTS BottleneckHistograms (
+    ParameterID int,
+    PacketType varchar(16),
+    generation_count int,
+    RouteBottleneck int,
+    Count Bigint,
+    FOREIGN KEY (ParameterID) REFERENCES Parameters(ParameterID),
+    PRIMARY KEY (ParameterID, PacketType, generation_count, RouteBottleneck)
+);
+
+-- 登録済みのAnts, Interestsの行からヒストグラムを作る(このマイグレーション以前のシミュレーションの分)
+-- 以降のシミュレーションは終了時に自分の回数を加算する
+INSERT INTO BottleneckHistograms (ParameterID, PacketType, generation_count, RouteBottleneck, Count)
+SELECT simulations.ParameterID, 'Ants', generations.generation_count, ants.RouteBottleneck, COUNT(*)
+FROM ants
+JOIN generations ON ants.GenerationID = generations.GenerationID
+JOIN simulations ON generations.SimulationID = simulations.SimulationID
+WHERE generations.generation_count IS NOT NULL
+GROUP BY simulations.ParameterID, generations.generation_count, ants.RouteBottleneck
+ON CONFLICT (ParameterID, PacketType, generation_count, RouteBottleneck) DO NOTHING;
+
+INSERT INTO BottleneckHistograms (ParameterID, PacketType, generation_count, RouteBottleneck, Count)
+SELECT simulations.ParameterID, 'Interests', generations.generation_count, interests.RouteBottleneck, COUNT(*)
+FROM interests
+JOIN generations ON interests.GenerationID = generations.GenerationID
+JOIN simulations ON generations.SimulationID = simulations.SimulationID
+WHERE generations.generation_count IS NOT NULL
+GROUP BY simulations.ParameterID, generations.generation_count, interests.RouteBottleneck
+ON CONFLICT (ParameterID, PacketType, generation_count, RouteBottleneck) DO NOTHING;
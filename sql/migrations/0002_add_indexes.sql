@@ -0,0 +1,9 @@
+-- 分析のクエリはsimulations.parameterid, generations.generation_countで絞り込み、generationidで結合する
+-- Ants, Interests, Rands, Connectionsは主キーの先頭がGenerationIDなので結合にはその索引を使える
+
+CREATE INDEX IF NOT EXISTS simulations_parameterid_idx ON Simulations (ParameterID);
+
+-- シミュレーションの全世代・特定の世代をまとめて引く(snapshot.load_connectionsなど)
+CREATE INDEX IF NOT EXISTS generations_simulationid_generation_count_idx ON Generations (SimulationID, generation_count);
+
+CREATE INDEX IF NOT EXISTS nodes_simulationid_idx ON Nodes (SimulationID);
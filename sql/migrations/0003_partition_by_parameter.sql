@@ -0,0 +1,95 @@
+-- Connections, Ants, Interests, RandsをParameterIDごとのパーティションに分割する
+-- パーティション名は<テーブル名>_p<ParameterID>で、古いパラメータの結果は
+-- migrate.pyのdetach(切り離してアーカイブ)かdrop(削除)でDELETEせずに消せる
+--
+-- 各テーブルにParameterID列を追加し、主キーにも含める(パーティションのキーは主キーに含める必要がある)
+-- GenerationID, NodeIDへの外部キーは付けない
+-- 外部キーがあるとパーティションの追加時に参照先(Generations, Nodes)をロックし、実行中の他のシミュレーションを待つため
+-- IDはシミュレーションが同じトランザクション内でシーケンスから予約した値を使うので参照先は必ず存在する
+
+-- パーティションの作成
+-- CREATE TABLE ... PARTITION OFは親テーブルをACCESS EXCLUSIVEでロックするので、
+-- LIKEで作ったテーブルをATTACH PARTITION(SHARE UPDATE EXCLUSIVE)し、実行中のCOPYを止めないようにする
+CREATE OR REPLACE FUNCTION create_parameter_partitions(parameter_id int) RETURNS void AS $$
+DECLARE
+    parent text;
+    partition text;
+BEGIN
+    -- 同じパラメータのワーカーが同時に作成しないようにする
+    PERFORM pg_advisory_xact_lock(hashtext('create_parameter_partitions'), parameter_id);
+    FOREACH parent IN ARRAY ARRAY['connections', 'ants', 'interests', 'rands'] LOOP
+        partition := parent || '_p' || parameter_id;
+        IF to_regclass(partition) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition, parent);
+            EXECUTE format('ALTER TABLE %I ADD CHECK (parameterid = %s)', partition, parameter_id);
+            EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES IN (%s)', parent, partition, parameter_id);
+        END IF;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 分析用のマテリアライズドビュー(analysis/bottleneck_queries.py)は退避するテーブルに依存するので削除する
+-- 適用後にpython bottleneck_queries.py createで作り直す
+DROP MATERIALIZED VIEW IF EXISTS ant_bottleneck_distribution, interest_bottleneck_distribution, rand_bottleneck_distribution;
+
+-- 既存のテーブルを退避して分割したテーブルを作る
+ALTER TABLE Connections RENAME TO connections_unpartitioned;
+ALTER TABLE Ants RENAME TO ants_unpartitioned;
+ALTER TABLE Interests RENAME TO interests_unpartitioned;
+ALTER TABLE Rands RENAME TO rands_unpartitioned;
+
+CREATE TABLE Connections (
+    ParameterID int NOT NULL,
+    GenerationID Bigint,
+    StartNodeID Bigint,
+    EndNodeID Bigint,
+    Width int,
+    Pheromone int,
+    PRIMARY KEY (GenerationID, StartNodeID, EndNodeID, ParameterID)
+) PARTITION BY LIST (ParameterID);
+
+CREATE TABLE Ants (
+    ParameterID int NOT NULL,
+    GenerationID Bigint,
+    SourceNodeID Bigint,
+    DestinationNodeID Bigint,
+    RouteNodesID Bigint[],
+    RouteWidths int[],
+    RouteBottleneck int,
+    PRIMARY KEY (GenerationID, ParameterID)
+) PARTITION BY LIST (ParameterID);
+
+CREATE TABLE Interests (LIKE Ants INCLUDING DEFAULTS INCLUDING CONSTRAINTS, PRIMARY KEY (GenerationID, ParameterID)) PARTITION BY LIST (ParameterID);
+CREATE TABLE Rands (LIKE Ants INCLUDING DEFAULTS INCLUDING CONSTRAINTS, PRIMARY KEY (GenerationID, ParameterID)) PARTITION BY LIST (ParameterID);
+
+-- 登録済みの全パラメータのパーティションを作成し、退避した行を移す
+SELECT create_parameter_partitions(ParameterID) FROM Parameters;
+
+INSERT INTO Connections (ParameterID, GenerationID, StartNodeID, EndNodeID, Width, Pheromone)
+SELECT simulations.ParameterID, c.GenerationID, c.StartNodeID, c.EndNodeID, c.Width, c.Pheromone
+FROM connections_unpartitioned c
+JOIN generations ON c.GenerationID = generations.GenerationID
+JOIN simulations ON generations.SimulationID = simulations.SimulationID;
+
+INSERT INTO Ants (ParameterID, GenerationID, SourceNodeID, DestinationNodeID, RouteNodesID, RouteWidths, RouteBottleneck)
+SELECT simulations.ParameterID, p.GenerationID, p.SourceNodeID, p.DestinationNodeID, p.RouteNodesID, p.RouteWidths, p.RouteBottleneck
+FROM ants_unpartitioned p
+JOIN generations ON p.GenerationID = generations.GenerationID
+JOIN simulations ON generations.SimulationID = simulations.SimulationID;
+
+INSERT INTO Interests (ParameterID, GenerationID, SourceNodeID, DestinationNodeID, RouteNodesID, RouteWidths, RouteBottleneck)
+SELECT simulations.ParameterID, p.GenerationID, p.SourceNodeID, p.DestinationNodeID, p.RouteNodesID, p.RouteWidths, p.RouteBottleneck
+FROM interests_unpartitioned p
+JOIN generations ON p.GenerationID = generations.GenerationID
+JOIN simulations ON generations.SimulationID = simulations.SimulationID;
+
+INSERT INTO Rands (ParameterID, GenerationID, SourceNodeID, DestinationNodeID, RouteNodesID, RouteWidths, RouteBottleneck)
+SELECT simulations.ParameterID, p.GenerationID, p.SourceNodeID, p.DestinationNodeID, p.RouteNodesID, p.RouteWidths, p.RouteBottleneck
+FROM rands_unpartitioned p
+JOIN generations ON p.GenerationID = generations.GenerationID
+JOIN simulations ON generations.SimulationID = simulations.SimulationID;
+
+DROP TABLE connections_unpartitioned;
+DROP TABLE ants_unpartitioned;
+DROP TABLE interests_unpartitioned;
+DROP TABLE rands_unpartitioned;
@@ -0,0 +1,11 @@
+-- 実行中のシミュレーションのチェックポイント(simulation/checkpoint.py)
+-- 定期的なcommitと同じトランザクションで置き換えるので、commitした世代と常に一致する
+-- Stateはcheckpoint.Checkpointをpickleしたもの、generation_countは次に実行する世代
+-- シミュレーションが最後まで終わったら行を削除する(残っている行は中断したシミュレーション)
+CREATE TABLE IF NOT EXISTS Checkpoints (
+    SimulationID int,
+    generation_count int,
+    State bytea,
+    FOREIGN KEY (SimulationID) REFERENCES Simulations(SimulationID),
+    PRIMARY KEY (SimulationID)
+);
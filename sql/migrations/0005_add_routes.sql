@@ -0,0 +1,37 @@
+-- 経路の表(同じ経路は1行だけ登録する)
+-- RouteIDはノードの並びのハッシュで、simulation/storage.pyのroute_idと同じ値になる
+-- Ants, Interests, RandsはRouteIDで経路を参照し、RouteNodesID, RouteWidthsはNULLにする
+-- 経路ごとの回数は SELECT RouteID, COUNT(*) FROM Ants WHERE ParameterID = ... GROUP BY RouteID; で求められる
+
+-- ノードの並びをカンマ区切りにした文字列のmd5の先頭64bitを符号付き整数にしたもの
+CREATE OR REPLACE FUNCTION route_id(route_nodes_id Bigint[]) RETURNS Bigint AS $$
+    SELECT ('x' || substr(md5(array_to_string(route_nodes_id, ',')), 1, 16))::bit(64)::Bigint;
+$$ LANGUAGE sql IMMUTABLE STRICT;
+
+CREATE TABLE IF NOT EXISTS Routes (
+    RouteID Bigint,
+    RouteNodesID Bigint[],
+    RouteWidths int[],
+    PRIMARY KEY (RouteID)
+);
+
+-- パーティションにも追加される(以降に作成するパーティションはLIKEで列を引き継ぐ)
+ALTER TABLE Ants ADD COLUMN IF NOT EXISTS RouteID Bigint;
+ALTER TABLE Interests ADD COLUMN IF NOT EXISTS RouteID Bigint;
+ALTER TABLE Rands ADD COLUMN IF NOT EXISTS RouteID Bigint;
+
+-- 登録済みの行の経路もRoutesに移す
+INSERT INTO Routes (RouteID, RouteNodesID, RouteWidths)
+SELECT DISTINCT ON (route_id(RouteNodesID)) route_id(RouteNodesID), RouteNodesID, RouteWidths
+FROM (
+    SELECT RouteNodesID, RouteWidths FROM Ants WHERE RouteNodesID IS NOT NULL
+    UNION ALL
+    SELECT RouteNodesID, RouteWidths FROM Interests WHERE RouteNodesID IS NOT NULL
+    UNION ALL
+    SELECT RouteNodesID, RouteWidths FROM Rands WHERE RouteNodesID IS NOT NULL
+) routes
+ON CONFLICT (RouteID) DO NOTHING;
+
+UPDATE Ants SET RouteID = route_id(RouteNodesID), RouteNodesID = NULL, RouteWidths = NULL WHERE RouteNodesID IS NOT NULL;
+UPDATE Interests SET RouteID = route_id(RouteNodesID), RouteNodesID = NULL, RouteWidths = NULL WHERE RouteNodesID IS NOT NULL;
+UPDATE Rands SET RouteID = route_id(RouteNodesID), RouteNodesID = NULL, RouteWidths = NULL WHERE RouteNodesID IS NOT NULL;
@@ -0,0 +1,7 @@
+# simulation/, analysis/のモジュールは互いに "from base import ..." のように読み込むので、両方をパスに追加する
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "analysis"))
+sys.path.insert(0, os.path.join(ROOT, "simulation"))
@@ -0,0 +1,34 @@
+# BAモデルの辺の生成(generate_ba_edges)の確認
+import numpy as np
+from base import generate_ba_edges
+
+
+def test_same_seed_same_edges() -> None:
+    first = generate_ba_edges(500, 3, 7)
+    second = generate_ba_edges(500, 3, 7)
+    for a, b in zip(first, second):
+        np.testing.assert_array_equal(a, b)
+    assert not np.array_equal(first[1], generate_ba_edges(500, 3, 8)[1])
+
+
+def test_edges_are_simple_and_complete() -> None:
+    num_nodes, edge_num = 500, 3
+    sources, targets, widths = generate_ba_edges(num_nodes, edge_num, 7)
+    # 初期ネットワークの3辺 + 新しいノードごとにmin(edge_num, i)辺
+    assert len(sources) == 3 + sum(min(edge_num, i) for i in range(3, num_nodes))
+    assert np.all(sources != targets)
+    # 新しいノードは既存のノードにだけ接続する
+    assert np.all(targets[3:] < sources[3:])
+    edges = {frozenset(edge) for edge in zip(sources.tolist(), targets.tolist())}
+    assert len(edges) == len(sources)
+    assert set(np.unique(np.concatenate([sources, targets])).tolist()) == set(range(num_nodes))
+    assert np.all((widths >= 10) & (widths <= 100) & (widths % 10 == 0))
+
+
+def test_preferential_attachment() -> None:
+    # 次数に比例して接続先を選ぶので、古いノードほど次数が大きくなる
+    num_nodes = 2000
+    sources, targets, _ = generate_ba_edges(num_nodes, 3, 7)
+    degree = np.bincount(np.concatenate([sources, targets]), minlength=num_nodes)
+    assert degree[:20].mean() > 5 * degree[-500:].mean()
+    assert degree.max() > 10 * 3
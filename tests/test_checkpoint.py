@@ -0,0 +1,86 @@
+# 途中で中断したシミュレーションをチェックポイントから再開した結果が、中断しなかった場合と同じになることの確認
+import contextlib
+import io
+import random
+import sqlite3
+from functools import partial
+import pytest
+import base
+import both
+import colony
+import variable_min_pheromone
+import variable_volatilization
+from base import Params
+from csr import CSRNetwork, LazyCSRNetwork
+from storage import SQLiteLogger, async_storage
+
+TABLES = ["Connections", "ConnectionKeyframes", "Ants", "Interests", "Routes", "BottleneckHistograms", "Nodes", "Generations", "Checkpoints"]
+
+
+def make_params() -> Params:
+    return Params(num_nodes=60, optimal_route_length=6, volatility=0.99, pheromone_min=100,
+                  pheromone_max=2**20, ttl=100, bata=1, generation_limit=20, simulation_count=1)
+
+
+class InterruptedLogger(SQLiteLogger):
+    # fail_at回目のinsert_packetで例外を出して中断する
+    def __init__(self, path: str, fail_at: int | None) -> None:
+        super().__init__(path)
+        self.fail_at = fail_at
+        self.count = 0
+
+    def insert_packet(self, table: str, generation_id: int, packet) -> None:
+        self.count += 1
+        if self.count == self.fail_at:
+            raise RuntimeError("interrupted")
+        super().insert_packet(table, generation_id, packet)
+
+
+def dump(path: str) -> list[list[tuple]]:
+    connector = sqlite3.connect(path)
+    return [connector.execute(f"SELECT * FROM {table} ORDER BY 1;").fetchall() for table in TABLES]
+
+
+def run(main, path: str, fail_at: int | None, asynchronous: bool, **kwargs):
+    storage = partial(InterruptedLogger, path, fail_at)
+    if asynchronous:
+        storage = partial(async_storage, storage, 4)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return main(make_params(), storage=storage, **kwargs)
+
+
+CASES = {
+    "base-Network": (base.main, {"network_class": base.Network}),
+    "base-CSRNetwork": (base.main, {"network_class": CSRNetwork}),
+    "base-LazyCSRNetwork": (base.main, {"network_class": LazyCSRNetwork}),
+    "base-keyframe": (base.main, {"network_class": CSRNetwork, "keyframe_interval": 4}),
+    "variable_min_pheromone": (variable_min_pheromone.main, {"network_class": CSRNetwork}),
+    "variable_volatilization": (variable_volatilization.main, {"network_class": LazyCSRNetwork}),
+    "both": (both.main, {"network_class": base.Network}),
+    "colony": (colony.main, {"colony_size": 8}),
+}
+COMMITS = {
+    "interval": ({"commit_interval": 5}, False),
+    "rows-async": ({"commit_rows": 1000}, True),
+    "interval-async": ({"commit_interval": 3}, True),
+}
+
+
+@pytest.mark.parametrize("commit", COMMITS)
+@pytest.mark.parametrize("case", CASES)
+def test_resume_matches_uninterrupted(tmp_path, case: str, commit: str) -> None:
+    main, kwargs = CASES[case]
+    commit_kwargs, asynchronous = COMMITS[commit]
+    reference_path = str(tmp_path / "reference.db")
+    resumed_path = str(tmp_path / "resumed.db")
+
+    random.seed(5)
+    assert run(main, reference_path, None, False, **kwargs) == 1
+
+    random.seed(5)
+    assert run(main, resumed_path, 31, asynchronous, **kwargs, **commit_kwargs) is None
+    # 別の乱数の状態から再開しても同じ結果になること
+    random.seed(999)
+    assert run(main, resumed_path, None, asynchronous, resume_simulation_id=1, **kwargs, **commit_kwargs) == 1
+
+    assert dump(resumed_path) == dump(reference_path)
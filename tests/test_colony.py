@@ -0,0 +1,139 @@
+# コロニー方式(colony.Colony)がAnt.hopと同じ規則でantを進め、到達したantの経路だけにフェロモンを加算することの確認
+import contextlib
+import io
+import random
+import sqlite3
+from collections import Counter
+from functools import partial
+import numpy as np
+import pytest
+import base
+import colony
+from base import Params, Ant
+from colony import Colony
+from csr import CSRNetwork, CSRNode
+from storage import SQLiteLogger
+
+PARAMS = Params(num_nodes=300, optimal_route_length=4, volatility=0.99, pheromone_min=100,
+                pheromone_max=2**20, ttl=10, bata=2, generation_limit=10, simulation_count=1)
+
+
+def build(start: int, destination: int) -> CSRNetwork:
+    network = CSRNetwork()
+    network.yield_nodes(PARAMS)
+    network.make_ba_model(PARAMS, 3, seed=11)
+    network.assign_node_ids(list(range(PARAMS.num_nodes)))
+    # 辺ごとに異なるフェロモンにする
+    network.write_pheromone(np.arange(network.num_edges),
+                            np.random.default_rng(11).integers(100, 10000, size=network.num_edges))
+    network.start_node = CSRNode(network, start)
+    network.end_node = CSRNode(network, destination)
+    return network
+
+
+# startに隣接しない目的地
+def far_destination(network: CSRNetwork, start: int) -> int:
+    start_edge, end_edge = network.edge_range(start)
+    neighbors = set(network.neighbor_ids[start_edge:end_edge].tolist())
+    return next(i for i in range(network.num_nodes - 1, 0, -1) if i != start and i not in neighbors)
+
+
+def test_first_hop_distribution_matches_ant_hop() -> None:
+    network = build(0, 1)
+    network.end_node = CSRNode(network, far_destination(network, 0))
+    start_edge, end_edge = network.edge_range(0)
+    neighbors = network.neighbor_ids[start_edge:end_edge].tolist()
+    weights = (network.width[start_edge:end_edge].astype(np.float64) ** PARAMS.bata) * network.pheromone[start_edge:end_edge]
+    expected = dict(zip(neighbors, weights / weights.sum()))
+
+    samples = 50000
+    batch = Colony(network, samples, PARAMS.ttl, seed=1)
+    batch.step(PARAMS.bata)
+    colony_counts = Counter(batch.route[:, 1].tolist())
+
+    random.seed(1)
+    ant_counts = Counter()
+    for _ in range(samples):
+        ant = Ant(network.start_node, network.end_node)
+        ant.hop(PARAMS)
+        ant_counts[ant.route[1].index] += 1
+
+    assert set(colony_counts) <= set(neighbors)
+    for node, probability in expected.items():
+        assert abs(colony_counts[node] / samples - probability) < 0.01
+        assert abs(ant_counts[node] / samples - probability) < 0.01
+
+
+def test_destination_neighbor_is_always_chosen() -> None:
+    network = build(0, 1)
+    start_edge, end_edge = network.edge_range(0)
+    network.end_node = CSRNode(network, int(network.neighbor_ids[start_edge]))
+    batch = Colony(network, 100, PARAMS.ttl, seed=1)
+    batch.step(PARAMS.bata)
+    assert batch.arrived.all() and not batch.alive.any()
+    assert (batch.route[:, 1] == network.end_node.index).all()
+
+
+def run_colony(size: int) -> tuple[CSRNetwork, Colony]:
+    random.seed(3)
+    network = build(0, 1)
+    network.make_optimal_route(PARAMS)
+    batch = Colony(network, size, PARAMS.ttl, seed=3)
+    batch.run(PARAMS.bata)
+    return network, batch
+
+
+def test_routes_do_not_revisit_nodes() -> None:
+    _, batch = run_colony(500)
+    for i in range(batch.size):
+        route = batch.route[i, :batch.hops[i] + 1].tolist()
+        assert len(set(route)) == len(route)
+        assert 1 <= len(route) - 1 <= PARAMS.ttl
+        assert batch.arrived[i] == (route[-1] == batch.destination)
+
+
+def test_add_pheromone_only_along_arrived_routes() -> None:
+    network, batch = run_colony(500)
+    # 到達したantとしなかったantの両方があること
+    assert batch.arrived.any() and not batch.arrived.all()
+
+    before = network.pheromone.copy()
+    expected = before.copy()
+    for i in np.flatnonzero(batch.arrived):
+        for edge in batch.route_edges[i, :batch.hops[i]].tolist():
+            expected[edge] += batch.bottleneck[i]
+    batch.add_pheromone()
+    np.testing.assert_array_equal(network.pheromone, expected)
+
+    # 到達しなかったantだけが通った辺は変わらない
+    arrived_edges = set(batch.route_edges[batch.arrived].ravel().tolist())
+    other_edges = set(batch.route_edges[~batch.arrived].ravel().tolist()) - arrived_edges - {-1}
+    assert all(network.pheromone[edge] == before[edge] for edge in other_edges)
+
+
+def test_best_is_widest_arrived_ant() -> None:
+    _, batch = run_colony(500)
+    best = batch.best()
+    assert batch.arrived[best]
+    assert batch.bottleneck[best] == batch.bottleneck[batch.arrived].max()
+
+    batch.arrived[:] = False
+    assert batch.best() == 0
+
+
+@pytest.mark.parametrize("colony_size", [None, 8])
+def test_histogram_counts_every_ant(tmp_path, colony_size: int | None) -> None:
+    # base.move_antもcolony.move_colonyも到達したかどうかに関係なく全antを数える
+    path = str(tmp_path / "histogram.db")
+    params = Params(num_nodes=60, optimal_route_length=6, volatility=0.99, pheromone_min=100,
+                    pheromone_max=2**20, ttl=3, bata=1, generation_limit=20, simulation_count=1)
+    random.seed(5)
+    with contextlib.redirect_stdout(io.StringIO()):
+        if colony_size is None:
+            base.main(params, CSRNetwork, storage=partial(SQLiteLogger, path))
+        else:
+            colony.main(params, colony_size, storage=partial(SQLiteLogger, path))
+    connector = sqlite3.connect(path)
+    counts = connector.execute(
+        "SELECT generation_count, SUM(Count) FROM BottleneckHistograms WHERE PacketType = 'Ants' GROUP BY generation_count;").fetchall()
+    assert counts == [(generation_count, colony_size or 1) for generation_count in range(params.generation_limit)]
@@ -0,0 +1,116 @@
+# 揮発カーネル(evaporation.py)が従来のforループ実装、evaporate_referenceと同じ値になることの確認
+import random
+import numpy as np
+import pytest
+from base import Params, Network
+from csr import CSRNetwork
+from evaporation import evaporate_reference, evaporate_elapsed, evaporation_changes, width_rate, degree_floor
+import both
+import variable_min_pheromone
+import variable_volatilization
+
+PARAMS = Params(num_nodes=300, optimal_route_length=6, volatility=0.97, pheromone_min=100,
+                pheromone_max=2**16, ttl=100, bata=1, generation_limit=1, simulation_count=1)
+SEED = 12345
+
+# (従来のforループ実装, CSRNetwork版, 揮発率, 下限)
+# 揮発率と下限は有向辺ごとの(width, 始点ノードの次数)から求める
+STRATEGIES = {
+    "constant": (Network.volitile_pheromone, CSRNetwork.volitile_pheromone,
+                 lambda width, degree: np.full(len(width), PARAMS.volatility),
+                 lambda width, degree: np.full(len(width), PARAMS.pheromone_min)),
+    "degree_floor": (variable_min_pheromone.volitile_pheromone_based_on_dimension,
+                     variable_min_pheromone.volitile_pheromone_based_on_dimension_csr,
+                     lambda width, degree: np.full(len(width), PARAMS.volatility),
+                     lambda width, degree: degree_floor(degree, PARAMS.pheromone_min)),
+    "width_rate": (variable_volatilization.volitile_pheromone_based_on_width,
+                   variable_volatilization.volitile_pheromone_based_on_width_csr,
+                   lambda width, degree: width_rate(width),
+                   lambda width, degree: np.full(len(width), PARAMS.pheromone_min)),
+    "degree_floor_width_rate": (both.volitile_pheromone_based_on_dimension_and_width,
+                                both.volitile_pheromone_based_on_dimension_and_width_csr,
+                                lambda width, degree: width_rate(width),
+                                lambda width, degree: degree_floor(degree, PARAMS.pheromone_min)),
+}
+
+
+def build(network_class: type) -> Network:
+    network = network_class()
+    network.yield_nodes(PARAMS)
+    network.make_ba_model(PARAMS, 3, seed=SEED)
+    network.assign_node_ids(list(range(PARAMS.num_nodes)))
+    return network
+
+
+# {(StartNodeID, EndNodeID): (フェロモン, width)}
+def connection_map(network: Network) -> dict[tuple[int, int], tuple[int, int]]:
+    start_ids, end_ids, pheromone, width = network.connections()
+    return {(int(s), int(e)): (int(p), int(w)) for s, e, p, w in zip(start_ids, end_ids, pheromone, width)}
+
+
+# 辺ごとにランダムなフェロモンを加え、下限付近から上限超過まで揃える
+def random_pheromone(network: Network) -> dict[tuple[int, int], int]:
+    rng = random.Random(SEED)
+    return {key: PARAMS.pheromone_min + rng.randrange(2 * PARAMS.pheromone_max)
+            for key in sorted(connection_map(network))}
+
+
+def set_pheromone(network: Network, pheromone: dict[tuple[int, int], int]) -> None:
+    start_ids, end_ids, _, _ = network.connections()
+    network.set_pheromone_state(np.array([pheromone[(int(s), int(e))] for s, e in zip(start_ids, end_ids)]))
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_kernel_matches_loop_and_reference(strategy: str) -> None:
+    loop, kernel, rate, floor = STRATEGIES[strategy]
+    network = build(Network)
+    csr_network = build(CSRNetwork)
+    assert connection_map(network).keys() == connection_map(csr_network).keys()
+
+    pheromone = random_pheromone(network)
+    set_pheromone(network, pheromone)
+    set_pheromone(csr_network, pheromone)
+
+    degrees = network.degrees()
+    keys = sorted(pheromone)
+    width = np.array([connection_map(network)[key][1] for key in keys])
+    degree = np.array([degrees[start] for start, _ in keys])
+    reference = evaporate_reference([pheromone[key] for key in keys], rate(width, degree).tolist(),
+                                    floor(width, degree).tolist(), PARAMS.pheromone_max)
+
+    # 複数世代続けて揮発させてもずれないこと
+    for _ in range(3):
+        loop(network, PARAMS)
+        kernel(csr_network, PARAMS)
+        expected = connection_map(network)
+        assert connection_map(csr_network) == expected
+        assert [expected[key][0] for key in keys] == reference
+        reference = evaporate_reference(reference, rate(width, degree).tolist(),
+                                        floor(width, degree).tolist(), PARAMS.pheromone_max)
+
+
+@pytest.mark.parametrize("size", [5, 200])
+def test_evaporate_elapsed_matches_repeated_reference(size: int) -> None:
+    # 要素数が少ない場合(Pythonのループ)も多い場合(numpy)も、evaporate_referenceをelapsed回繰り返した値になること
+    rng = np.random.default_rng(size)
+    for _ in range(50):
+        pheromone = rng.integers(PARAMS.pheromone_min, 2 * PARAMS.pheromone_max, size=size)
+        elapsed = rng.integers(0, 400, size=size)
+        width = rng.integers(1, 10, size=size, endpoint=True) * 10
+        rate = width_rate(width)
+        floor = degree_floor(rng.integers(1, 5, size=size), PARAMS.pheromone_min)
+        expected = []
+        for value, count, r, f in zip(pheromone.tolist(), elapsed.tolist(), rate.tolist(), floor.tolist()):
+            for _ in range(count):
+                value = evaporate_reference([value], [r], [f], PARAMS.pheromone_max)[0]
+            expected.append(value)
+        assert evaporate_elapsed(pheromone, elapsed, rate, floor, PARAMS.pheromone_max).tolist() == expected
+        assert evaporation_changes(pheromone, rate, floor, PARAMS.pheromone_max) == \
+            (evaporate_reference(pheromone.tolist(), rate.tolist(), floor.tolist(), PARAMS.pheromone_max) != pheromone.tolist())
+
+
+def test_evaporation_changes_settled_values() -> None:
+    floor = np.full(3, 300.0)
+    rate = np.full(3, 0.9)
+    assert not evaporation_changes(np.array([300, 300, 300]), rate, floor, PARAMS.pheromone_max)
+    assert evaporation_changes(np.array([300, 301, 300]), rate, floor, PARAMS.pheromone_max)
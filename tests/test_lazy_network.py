@@ -0,0 +1,87 @@
+# LazyCSRNetwork(読み出し時に揮発を計算する)がCSRNetwork(毎世代揮発させる)と同じ結果になることの確認
+import contextlib
+import copy
+import io
+import random
+import sqlite3
+from functools import partial
+import numpy as np
+import pytest
+import base
+import both
+import variable_min_pheromone
+import variable_volatilization
+from base import Params, Ant
+from csr import CSRNetwork, LazyCSRNetwork
+from storage import SQLiteLogger
+
+PARAMS = Params(num_nodes=200, optimal_route_length=6, volatility=0.95, pheromone_min=100,
+                pheromone_max=2**12, ttl=100, bata=1, generation_limit=40, simulation_count=1)
+
+# 方式ごとの(揮発の関数, ネットワークの準備)
+STRATEGIES = {
+    "constant": ({}, {}),
+    "variable_min_pheromone": (variable_min_pheromone.VOLITILE_PHEROMONE, variable_min_pheromone.PREPARE_NETWORK),
+    "variable_volatilization": (variable_volatilization.VOLITILE_PHEROMONE, variable_volatilization.PREPARE_NETWORK),
+    "both": (both.VOLITILE_PHEROMONE, both.PREPARE_NETWORK),
+}
+
+
+# run_simulationと同じ手順でgenerations世代進め、antの経路と最後のconnections()を返す
+# connections()は最後に1回だけ読むので、LazyCSRNetworkは揮発をまとめて計算することになる
+def run(network_class: type, strategy: str, generations: int) -> tuple[list[list[int]], tuple]:
+    volitile_pheromone, prepare_network = (table.get(network_class) for table in STRATEGIES[strategy])
+    random.seed(7)
+    network = network_class()
+    network.yield_nodes(PARAMS)
+    network.make_ba_model(PARAMS, 3)
+    network.assign_node_ids(list(range(PARAMS.num_nodes)))
+    network.make_optimal_route(PARAMS)
+    if prepare_network is not None:
+        prepare_network(network, PARAMS)
+    routes = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(generations):
+            ant = Ant(network.start_node, network.end_node)
+            ant.hop_if_movable(PARAMS)
+            if ant.is_at_destination():
+                network.add_pheromone_to_ant_route(ant)
+            routes.append([node.index for node in ant.route])
+            if volitile_pheromone is None:
+                network.volitile_pheromone(PARAMS)
+            else:
+                volitile_pheromone(network, PARAMS)
+    return routes, network.connections()
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_lazy_matches_eager(strategy: str) -> None:
+    for generations in (1, 10, 100):
+        eager_routes, eager = run(CSRNetwork, strategy, generations)
+        lazy_routes, lazy = run(LazyCSRNetwork, strategy, generations)
+        assert lazy_routes == eager_routes
+        for eager_column, lazy_column in zip(eager, lazy):
+            np.testing.assert_array_equal(lazy_column, eager_column)
+
+
+def connections_rows(path: str) -> list[tuple]:
+    connector = sqlite3.connect(path)
+    return connector.execute(
+        """SELECT Generations.generation_count, Connections.StartNodeID, Connections.EndNodeID, Connections.Pheromone, Connections.Width
+        FROM Connections JOIN Generations ON Connections.GenerationID = Generations.GenerationID
+        ORDER BY 1, 2, 3;""").fetchall()
+
+
+@pytest.mark.parametrize("connections_interval", [None, 7])
+def test_logged_connections_match(tmp_path, connections_interval: int | None) -> None:
+    results = []
+    for network_class in (CSRNetwork, LazyCSRNetwork):
+        path = str(tmp_path / f"{network_class.__name__}.db")
+        random.seed(5)
+        with contextlib.redirect_stdout(io.StringIO()):
+            variable_volatilization.main(copy.copy(PARAMS), network_class, storage=partial(SQLiteLogger, path),
+                                         connections_interval=connections_interval)
+        results.append(connections_rows(path))
+    assert results[0] == results[1]
+    logged = sorted({row[0] for row in results[0]})
+    assert logged == list(range(0, PARAMS.generation_limit, connections_interval or 1))
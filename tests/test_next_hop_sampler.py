@@ -0,0 +1,69 @@
+# NextHopSampler(重みに比例した隣接ノードの選択)とサンプラーのキャッシュの確認
+import random
+from collections import Counter
+import numpy as np
+from base import Params, Network, NextHopSampler
+from csr import CSRNetwork
+
+PARAMS = Params(num_nodes=50, optimal_route_length=6, volatility=0.99, pheromone_min=100,
+                pheromone_max=2**20, ttl=100, bata=2, generation_limit=1, simulation_count=1)
+
+
+def test_sample_frequencies_follow_weights() -> None:
+    nodes = ["a", "b", "c", "d", "e"]
+    weights = [1.0, 2.0, 3.0, 4.0, 0.0]
+    sampler = NextHopSampler(nodes, weights, 1)
+    random.seed(0)
+    counts = Counter(sampler.sample() for _ in range(200000))
+    assert counts["e"] == 0
+    for node, weight in zip(nodes, weights):
+        assert abs(counts[node] / 200000 - weight / sum(weights)) < 0.005
+
+
+def test_sample_matches_random_choices() -> None:
+    # 同じ乱数の状態からはrandom.choicesと同じノードを選ぶ(従来の実装と結果が変わらない)
+    nodes = list(range(8))
+    weights = [(width ** 2) * pheromone for width, pheromone in zip(range(10, 90, 10), [5, 100, 3, 70, 1, 9, 40, 2])]
+    sampler = NextHopSampler(nodes, weights, 2)
+    random.seed(42)
+    sampled = [sampler.sample() for _ in range(1000)]
+    random.seed(42)
+    assert sampled == [random.choices(nodes, weights)[0] for _ in range(1000)]
+
+
+def build(network_class: type) -> Network:
+    network = network_class()
+    network.yield_nodes(PARAMS)
+    network.make_ba_model(PARAMS, 3, seed=3)
+    network.assign_node_ids(list(range(PARAMS.num_nodes)))
+    return network
+
+
+def test_node_sampler_is_invalidated_by_link_changes() -> None:
+    network = build(Network)
+    node = network.nodes[0]
+    sampler = node.next_hop_sampler(PARAMS.bata)
+    assert node.next_hop_sampler(PARAMS.bata) is sampler
+    link = next(iter(node.neighbors.values()))
+    link.pheromone += 1
+    rebuilt = node.next_hop_sampler(PARAMS.bata)
+    assert rebuilt is not sampler
+    assert rebuilt.cum_weights[0] == (link.width ** PARAMS.bata) * link.pheromone
+    assert node.next_hop_sampler(PARAMS.bata + 1) is not rebuilt
+
+
+def test_csr_sampler_matches_node_sampler() -> None:
+    network = build(Network)
+    csr_network = build(CSRNetwork)
+    for index in range(PARAMS.num_nodes):
+        sampler = network.nodes[index].next_hop_sampler(PARAMS.bata)
+        csr_sampler = csr_network.next_hop_sampler(index, PARAMS.bata)
+        # CSRNetworkの隣接ノードは終点ノード順に並ぶので、終点ノードごとの重みで比べる
+        weights = dict(zip([node.id for node in sampler.nodes], np.diff([0] + sampler.cum_weights)))
+        csr_weights = dict(zip([node.id for node in csr_sampler.nodes], np.diff([0] + csr_sampler.cum_weights)))
+        assert weights == csr_weights
+    csr_sampler = csr_network.next_hop_sampler(0, PARAMS.bata)
+    assert csr_network.next_hop_sampler(0, PARAMS.bata) is csr_sampler
+    start, _ = csr_network.edge_range(0)
+    csr_network.write_pheromone(np.array([start]), np.array([PARAMS.pheromone_min + 1]))
+    assert csr_network.next_hop_sampler(0, PARAMS.bata) is not csr_sampler
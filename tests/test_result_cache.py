@@ -0,0 +1,58 @@
+# ResultCache(分析用のクエリ結果のローカルキャッシュ)の確認
+import os
+from multiprocessing import Pool
+import numpy as np
+from result_cache import ResultCache
+
+
+class VersionCursor:
+    # ResultCache.versionのクエリに決まった値を返すカーソル
+    def __init__(self, version: tuple[int, int, int]) -> None:
+        self.version = version
+
+    def execute(self, query: str, params=None) -> None:
+        pass
+
+    def fetchone(self) -> tuple[int, int, int]:
+        return self.version
+
+
+def test_recomputes_when_version_changes(tmp_path) -> None:
+    calls = []
+
+    def compute() -> list[int]:
+        calls.append(1)
+        return [len(calls)]
+
+    cursor = VersionCursor((1, 0, 10))
+    cache = ResultCache(cursor, str(tmp_path))
+    assert cache.get("matrix", 1, compute, "ants").tolist() == [1]
+    assert cache.get("matrix", 1, compute, "ants").tolist() == [1]
+    # 別のキーは別に計算する
+    assert cache.get("matrix", 1, compute, "interests").tolist() == [2]
+    cursor.version = (2, 0, 20)
+    assert cache.get("matrix", 1, compute, "ants").tolist() == [3]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def fill(directory: str, worker: int) -> list[int]:
+    # 同じキーを何度も計算し直して保存する(バージョンが毎回変わる)
+    results = []
+    for i in range(30):
+        cache = ResultCache(VersionCursor((worker, i, 0)), directory)
+        results.append(int(cache.get("matrix", 1, lambda: np.full(10000, worker * 100 + i), "ants")[0]))
+    return results
+
+
+def test_concurrent_writers_do_not_share_temporary_files(tmp_path) -> None:
+    directory = str(tmp_path)
+    with Pool(4) as pool:
+        results = pool.starmap(fill, [(directory, worker) for worker in range(4)])
+    # それぞれのプロセスは自分が計算した値を受け取り、残ったファイルは壊れていない
+    assert results == [[worker * 100 + i for i in range(30)] for worker in range(4)]
+    files = [name for name in os.listdir(directory) if name.endswith(".npz")]
+    assert len(files) == 1
+    with np.load(os.path.join(directory, files[0])) as cached:
+        result = cached["result"]
+        assert (result == result[0]).all() and len(result) == 10000
+    assert not [name for name in os.listdir(directory) if name.endswith(".tmp")]
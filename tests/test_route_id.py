@@ -0,0 +1,74 @@
+# storage.route_idがsql/migrations/0005_add_routes.sqlのroute_id関数と同じ値になることの確認
+import hashlib
+import os
+import random
+import re
+import psycopg2
+import pytest
+from storage import RouteInterner, route_id
+
+MIGRATION = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sql", "migrations", "0005_add_routes.sql")
+
+# (経路, md5の先頭16桁, RouteID) md5はmd5sumで求めた値
+KNOWN = [
+    ([1, 2, 3], "55b84a9d317184fe", 6176768927938479358),
+    ([42], "a1d0c6e83f027327", -6786705937655499993),
+    ([], "d41d8cd98f00b204", -3162216497309240828),
+    ([10, 7, 123456789012], "99d4f31e194cc2d5", -7361992180244888875),
+]
+
+
+# マイグレーションのroute_id関数の式
+def migration_expression() -> str:
+    with open(MIGRATION) as f:
+        return re.search(r"FUNCTION route_id\(.*?AS \$\$\s*SELECT (.*?);\s*\$\$", f.read(), re.S).group(1)
+
+
+# ('x' || substr(md5(array_to_string(ids, ',')), 1, 16))::bit(64)::Bigint をPythonで1段ずつ計算する
+def sql_route_id(route_node_id: list[int]) -> int:
+    text = ",".join(str(node_id) for node_id in route_node_id)
+    bits = int(hashlib.md5(text.encode()).hexdigest()[:16], 16)
+    # bit(64)からBigintへの変換は2の補数
+    return bits - (1 << 64) if bits >= 1 << 63 else bits
+
+
+@pytest.mark.parametrize("route_node_id, prefix, expected", KNOWN)
+def test_known_values(route_node_id: list[int], prefix: str, expected: int) -> None:
+    assert hashlib.md5(",".join(map(str, route_node_id)).encode()).hexdigest()[:16] == prefix
+    assert route_id(route_node_id) == expected
+
+
+def test_matches_sql_expression() -> None:
+    assert migration_expression() == "('x' || substr(md5(array_to_string(route_nodes_id, ',')), 1, 16))::bit(64)::Bigint"
+    rng = random.Random(0)
+    for _ in range(1000):
+        route = [rng.randrange(1, 2**40) for _ in range(rng.randrange(1, 20))]
+        assert route_id(route) == sql_route_id(route)
+        assert -2**63 <= route_id(route) < 2**63
+
+
+def test_interner_registers_each_route_once() -> None:
+    routes = RouteInterner()
+    assert routes.intern([1, 2, 3]) == (KNOWN[0][2], True)
+    assert routes.intern([1, 2, 3]) == (KNOWN[0][2], False)
+    routes.clear()
+    assert routes.intern([1, 2, 3]) == (KNOWN[0][2], True)
+
+
+def test_matches_postgres_function() -> None:
+    # PostgreSQLに接続できる場合はマイグレーションの関数の式をそのまま実行して比べる
+    try:
+        connector = psycopg2.connect(dbname="simulation", user="asaken_n40", password="asaken_N40", host="localhost")
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"PostgreSQL is not available: {e}")
+    expression = migration_expression()
+    try:
+        cursor = connector.cursor()
+        rng = random.Random(0)
+        routes = [route for route, _, _ in KNOWN] + \
+            [[rng.randrange(1, 2**40) for _ in range(rng.randrange(1, 20))] for _ in range(100)]
+        for route in routes:
+            cursor.execute(f"SELECT {expression.replace('route_nodes_id', '%s::Bigint[]')};", (route,))
+            assert cursor.fetchone()[0] == route_id(route)
+    finally:
+        connector.close()
@@ -0,0 +1,91 @@
+# sample/aco-sample.pyのSimulationLogger(JSON Linesの逐次書き出し)とread_logの往復の確認
+import importlib.util
+import json
+import os
+import random
+import pytest
+
+# ファイル名にハイフンがあるのでパスから読み込む
+spec = importlib.util.spec_from_file_location(
+    "aco_sample", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample", "aco-sample.py"))
+aco_sample = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(aco_sample)
+
+
+class RecordingLogger(aco_sample.SimulationLogger):
+    # 書き出したものと比べるために、各世代のネットワーク全体とant・interestを覚えておく
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.expected: list[dict] = []
+
+    def save_network(self, simulation_count, generation_count, network) -> None:
+        super().save_network(simulation_count, generation_count, network)
+        links = {(node.id, neighbor.id): [link.width, link.feromone]
+                 for node in network.nodes for neighbor, link in node.neighbors.items()}
+        self.expected.append({"simulation": simulation_count, "generation": generation_count, "links": links,
+                              "optimal": [node.id for node in network.optimal_route]})
+
+    def save_ant(self, simulation_count, generation_count, ant) -> None:
+        super().save_ant(simulation_count, generation_count, ant)
+        self.expected[-1]["ant"] = ant.get_attr_json()["ant"]
+
+    def save_interest(self, simulation_count, generation_count, interest) -> None:
+        super().save_interest(simulation_count, generation_count, interest)
+        self.expected[-1]["interest"] = interest.get_attr_json()["interest"]
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_round_trip(tmp_path, compression) -> None:
+    random.seed(0)
+    aco_sample.Simulation.SIMULATION_COUNT = -1
+    params = aco_sample.Params(num_nodes=20, optimal_route_length=3, volatility=0.99, pheromone_min=100,
+                               pheromone_max=2**20, ttl=100, bata=1, generation_limit=5, simulation_count=2)
+    # 途中でも書き出されるようにバッファを小さくする
+    logger = RecordingLogger(str(tmp_path) + "/", "result.jsonl", compression=compression, buffer_size=256)
+    logger.save_params(params)
+    for _ in range(params.simulation_count):
+        aco_sample.Simulation(logger).run(params)
+    logger.output_log()
+
+    records = list(aco_sample.read_log(str(tmp_path / "result.jsonl"), compression))
+    assert records[0] == {"params": params.get_attr_json()}
+    assert len(records) == 1 + len(logger.expected) == 1 + params.simulation_count * params.generation_limit
+    for record, expected in zip(records[1:], logger.expected):
+        assert (record["simulation"], record["generation"]) == (expected["simulation"], expected["generation"])
+        # 差分から復元したLinkが、その世代のネットワーク全体と一致する
+        assert record["network"]["links"] == expected["links"]
+        assert record["ant"] == expected["ant"]
+        assert record["interest"] == expected["interest"]
+        # 最適ルートはシミュレーションの最初の世代だけに書く
+        if record["generation"] == 0:
+            assert record["network"]["optimal"] == expected["optimal"]
+        else:
+            assert "optimal" not in record["network"]
+
+
+def test_writes_only_changed_links(tmp_path) -> None:
+    random.seed(1)
+    aco_sample.Simulation.SIMULATION_COUNT = -1
+    params = aco_sample.Params(num_nodes=20, optimal_route_length=3, volatility=0.99, pheromone_min=100,
+                               pheromone_max=2**20, ttl=100, bata=1, generation_limit=5, simulation_count=2)
+    logger = RecordingLogger(str(tmp_path) + "/", "result.jsonl")
+    logger.save_params(params)
+    for _ in range(params.simulation_count):
+        aco_sample.Simulation(logger).run(params)
+    logger.output_log()
+
+    with open(tmp_path / "result.jsonl", encoding="utf-8") as f:
+        raw = [json.loads(line) for line in f][1:]
+    changed_total = 0
+    for i, (record, expected) in enumerate(zip(raw, logger.expected)):
+        written = {(start, end): [width, feromone] for start, end, width, feromone in record["network"]["links"]}
+        if record["generation"] == 0:
+            # 各シミュレーションの最初の世代は全てのLinkを書く
+            assert written == expected["links"]
+        else:
+            previous = logger.expected[i - 1]["links"]
+            changed = {key: value for key, value in expected["links"].items() if previous[key] != value}
+            assert written == changed
+            changed_total += len(changed)
+    # antが到達してフェロモンが変わった世代がある
+    assert changed_total > 0
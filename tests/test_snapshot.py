@@ -0,0 +1,96 @@
+# Connectionsの差分登録(ConnectionDeltaEncoder)からload_connectionsで各世代の全ての行を復元できることの確認
+import contextlib
+import io
+import random
+import sqlite3
+from functools import partial
+import numpy as np
+import pytest
+import base
+from base import Params
+from csr import CSRNetwork
+from snapshot import ConnectionDeltaEncoder, load_connections, load_connections_parquet
+from storage import SQLiteLogger, ParquetLogger
+
+GENERATION_LIMIT = 15
+
+
+def make_params() -> Params:
+    return Params(num_nodes=60, optimal_route_length=6, volatility=0.99, pheromone_min=100,
+                  pheromone_max=2**20, ttl=100, bata=1, generation_limit=GENERATION_LIMIT, simulation_count=1)
+
+
+def test_encode_then_apply_restores_every_generation() -> None:
+    rng = np.random.default_rng(0)
+    start_ids = np.repeat(np.arange(10), 3)
+    end_ids = np.tile(np.arange(3), 10)
+    pheromone = rng.integers(100, 1000, size=30)
+    width = rng.integers(1, 10, size=30) * 10
+    encoder = ConnectionDeltaEncoder(4)
+    state: dict[tuple[int, int], tuple[int, int]] = {}
+    for generation_count in range(12):
+        # 一部の辺だけ変化させる
+        changed = rng.random(30) < 0.2
+        pheromone = np.where(changed, pheromone + 1, pheromone)
+        rows, is_keyframe = encoder.encode((start_ids, end_ids, pheromone, width))
+        assert is_keyframe == (generation_count % 4 == 0)
+        if is_keyframe:
+            state = {}
+            assert len(rows[0]) == 30
+        elif generation_count > 0:
+            assert len(rows[0]) == int(changed.sum())
+        for s, e, p, w in zip(*(column.tolist() for column in rows)):
+            state[(s, e)] = (p, w)
+        assert state == {(s, e): (p, w) for s, e, p, w in zip(start_ids.tolist(), end_ids.tolist(), pheromone.tolist(), width.tolist())}
+
+
+def run(storage, **kwargs) -> int:
+    random.seed(5)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return base.main(make_params(), CSRNetwork, storage=storage, **kwargs)
+
+
+# 全ての世代の全ての行を登録したシミュレーションの{generation_count: {(StartNodeID, EndNodeID): (Pheromone, Width)}}
+def full_connections(path: str) -> dict[int, dict[tuple[int, int], tuple[int, int]]]:
+    rows = sqlite3.connect(path).execute(
+        """SELECT Generations.generation_count, Connections.StartNodeID, Connections.EndNodeID, Connections.Pheromone, Connections.Width
+        FROM Connections JOIN Generations ON Connections.GenerationID = Generations.GenerationID;""").fetchall()
+    result: dict[int, dict[tuple[int, int], tuple[int, int]]] = {}
+    for generation_count, start_id, end_id, pheromone, width in rows:
+        result.setdefault(generation_count, {})[(start_id, end_id)] = (pheromone, width)
+    return result
+
+
+# NodeIDはバックエンドごとに違うので、ノードの登録順の番号に置き換える
+def by_node_index(state: dict[tuple[int, int], tuple[int, int]]) -> dict[tuple[int, int], tuple[int, int]]:
+    index = {node_id: i for i, node_id in enumerate(sorted({key[0] for key in state}))}
+    return {(index[start_id], index[end_id]): value for (start_id, end_id), value in state.items()}
+
+
+@pytest.mark.parametrize("keyframe_interval", [1, 4, 100])
+def test_sqlite_load_connections_matches_full_rows(tmp_path, keyframe_interval: int) -> None:
+    full_path = str(tmp_path / "full.db")
+    delta_path = str(tmp_path / "delta.db")
+    run(partial(SQLiteLogger, full_path))
+    simulation_id = run(partial(SQLiteLogger, delta_path), keyframe_interval=keyframe_interval)
+    expected = full_connections(full_path)
+
+    logger = SQLiteLogger(delta_path)
+    logger.connect()
+    if keyframe_interval > 1:
+        assert logger.fetch_result("SELECT COUNT(*) FROM Connections;")[0][0] < sum(len(state) for state in expected.values())
+    for generation_count in range(GENERATION_LIMIT):
+        assert load_connections(logger, simulation_id, generation_count) == expected[generation_count]
+    logger.close()
+
+
+@pytest.mark.parametrize("keyframe_interval", [None, 4])
+def test_parquet_load_connections_matches_full_rows(tmp_path, keyframe_interval: int | None) -> None:
+    full_path = str(tmp_path / "full.db")
+    root = str(tmp_path / "parquet")
+    run(partial(SQLiteLogger, full_path))
+    simulation_id = run(partial(ParquetLogger, root), keyframe_interval=keyframe_interval)
+    expected = full_connections(full_path)
+    for generation_count in range(GENERATION_LIMIT):
+        assert by_node_index(load_connections_parquet(root, simulation_id, generation_count)) == \
+            by_node_index(expected[generation_count])
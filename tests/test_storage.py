@@ -0,0 +1,190 @@
+# SQLiteLogger, ParquetLoggerに登録した行を読み戻せること、commit/rollbackの範囲の確認
+import glob
+import io
+import json
+import os
+import random
+import sqlite3
+from functools import partial
+import numpy as np
+import pyarrow.parquet as pq
+import pytest
+import base
+from base import Params, Ant, copy_text
+from csr import CSRNetwork
+from histogram import BottleneckHistogram
+from storage import SQLiteLogger, ParquetLogger, route_id
+from sweep import run_sweep
+
+
+def make_params(generation_limit: int = 3) -> Params:
+    return Params(num_nodes=30, optimal_route_length=4, volatility=0.99, pheromone_min=100,
+                  pheromone_max=2**20, ttl=100, bata=1, generation_limit=generation_limit, simulation_count=1)
+
+
+def build() -> CSRNetwork:
+    random.seed(1)
+    network = CSRNetwork()
+    network.yield_nodes(make_params())
+    network.make_ba_model(make_params(), 3, seed=1)
+    network.make_optimal_route(make_params())
+    return network
+
+
+# 最適ルートを辿ったant(登録する経路が決まっている)
+def route_ant(network: CSRNetwork, length: int) -> Ant:
+    ant = Ant(network.start_node, network.end_node)
+    for node in network.optimal_route[1:length + 1]:
+        ant.update_attr(node)
+    return ant
+
+
+# 2つのantを登録し、1つ目の世代だけcommitしてから2つ目をrollbackする
+def write(logger, network: CSRNetwork) -> dict:
+    logger.connect()
+    params_id = logger.register_params(make_params())
+    simulation_id = logger.register_simulation(params_id)
+    logger.insert_nodes(simulation_id, network)
+    generation_ids = logger.insert_generations(simulation_id, 3)
+    logger.add_connections(generation_ids[0], network.connections())
+    committed = route_ant(network, 4)
+    logger.insert_packet("Ants", generation_ids[0], committed)
+    logger.insert_packet("Interests", generation_ids[0], committed)
+    histogram = BottleneckHistogram()
+    histogram.add("Ants", 0, committed)
+    logger.add_bottleneck_histogram(params_id, histogram)
+    logger.commit()
+
+    logger.add_connections(generation_ids[1], network.connections())
+    logger.insert_packet("Ants", generation_ids[1], route_ant(network, 2))
+    logger.rollback()
+    logger.close()
+    return {"params_id": params_id, "simulation_id": simulation_id, "generation_ids": generation_ids, "ant": committed}
+
+
+def expected_connections(network: CSRNetwork, generation_id: int) -> list[tuple]:
+    start_ids, end_ids, pheromone, width = (column.tolist() for column in network.connections())
+    return sorted((generation_id, s, e, p, w) for s, e, p, w in zip(start_ids, end_ids, pheromone, width))
+
+
+def test_sqlite_round_trip(tmp_path) -> None:
+    path = str(tmp_path / "simulation.db")
+    network = build()
+    written = write(SQLiteLogger(path), network)
+    connector = sqlite3.connect(path)
+
+    # 同じパラメータは同じID、違うパラメータは別のID
+    logger = SQLiteLogger(path)
+    logger.connect()
+    assert logger.register_params(make_params()) == written["params_id"]
+    assert logger.register_params(make_params(4)) != written["params_id"]
+    logger.rollback()
+    logger.close()
+
+    assert connector.execute("SELECT SimulationID, ParameterID FROM Simulations;").fetchall() == \
+        [(written["simulation_id"], written["params_id"])]
+    node_ids = connector.execute("SELECT NodeID FROM Nodes ORDER BY NodeID;").fetchall()
+    assert [row[0] for row in node_ids] == network.node_ids.tolist()
+    assert connector.execute("SELECT GenerationID, generation_count FROM Generations ORDER BY 1;").fetchall() == \
+        list(zip(written["generation_ids"], range(3)))
+    assert sorted(connector.execute(
+        "SELECT GenerationID, StartNodeID, EndNodeID, Pheromone, Width FROM Connections;").fetchall()) == \
+        expected_connections(network, written["generation_ids"][0])
+
+    ant = written["ant"]
+    route = [node.id for node in ant.route]
+    packet = (written["generation_ids"][0], ant.source.id, ant.destination.id, route_id(route), ant.route_bottoleneck)
+    assert connector.execute("SELECT * FROM Ants;").fetchall() == [packet]
+    assert connector.execute("SELECT * FROM Interests;").fetchall() == [packet]
+    # 同じ経路はRoutesに1行だけ
+    assert connector.execute("SELECT RouteID, RouteNodesID FROM Routes;").fetchall() == [(route_id(route), json.dumps(route))]
+    assert connector.execute("SELECT * FROM BottleneckHistograms;").fetchall() == \
+        [(written["params_id"], "Ants", 0, ant.route_bottoleneck, 1)]
+
+
+def test_sqlite_rollback_forgets_routes(tmp_path) -> None:
+    # rollbackで取り消された経路は次に登録するときにRoutesに登録し直す
+    path = str(tmp_path / "simulation.db")
+    network = build()
+    logger = SQLiteLogger(path)
+    logger.connect()
+    simulation_id = logger.register_simulation(logger.register_params(make_params()))
+    logger.insert_nodes(simulation_id, network)
+    generation_ids = logger.insert_generations(simulation_id, 2)
+    logger.commit()
+    logger.insert_packet("Ants", generation_ids[0], route_ant(network, 3))
+    logger.rollback()
+    logger.insert_packet("Ants", generation_ids[1], route_ant(network, 3))
+    logger.commit()
+    logger.close()
+    connector = sqlite3.connect(path)
+    assert connector.execute("SELECT GenerationID FROM Ants;").fetchall() == [(generation_ids[1],)]
+    assert connector.execute("SELECT COUNT(*) FROM Routes;").fetchall() == [(1,)]
+
+
+@pytest.mark.parametrize("logger_class", ["sqlite", "parquet"])
+def test_checkpoints(tmp_path, logger_class: str) -> None:
+    logger = SQLiteLogger(str(tmp_path / "simulation.db")) if logger_class == "sqlite" else ParquetLogger(str(tmp_path / "parquet"))
+    logger.connect()
+    simulation_id = logger.register_simulation(logger.register_params(make_params()))
+    logger.save_checkpoint(simulation_id, 5, b"state")
+    logger.commit()
+    assert logger.load_checkpoint(simulation_id) == b"state"
+    # rollbackしたチェックポイントは残らない
+    logger.save_checkpoint(simulation_id, 6, b"rolled back")
+    logger.rollback()
+    assert logger.load_checkpoint(simulation_id) == b"state"
+    logger.delete_checkpoint(simulation_id)
+    logger.commit()
+    with pytest.raises(ValueError):
+        logger.load_checkpoint(simulation_id)
+    logger.close()
+
+
+def read_parquet(root: str, table: str) -> list[dict]:
+    files = sorted(glob.glob(os.path.join(root, table, "*.parquet")))
+    return [row for file in files for row in pq.read_table(file).to_pylist()]
+
+
+def test_parquet_round_trip(tmp_path) -> None:
+    root = str(tmp_path / "parquet")
+    network = build()
+    written = write(ParquetLogger(root), network)
+
+    params = read_parquet(root, "parameters")
+    assert [row["ParameterID"] for row in params] == [written["params_id"]]
+    assert ParquetLogger(root).register_params_bulk([make_params()]) == [written["params_id"]]
+    assert ParquetLogger(root).register_params_bulk([make_params(4)]) != [written["params_id"]]
+    assert read_parquet(root, "simulations") == [{"SimulationID": written["simulation_id"], "ParameterID": written["params_id"]}]
+    assert sorted(row["NodeID"] for row in read_parquet(root, "nodes")) == sorted(network.node_ids.tolist())
+    assert [(row["GenerationID"], row["generation_count"]) for row in read_parquet(root, "generations")] == \
+        list(zip(written["generation_ids"], range(3)))
+    assert sorted(tuple(row.values()) for row in read_parquet(root, "connections")) == \
+        expected_connections(network, written["generation_ids"][0])
+
+    ant = written["ant"]
+    packet = {"GenerationID": written["generation_ids"][0], "SourceNodeID": ant.source.id, "DestinationNodeID": ant.destination.id,
+              "RouteNodesID": [node.id for node in ant.route], "RouteWidths": ant.route_width, "RouteBottleneck": ant.route_bottoleneck}
+    assert read_parquet(root, "ants") == [packet]
+    assert read_parquet(root, "interests") == [packet]
+    assert read_parquet(root, "bottleneckhistograms") == [{"ParameterID": written["params_id"], "PacketType": "Ants", "generation_count": 0,
+                                                           "RouteBottleneck": ant.route_bottoleneck, "Count": 1}]
+
+
+def test_sqlite_file_per_worker(tmp_path) -> None:
+    # {pid}を含むpathならPoolのワーカーごとのファイルに書き込むので、ロックを待たずに全てのタスクが終わる
+    path = str(tmp_path / "simulation_{pid}.db")
+    results = run_sweep(base.main, [make_params(20)], 6, processes=2, storage=partial(SQLiteLogger, path, 1.0))
+    assert all(result.simulation_id is not None for result in results)
+    files = glob.glob(str(tmp_path / "simulation_*.db"))
+    assert 1 <= len(files) <= 2
+    assert sum(sqlite3.connect(file).execute("SELECT COUNT(*) FROM Simulations;").fetchone()[0] for file in files) == 6
+
+
+@pytest.mark.parametrize("shape", [(1000, 6), (1, 3), (5, 1), (0, 6)])
+def test_copy_text_matches_savetxt(shape: tuple[int, int]) -> None:
+    # DBLoggerのCOPYのバッファはnp.savetxtと同じ文字列になる
+    rows = np.random.default_rng(0).integers(-2**62, 2**62, size=shape)
+    buffer = io.StringIO()
+    np.savetxt(buffer, rows, fmt="%d", delimiter="\t")
+    assert copy_text(rows) == buffer.getvalue()
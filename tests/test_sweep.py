@@ -0,0 +1,67 @@
+# run_sweepが同じbase_seedなら複数プロセスでも同じ結果になり、複製ごとに別のシードを使うことの確認
+import os
+from functools import partial
+import base
+from base import Params
+from storage import SQLiteLogger
+from sweep import run_sweep, run_replicate, task_seed
+
+
+def make_params(num_nodes: int) -> Params:
+    return Params(num_nodes=num_nodes, optimal_route_length=4, volatility=0.99, pheromone_min=100,
+                  pheromone_max=2**20, ttl=100, bata=1, generation_limit=30, simulation_count=1)
+
+
+# base.mainで1回シミュレーションし、ant・interestの結果を返す
+# ワーカーごとのSQLiteファイルに書くのでSimulationIDやNodeIDは実行ごとに変わる。NodeIDはそのシミュレーションの最初のノードからの番号にする
+def simulate(params: Params, directory: str) -> tuple:
+    storage = partial(SQLiteLogger, os.path.join(directory, "simulation_{pid}.db"), 10.0)
+    simulation_id = base.main(params, storage=storage)
+    logger = storage()
+    logger.connect()
+    first_node = logger.fetch_result("SELECT MIN(NodeID) FROM Nodes WHERE SimulationID = %s;", (simulation_id,))[0][0]
+    result = tuple(tuple(logger.fetch_result(f"""SELECT generations.generation_count, {table}.SourceNodeID - %s, {table}.DestinationNodeID - %s,
+                                                        routes.RouteWidths, {table}.RouteBottleneck
+                                                 FROM {table}
+                                                 JOIN generations ON generations.GenerationID = {table}.GenerationID
+                                                 LEFT JOIN routes ON routes.RouteID = {table}.RouteID
+                                                 WHERE generations.SimulationID = %s
+                                                 ORDER BY generations.generation_count;""", (first_node, first_node, simulation_id)))
+                   for table in ["Ants", "Interests"])
+    logger.close()
+    return result
+
+
+def by_task(results) -> dict:
+    return {(result.index, result.replicate): (result.seed, result.simulation_id) for result in results}
+
+
+def test_same_base_seed_gives_same_results(tmp_path) -> None:
+    grid = [make_params(30), make_params(40)]
+    runs = []
+    for run in range(2):
+        directory = str(tmp_path / f"run{run}")
+        os.makedirs(directory)
+        runs.append(by_task(run_sweep(simulate, grid, 3, base_seed=7, processes=2, directory=directory)))
+    assert runs[0].keys() == {(index, replicate) for index in range(2) for replicate in range(3)}
+    # 終わる順やワーカーへの割り当てが変わっても、タスクごとのシードと結果は同じ
+    assert all(result is not None for _, result in runs[0].values())
+    assert runs[0] == runs[1]
+    # 複製ごとにシードが異なり、結果も1つに揃っていない
+    assert len({seed for seed, _ in runs[0].values()}) == 6
+    assert len({result for _, result in runs[0].values()}) > 1
+
+    # run_replicateで1つの複製だけを再実行しても同じ結果になる
+    directory = str(tmp_path / "replicate")
+    os.makedirs(directory)
+    result = run_replicate(simulate, grid, 1, 2, base_seed=7, directory=directory)
+    assert (result.seed, result.simulation_id) == runs[0][(1, 2)]
+
+
+def test_task_seed() -> None:
+    seeds = {task_seed(0, index, replicate) for index in range(10) for replicate in range(100)}
+    assert len(seeds) == 1000
+    assert task_seed(0, 1, 2) == task_seed(0, 1, 2)
+    assert task_seed(0, 1, 2) != task_seed(1, 1, 2)
+    # (index, replicate)を入れ替えても別のシードになる
+    assert task_seed(0, 1, 2) != task_seed(0, 2, 1)